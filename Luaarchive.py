@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+'''
+This script checks the lua files contained in zip and tar archives, without
+extracting them.
+
+    Usage:
+        python3 Luaarchive.py [-j N] [--timeout S] <archive> ...
+
+            Checks the .lua members of the archives: zip files and tar files,
+            compressed with gzip, bzip2 or xz or not. The members are read in
+            batches of about 64 MB and each batch is parsed in N processes
+            (the number of processors by default). Errors are reported as
+            <archive>!<member>:<line>: <message>. The exit status is 1 if
+            errors are found and 2 if an archive can not be read.
+
+    The contents are passed to the processes in shared memory, see
+    Luacache.parse_batch, so no temporary file is written.
+'''
+import sys
+import tarfile
+import zipfile
+import argparse
+
+import Luaparser
+import Luacache
+
+
+# Size in bytes of the contents read before a batch is parsed
+BATCH_BYTES = 64 * 1024 * 1024
+
+
+class ArchiveError(Exception):
+    '''
+    Raised when an archive can not be read.
+    '''
+    pass
+
+
+def members(path):
+    '''
+    Reads the lua files of an archive one after the other.
+        Arguments:
+            <path>      :   zip or tar file
+
+        Output:
+            Yields tuples (<member name>, <content as bytes>) in the order of
+            the archive. Raises ArchiveError if the file is not an archive or
+            can not be read.
+    '''
+    try:
+        if zipfile.is_zipfile(path):
+            with zipfile.ZipFile(path) as archive:
+                for _info in archive.infolist():
+                    if not _info.is_dir() and _info.filename.endswith('.lua'):
+                        yield _info.filename, archive.read(_info)
+            return
+        with tarfile.open(path, 'r:*') as archive:
+            for _info in archive:
+                if _info.isfile() and _info.name.endswith('.lua'):
+                    yield _info.name, archive.extractfile(_info).read()
+    except tarfile.ReadError:
+        raise ArchiveError("{0}: not a readable zip or tar archive".format(
+            path))
+    except (IOError, EOFError, zipfile.BadZipFile,
+            tarfile.TarError) as exception:
+        raise ArchiveError("{0}: {1}".format(path, exception))
+
+def batches(paths, size=BATCH_BYTES):
+    '''
+    Groups the lua files of several archives in batches.
+        Arguments:
+            <paths>     :   list of archives
+            <size>      :   BATCH_BYTES by default. A batch is complete when
+                            its contents reach this size
+
+        Output:
+            Yields lists of tuples (<name>, <content>), where <name> is
+            <archive>!<member>.
+    '''
+    batch = []
+    _bytes = 0
+    for path in paths:
+        for _member, _content in members(path):
+            batch.append(('{0}!{1}'.format(path, _member), _content))
+            _bytes += len(_content)
+            if _bytes >= size:
+                yield batch
+                batch = []
+                _bytes = 0
+    if batch:
+        yield batch
+
+def check(paths, jobs=None, size=BATCH_BYTES):
+    '''
+    Parses the lua files of several archives.
+        Arguments:
+            <paths>     :   list of archives
+            <jobs>      :   None by default. Number of processes, the number
+                            of processors if None
+            <size>      :   BATCH_BYTES by default. Size of the batches
+
+        Output:
+            Yields tuples (<name>, <result>) in the order of the archives,
+            where <result> is the ParseResult of the file or None if it can
+            not be lexed. Raises ArchiveError if an archive can not be read.
+    '''
+    for batch in batches(paths, size):
+        for (_name, _content), _data in zip(batch, Luacache.parse_batch(
+                [_content for _name, _content in batch], jobs)):
+            yield _name, None if _data is None else Luacache.loads(_data)
+
+def print_diagnostics(name, result):
+    '''
+    Prints the errors of a file, one per line.
+
+        Arguments:
+            name:       Name used for the leader, <archive>!<member>.
+            result:     ParseResult of the file, or None if it could not be
+                        lexed.
+
+        Output:
+            Prints to stdout.
+    '''
+    if result is None:
+        print("{0}: File could not be lexed.".format(name))
+        return
+    for _line, _token, _message in result.errors + (
+            [result.stopped] if result.stopped is not None else []):
+        print("{0}:{1}: {2}".format(name, _line, _message))
+
+##############################################################################
+
+def main(argv):
+    '''
+    Checks the archives from the command line.
+
+        Arguments:
+            argv:       Command line arguments without the program name.
+
+        Output:
+            Prints to stdout.
+    '''
+    arg_parser = argparse.ArgumentParser(
+        description="Checks the lua files of zip and tar archives.")
+    arg_parser.add_argument('archives', nargs='+', metavar='archive')
+    arg_parser.add_argument('-j', '--jobs', type=int, metavar='N',
+                            help="number of processes used to parse")
+    arg_parser.add_argument('--timeout', type=float, metavar='SECONDS',
+                            help="stop the parse of a file after SECONDS "
+                                 "seconds")
+    args = arg_parser.parse_args(argv)
+
+    Luaparser.set_budget(seconds=args.timeout)
+    checked = 0
+    failed = 0
+    try:
+        for name, result in check(args.archives, args.jobs):
+            checked += 1
+            if result is None or result.errors or result.stopped is not None:
+                print_diagnostics(name, result)
+                failed += 1
+    except ArchiveError as exception:
+        print("Archive could not be read: {0}".format(exception))
+        sys.exit(2)
+    print("{0} files checked, {1} with errors".format(checked, failed))
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+'''
+This script measures the throughput of the parser on a set of inputs, parsed
+one after the other and with parse_many in pools of threads. On an
+interpreter with a global interpreter lock the threads take turns, so their
+throughput should stay close to the sequential one. On a free-threaded
+build it should grow with the number of threads, up to the number of
+processors. With --processes the sources are also parsed in a pool of
+processes, passing them and their results through the pipes of the pool and
+through shared memory. With --lexer only the lexers are measured: shlex and
+the pre-scan, with and without NumPy.
+
+    Usage:
+        python3 Luabench.py [--threads N,...] [--processes N] [--lexer]
+                            [--repeat R] [--generate N] [--seed S] [path ...]
+
+            Parses the lua files found under the paths, or N generated
+            programs (100 by default) if no path is given, sequentially and
+            with each number of threads (1, 2 and 4 by default). The sources
+            are read before the measure. The best time of R runs (3 by
+            default) is used.
+'''
+import sys
+import os
+import time
+import random
+import platform
+import argparse
+
+import Luaparser
+import Luacache
+import Luadiff
+import Luascope
+
+
+def interpreter():
+    '''
+    Describes the interpreter: implementation, version, whether the global
+    interpreter lock is enabled and the number of processors.
+    '''
+    return "{0} {1}, {2}, {3} processors".format(
+        platform.python_implementation(), platform.python_version(),
+        "GIL enabled" if Luaparser.gil_enabled() else "free-threaded",
+        os.cpu_count())
+
+def load_sources(paths, generated=100, seed=0):
+    '''
+    Reads the lua files under <paths>, or generates programs if <paths> is
+    empty.
+        Arguments:
+            <paths>     :   files and directories
+            <generated> :   100 by default. Number of generated programs
+            <seed>      :   0 by default. Seed of the generator
+
+        Output:
+            Returns the list of sources as lists of lines.
+    '''
+    if not paths:
+        rng = random.Random(seed)
+        return [Luadiff.generate(rng, 40) for _index in range(generated)]
+    sources = []
+    for filename in Luascope.find_files(paths):
+        with open(filename, 'rt') as input_file:
+            sources.append(input_file.readlines())
+    return sources
+
+def sequential(sources):
+    '''
+    Parses the sources one after the other in the calling thread.
+    '''
+    for _source in sources:
+        try:
+            Luaparser.parse_isolated(_source)
+        except ValueError:
+            pass
+
+def measure(function, sources, repeat=3):
+    '''
+    Returns the best time of <repeat> calls of function(<sources>).
+    '''
+    best = None
+    for _run in range(repeat):
+        _start = time.perf_counter()
+        function(sources)
+        _seconds = time.perf_counter() - _start
+        best = _seconds if best is None else min(best, _seconds)
+    return best
+
+def benchmark(sources, threads=(1, 2, 4), repeat=3, processes=None):
+    '''
+    Measures the sequential parse and parse_many with each number of threads.
+        Arguments:
+            <sources>   :   list of sources as lists of lines
+            <threads>   :   (1, 2, 4) by default. Numbers of threads
+            <repeat>    :   3 by default. Runs of each measure
+            <processes> :   None by default. Number of processes of the
+                            measures of Luacache.parse_batch with each
+                            transport, not measured if None
+
+        Output:
+            Returns a list of tuples (<mode>, <seconds>), the sequential parse
+            first.
+    '''
+    # The parsers used by the threads are made before the measures.
+    Luaparser.parse_many(sources[:max(threads)], max(threads))
+    results = [('sequential', measure(sequential, sources, repeat))]
+    for _threads in threads:
+        results.append(('{0} threads'.format(_threads), measure(
+            lambda _sources: Luaparser.parse_many(_sources, _threads),
+            sources, repeat)))
+    if processes is not None:
+        contents = [''.join(_source).encode() for _source in sources]
+        for _mode, _shared in (('pickled', False), ('shared', True)):
+            results.append(('{0} {1}'.format(processes, _mode), measure(
+                lambda _contents: Luacache.parse_batch(_contents, processes,
+                                                       _shared),
+                contents, repeat)))
+    return results
+
+def lexers(sources, repeat=3):
+    '''
+    Measures the lexers on the lines of the sources: lex_line, which uses
+    shlex, and prescan without and with NumPy. The NumPy pre-scan is not
+    measured if NumPy is not installed.
+        Arguments:
+            <sources>   :   list of sources as lists of lines
+            <repeat>    :   3 by default. Runs of each measure
+
+        Output:
+            Returns a list of tuples (<lexer>, <seconds>), shlex first.
+    '''
+    # The lines with an unclosed quote are left out, as they stop the
+    # pre-scan.
+    lines = [_line for _source in sources for _line in _source
+             if _lexes(_line)]
+    results = [
+        ('shlex', measure(lambda _lines: [Luaparser.lex_line(_line)
+                                          for _line in _lines],
+                          lines, repeat)),
+        ('prescan', measure(lambda _lines: Luaparser.prescan(_lines, False),
+                            lines, repeat))]
+    if Luaparser.numpy is not None:
+        results.append(('numpy prescan', measure(Luaparser.prescan, lines,
+                                                 repeat)))
+    return results
+
+def _lexes(line):
+    '''
+    Returns true if lex_line can split <line>.
+    '''
+    try:
+        Luaparser.lex_line(line)
+    except ValueError:
+        return False
+    return True
+
+def print_results(sources, results):
+    '''
+    Prints the throughput of each mode and its speedup over the sequential
+    parse.
+
+        Arguments:
+            sources:    Sources parsed.
+            results:    List returned by benchmark.
+
+        Output:
+            Prints to stdout.
+    '''
+    _bytes = sum(len(_line.encode()) for _source in sources
+                 for _line in _source)
+    print("Interpreter: " + interpreter())
+    print("{0} inputs, {1:.2f} MB\n".format(len(sources), _bytes / 1e6))
+    for _mode, _seconds in results:
+        print("  {0:<14} {1:8.3f} s {2:10.1f} inputs/s {3:8.3f} MB/s "
+              "{4:6.2f}x".format(_mode, _seconds, len(sources) / _seconds,
+                                 _bytes / 1e6 / _seconds,
+                                 results[0][1] / _seconds))
+
+##############################################################################
+
+def main(argv):
+    '''
+    Runs the benchmark from the command line.
+
+        Arguments:
+            argv:       Command line arguments without the program name.
+
+        Output:
+            Prints to stdout.
+    '''
+    arg_parser = argparse.ArgumentParser(
+        description="Measures the throughput of the parser with threads.")
+    arg_parser.add_argument('paths', nargs='*', metavar='path')
+    arg_parser.add_argument('--threads', default='1,2,4', metavar='N,...',
+                            help="numbers of threads (default: 1,2,4)")
+    arg_parser.add_argument('--processes', type=int, metavar='N',
+                            help="also parse in N processes with each "
+                                 "transport")
+    arg_parser.add_argument('--lexer', action='store_true',
+                            help="only measure the lexers")
+    arg_parser.add_argument('--repeat', type=int, default=3, metavar='R',
+                            help="runs of each measure (default: 3)")
+    arg_parser.add_argument('--generate', type=int, default=100, metavar='N',
+                            help="number of generated programs used without "
+                                 "paths (default: 100)")
+    arg_parser.add_argument('--seed', type=int, default=0,
+                            help="seed of the generator (default: 0)")
+    args = arg_parser.parse_args(argv)
+
+    try:
+        threads = tuple(int(_n) for _n in args.threads.split(','))
+    except ValueError:
+        arg_parser.error("invalid list of threads: " + args.threads)
+    sources = load_sources(args.paths, args.generate, args.seed)
+    if not sources:
+        arg_parser.error("no lua files found")
+    if args.lexer:
+        print_results(sources, lexers(sources, args.repeat))
+        return
+    print_results(sources, benchmark(sources, threads, args.repeat,
+                                     args.processes))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,554 @@
+#!/usr/bin/env python3
+'''
+This script stores the results of a parse (errors, declared functions and the
+token table) in a compact binary file, so that they can be loaded again
+without parsing the file.
+
+    Usage:
+        python3 Luacache.py [--cache <directory>] <filename>
+
+            Prints the same output as Luaparser.py. The results are read from
+            the cache if the content of the file was already parsed by the
+            same version of the parser, and stored in the cache otherwise.
+            The cache is the .luacache directory by default.
+
+    Format (integers are unsigned and little endian):
+        header          magic 'LUAR', version (16 bit), flags (16 bit), the
+                        counts of strings, lines, tokens, errors, functions
+                        and function tokens (32 bit) and the stopped field,
+                        followed by the size in bytes (1, 2 or 4) of the
+                        integers of each of the seven arrays below, each
+                        array starting at a multiple of 4 bytes
+        stopped         line, token and message of budget_exceeded (32
+                        bit), or three times 0xffffffff
+        string offsets  <strings> + 1 offsets in the string data
+        line starts     <lines> + 1 offsets in the token ids
+        token ids       one string id per token
+        errors          line, token and message string id per error
+        function starts <functions> + 1 offsets in the function token ids
+        function tokens one string id per token of the declarations
+        positions       line, token and local flag per function
+        string data     UTF-8 encoded strings
+
+    Every string (token or message) is stored once. The arrays are read in
+    place through memoryview, and strings are only decoded when accessed.
+'''
+import sys
+import os
+import io
+import array
+import hashlib
+import inspect
+import marshal
+import mmap
+import struct
+import argparse
+import concurrent.futures
+from multiprocessing import shared_memory
+
+import Luaparser
+
+
+MAGIC = b'LUAR'
+VERSION = 1
+FLAG_TOKENS = 1
+
+_header = struct.Struct('<4sHH6I3I7B')
+_NONE = 0xffffffff
+_typecodes = {1: 'B', 2: 'H', 4: 'I'}
+
+# Hash of the source of the parser, see parser_digest
+_parser_digest = None
+
+
+class ParseResult:
+    '''
+    Results of a parse.
+        errors:             list of [<line>, <token>, <message>]
+        functions:          list of the token lists of the declared functions
+        function_positions: list of [<line>, <token>, <local>]
+        stopped:            budget_exceeded of the parse or None
+        tokens:             token table indexed by line, or None
+    '''
+
+    def __init__(self, errors, functions, function_positions, stopped=None,
+                 tokens=None):
+        self.errors = errors
+        self.functions = functions
+        self.function_positions = function_positions
+        self.stopped = stopped
+        self.tokens = tokens
+
+
+class TokenTable:
+    '''
+    Read only token table of a loaded result. It is indexed like
+    Luaparser.token_list and decodes the tokens of a line when accessed.
+    '''
+
+    def __init__(self, strings, line_starts, token_ids):
+        self._strings = strings
+        self._line_starts = line_starts
+        self._token_ids = token_ids
+
+    def __len__(self):
+        return len(self._line_starts) - 1
+
+    def count(self):
+        '''
+        Returns the number of tokens without decoding them.
+        '''
+        return len(self._token_ids)
+
+    def __getitem__(self, line):
+        if line < 0:
+            line += len(self)
+        if not 0 <= line < len(self):
+            raise IndexError("Line {0} out of range.".format(line))
+        _string = self._strings.get
+        return [_string(_id) for _id in
+                self._token_ids[self._line_starts[line]:
+                                self._line_starts[line + 1]]]
+
+
+class StringTable:
+    '''
+    Strings of a loaded result, decoded on first access.
+    '''
+
+    def __init__(self, offsets, data):
+        self._offsets = offsets
+        self._data = data
+        self._cache = {}
+
+    def get(self, index):
+        _string = self._cache.get(index)
+        if _string is None:
+            _string = str(self._data[self._offsets[index]:
+                                     self._offsets[index + 1]], 'utf-8')
+            self._cache[index] = _string
+        return _string
+
+
+def capture():
+    '''
+    Returns the results of the last parse made by Luaparser as a ParseResult.
+    '''
+    return ParseResult([_e[:3] for _e in Luaparser.error_list],
+                       Luaparser.function_list,
+                       Luaparser.function_position_list,
+                       Luaparser.budget_exceeded, Luaparser.token_list)
+
+def dumps(result, tokens=True):
+    '''
+    Serializes a ParseResult.
+        Arguments:
+            <result>    :   ParseResult to serialize
+            <tokens>    :   True by default. If False, the token table is
+                            not stored
+
+        Output:
+            Returns the binary representation as bytes.
+    '''
+    strings = {}
+    _intern = strings.setdefault
+
+    def _id(string):
+        return _intern(string, len(strings))
+
+    line_starts = array.array('I', [0])
+    token_ids = array.array('I')
+    if tokens and result.tokens is not None:
+        for _line in result.tokens:
+            token_ids.extend(_id(_token) for _token in _line)
+            line_starts.append(len(token_ids))
+    errors = array.array('I')
+    for _line, _token, _message in (_e[:3] for _e in result.errors):
+        errors.extend((_line, _token, _id(_message)))
+    function_starts = array.array('I', [0])
+    function_tokens = array.array('I')
+    for _tokens in result.functions:
+        function_tokens.extend(_id(_token) for _token in _tokens)
+        function_starts.append(len(function_tokens))
+    positions = array.array('I')
+    for _line, _token, _local in result.function_positions:
+        positions.extend((_line, _token, int(_local)))
+    stopped = (_NONE, _NONE, _NONE)
+    if result.stopped is not None:
+        stopped = (result.stopped[0], result.stopped[1],
+                   _id(result.stopped[2]))
+
+    data = bytearray()
+    offsets = array.array('I', [0])
+    for _string in strings:
+        data += _string.encode('utf-8')
+        offsets.append(len(data))
+
+    # Each array is stored with the smallest integer size holding its
+    # values.
+    arrays = [_narrow(_array) for _array in
+              (offsets, line_starts, token_ids, errors, function_starts,
+               function_tokens, positions)]
+    _flags = FLAG_TOKENS if len(line_starts) > 1 else 0
+    parts = [_header.pack(MAGIC, VERSION, _flags, len(strings),
+                          len(line_starts) - 1, len(token_ids),
+                          len(errors) // 3, len(result.functions),
+                          len(function_tokens), *stopped,
+                          *(_array.itemsize for _array in arrays))]
+    _size = _header.size
+    for _array in arrays:
+        parts.append(bytes(-_size % 4))
+        _size += -_size % 4
+        if sys.byteorder == 'big':
+            _array.byteswap()
+        parts.append(_array.tobytes())
+        _size += len(parts[-1])
+    parts.append(bytes(data))
+    return b''.join(parts)
+
+def _narrow(values):
+    '''
+    Returns an array of 32 bit integers as an array of the smallest unsigned
+    type holding its values.
+    '''
+    _maximum = max(values, default=0)
+    for _typecode in ('B', 'H'):
+        if _maximum < 1 << (8 * array.array(_typecode).itemsize):
+            return array.array(_typecode, values)
+    return values
+
+def loads(data):
+    '''
+    Loads a serialized ParseResult. The arrays and strings are not copied:
+    they are read through memoryviews of <data> when accessed.
+        Arguments:
+            <data>      :   bytes, bytearray, mmap or memoryview
+
+        Output:
+            Returns the ParseResult. Raises ValueError if <data> is not a
+            result of this version.
+    '''
+    view = memoryview(data)
+    if len(view) < _header.size:
+        raise ValueError("Truncated parse result.")
+    _fields = _header.unpack_from(view)
+    (_magic, _version, _flags, n_strings, n_lines, n_tokens, n_errors,
+     n_functions, n_function_tokens) = _fields[:9]
+    stopped = _fields[9:12]
+    if _magic != MAGIC or _version != VERSION:
+        raise ValueError("Not a parse result of version {0}.".format(VERSION))
+
+    offset = _header.size
+    arrays = []
+    for _count, _width in zip((n_strings + 1, n_lines + 1, n_tokens,
+                               n_errors * 3, n_functions + 1,
+                               n_function_tokens, n_functions * 3),
+                              _fields[12:]):
+        if _width not in _typecodes:
+            raise ValueError("Invalid parse result.")
+        offset += -offset % 4
+        _end = offset + _width * _count
+        if _end > len(view):
+            raise ValueError("Truncated parse result.")
+        arrays.append(_unsigned(view[offset:_end], _typecodes[_width]))
+        offset = _end
+    (offsets, line_starts, token_ids, errors, function_starts,
+     function_tokens, positions) = arrays
+    strings = StringTable(offsets, view[offset:])
+
+    _string = strings.get
+    result = ParseResult(
+        [[errors[_i], errors[_i + 1], _string(errors[_i + 2])]
+         for _i in range(0, len(errors), 3)],
+        [[_string(_id) for _id in
+          function_tokens[function_starts[_i]:function_starts[_i + 1]]]
+         for _i in range(n_functions)],
+        [[positions[_i], positions[_i + 1], bool(positions[_i + 2])]
+         for _i in range(0, len(positions), 3)])
+    if stopped[0] != _NONE:
+        result.stopped = [stopped[0], stopped[1], _string(stopped[2])]
+    if _flags & FLAG_TOKENS:
+        result.tokens = TokenTable(strings, line_starts, token_ids)
+    return result
+
+def _unsigned(view, typecode):
+    '''
+    Returns a byte memoryview as a sequence of unsigned integers of type
+    <typecode>, without copying it on little endian machines.
+    '''
+    if sys.byteorder == 'big':
+        _array = array.array(typecode)
+        _array.frombytes(view)
+        _array.byteswap()
+        return _array
+    return view.cast(typecode)
+
+def dump(result, path, tokens=True):
+    '''
+    Writes a serialized ParseResult to <path>, replacing it atomically.
+    '''
+    _temp = '{0}.{1}.tmp'.format(path, os.getpid())
+    with open(_temp, 'wb') as output_file:
+        output_file.write(dumps(result, tokens))
+    os.replace(_temp, path)
+
+def load(path):
+    '''
+    Loads a ParseResult written by dump. The file is mapped in memory rather
+    than read, so only the parts which are accessed are loaded.
+    '''
+    with open(path, 'rb') as input_file:
+        if os.fstat(input_file.fileno()).st_size == 0:
+            raise ValueError("Truncated parse result.")
+        return loads(mmap.mmap(input_file.fileno(), 0,
+                               access=mmap.ACCESS_READ))
+
+##############################################################################
+# Shared memory transport
+
+# Batches of sources are parsed in worker processes without pickling them:
+# the parent copies the sources into one shared memory segment and each
+# worker returns its serialized result in a segment it creates. Only the
+# names, offsets and sizes of the segments cross the pipes of the pool.
+
+# Segment of sources attached by a worker process
+_attached = [None]
+
+def parse_batch(contents, jobs=None, shared=True):
+    '''
+    Parses the contents of several files in a pool of processes.
+        Arguments:
+            <contents>  :   list of contents as bytes
+            <jobs>      :   None by default. Number of processes, the number
+                            of processors if None
+            <shared>    :   True by default. If False, the contents and the
+                            results are pickled through the pipes of the
+                            pool instead of being passed in shared memory
+
+        Output:
+            Returns the list of serialized ParseResult of the contents, None
+            for a content which can not be lexed. The work budget of the
+            calling process is used.
+    '''
+    budget = Luaparser.get_budget()
+    if not shared:
+        with concurrent.futures.ProcessPoolExecutor(jobs) as pool:
+            return list(pool.map(_parse_pickled, [(_content, budget)
+                                                  for _content in contents]))
+
+    # The segment is created before the pool, so that the workers use the
+    # resource tracker of the parent.
+    memory = shared_memory.SharedMemory(
+        create=True, size=max(1, sum(len(_c) for _c in contents)))
+    try:
+        descriptors = []
+        offset = 0
+        for _content in contents:
+            memory.buf[offset:offset + len(_content)] = _content
+            descriptors.append((memory.name, offset, len(_content), budget))
+            offset += len(_content)
+        with concurrent.futures.ProcessPoolExecutor(jobs) as pool:
+            return [_receive(_descriptor) for _descriptor in
+                    pool.map(_parse_shared, descriptors)]
+    finally:
+        memory.close()
+        memory.unlink()
+
+def _parse_shared(descriptor):
+    '''
+    Parses a content placed in shared memory. This is run in the worker
+    processes.
+        Arguments:
+            <descriptor>    :   tuple (<segment name>, <offset>, <size>,
+                                <work budget>)
+
+        Output:
+            Returns a tuple (<segment name>, <size>) locating the serialized
+            ParseResult, or None if the content can not be lexed.
+    '''
+    name, offset, size, budget = descriptor
+    if _attached[0] is None or _attached[0].name != name:
+        if _attached[0] is not None:
+            _attached[0].close()
+        _attached[0] = shared_memory.SharedMemory(name)
+    Luaparser.set_budget(*budget)
+    try:
+        data = dumps(parse_content(_attached[0].buf[offset:offset + size]))
+    except ValueError:
+        return None
+    memory = shared_memory.SharedMemory(create=True, size=len(data))
+    memory.buf[:len(data)] = data
+    memory.close()
+    return memory.name, len(data)
+
+def _receive(descriptor):
+    '''
+    Returns the serialized ParseResult located by <descriptor> as bytes and
+    releases its segment.
+    '''
+    if descriptor is None:
+        return None
+    memory = shared_memory.SharedMemory(descriptor[0])
+    try:
+        return bytes(memory.buf[:descriptor[1]])
+    finally:
+        memory.close()
+        memory.unlink()
+
+def _parse_pickled(blob):
+    '''
+    Parses a content passed through the pipe of the pool. This is run in the
+    worker processes.
+        Arguments:
+            <blob>      :   tuple (<content>, <work budget>)
+
+        Output:
+            Returns the serialized ParseResult, or None if the content can
+            not be lexed.
+    '''
+    content, budget = blob
+    Luaparser.set_budget(*budget)
+    try:
+        return dumps(parse_content(content))
+    except ValueError:
+        return None
+
+##############################################################################
+# Cache of parse results
+
+def parse_cached(filename, cache='.luacache'):
+    '''
+    Returns the results of the parse of a file, from the cache if the same
+    content was already parsed. The cache is keyed on the content of the
+    file, the format version, the work budget and the source of the parser.
+    The results of parses stopped by the budget are not cached: a time limit
+    or a cancellation does not stop the parse at the same point every time.
+        Arguments:
+            <filename>  :   file to be parsed
+            <cache>     :   '.luacache' by default. Directory of the cache
+
+        Output:
+            Returns the ParseResult. Raises IOError if the file can not be
+            read and ValueError if it can not be lexed.
+    '''
+    with open(filename, 'rb') as input_file:
+        content = input_file.read()
+    path = cache_path(cache, content)
+    try:
+        return load(path)
+    except (IOError, ValueError):
+        pass
+
+    result = parse_content(content)
+    if result.stopped is None:
+        os.makedirs(cache, exist_ok=True)
+        dump(result, path)
+    return result
+
+def cache_path(cache, key):
+    '''
+    Returns the path of the cached result for <key> (bytes identifying the
+    content, such as the content itself) in the directory <cache>. The path
+    also depends on the format version, the work budget and the source of
+    the parser, so that results are parsed again when the parser changes.
+    '''
+    digest = hashlib.sha1(key)
+    digest.update(repr((VERSION, Luaparser.get_budget(),
+                        parser_digest())).encode())
+    return os.path.join(cache, digest.hexdigest() + '.bin')
+
+def parser_digest():
+    '''
+    Returns the SHA-1 of the source of Luaparser as a hexadecimal string,
+    computed once. The source is asked to the loader of the module, so it is
+    also found in a zipapp. When it has none, as in a frozen build, the code
+    of the functions of the parser is hashed instead.
+    '''
+    global _parser_digest
+    if _parser_digest is None:
+        try:
+            _source = inspect.getsource(Luaparser).encode()
+        except (OSError, TypeError):
+            _functions = dict(vars(Luaparser), **vars(Luaparser.Parser))
+            _source = b''.join(marshal.dumps(_functions[_name].__code__)
+                               for _name in sorted(_functions)
+                               if inspect.isfunction(_functions[_name]))
+        _parser_digest = hashlib.sha1(_source).hexdigest()
+    return _parser_digest
+
+def parse_content(content):
+    '''
+    Parses the content of a file like Luaparser.parse, without printing.
+        Arguments:
+            <content>   :   content of the file as bytes or memoryview
+
+        Output:
+            Returns the ParseResult. Raises ValueError if the content can not
+            be lexed.
+    '''
+    Luaparser.reset()
+    Luaparser._line_list.extend(io.TextIOWrapper(io.BytesIO(content),
+                                                 errors='replace'))
+    try:
+        if Luaparser.check_data(''.join(Luaparser._line_list)):
+            return ParseResult([], [], [])
+        Luaparser.lex()
+        Luaparser.parse_input()
+        return capture()
+    finally:
+        Luaparser.reset()
+
+def print_result(filename, result):
+    '''
+    Prints a ParseResult in the same way as Luaparser.parse.
+
+        Arguments:
+            filename:   File name used for the error leader.
+            result:     ParseResult with its token table.
+
+        Output:
+            Prints to stdout.
+    '''
+    if result.stopped is not None:
+        print("Parse stopped\n")
+    elif not result.errors:
+        print("No errors found\n")
+    else:
+        print("Errors found\n")
+    for _error in result.errors + ([result.stopped] if result.stopped
+                                   else []):
+        Luaparser.print_error(filename, _error + [result.tokens[_error[0]]])
+    if not result.errors and result.stopped is None:
+        print("Declared functions:")
+        for _tokens in result.functions:
+            print("  {0}".format(''.join(_tokens)))
+
+##############################################################################
+
+def main(argv):
+    '''
+    Runs the cached parser from the command line.
+
+        Arguments:
+            argv:       Command line arguments without the program name.
+
+        Output:
+            Prints to stdout.
+    '''
+    arg_parser = argparse.ArgumentParser(
+        description="Checks lua source files, caching the results.")
+    arg_parser.add_argument('filename', help="file to be parsed")
+    arg_parser.add_argument('--cache', default='.luacache',
+                            metavar='DIRECTORY',
+                            help="cache directory (default: .luacache)")
+    args = arg_parser.parse_args(argv)
+
+    try:
+        result = parse_cached(args.filename, args.cache)
+    except IOError:
+        print("File not found.")
+        sys.exit(1)
+    print_result(args.filename, result)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
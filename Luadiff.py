@@ -0,0 +1,891 @@
+#!/usr/bin/env python3
+'''
+This script runs the backtracking parser and alternative engines on the same
+inputs and reports every difference in the errors and declared functions
+they find. The inputs are lua files, randomly generated programs and
+mutations of both. The inputs showing a difference are shrunk to a minimal
+case and the speedup of each engine over the backtracking parser is recorded
+for each input.
+
+    Usage:
+        python3 Luadiff.py [--engine E ...] [--generate N] [--mutate N]
+                           [--seed S] [--no-shrink] [--output <dir>]
+                           [--timings <file>] [--timeout S] [-v] [path ...]
+
+            Compares the engines (all by default) on the lua files found
+            under the paths, on N generated programs and on N mutated
+            inputs. The failing and shrunk inputs are written to <dir>, the
+            parse times of each input to <file> as CSV. The exit status is 1
+            if a difference is found.
+
+    Engines and the results they must reproduce:
+        stream      parse_stream            errors, functions and budget stop
+        parallel    parse_lines_parallel    errors, functions and budget stop
+        ll1         Luallparser             whether the input has errors, and
+                                            the functions of inputs without
+                                            errors (it stops at its first
+                                            error, with its own messages)
+        outline     outline                 the functions of inputs without
+                                            errors
+        quick       quick_check             no 'fail' for an input without
+                                            errors ('pass' only means the
+                                            screen found nothing)
+        data        check_data              no accepted input with errors or
+                                            functions
+
+    Inputs the backtracking parser stops on because of the work budget are
+    skipped.
+'''
+import sys
+import os
+import math
+import random
+import tempfile
+import argparse
+import time
+
+import Luaparser
+import Luallparser
+import Luaminify
+import Luascope
+
+
+# Names of the inputs, parse times and results are compared to those of the
+# reference, the backtracking parser.
+REFERENCE = 'backtracking'
+
+# Most tests run by the shrinking of one input, and token visits allowed to
+# the reference on a shrunk input, as a multiple of those of the input.
+SHRINK_TESTS = 2000
+SHRINK_WORK = 4
+
+# Openers of the spans removed by the shrinking and their closers
+_span_closers = {'(': ')', '[': ']', '{': '}', 'function': 'end',
+                 'do': 'end', 'if': 'end', 'repeat': 'until'}
+
+
+##############################################################################
+# Engines
+
+def run_backtracking(lines):
+    '''
+    Parses lines with the backtracking parser.
+        Arguments:
+            <lines>     :   lines of source code
+
+        Output:
+            Returns a dictionary with the keys 'errors' (list of [<line>,
+            <token>, <message>]), 'functions' (list of the declarations
+            joined into strings, as printed by print_functions) and
+            'stopped' (budget stop as an error, or None), or None if the
+            lines can not be lexed. The other engines return the keys their
+            contract compares.
+    '''
+    Luaparser.reset()
+    Luaparser._line_list.extend(lines)
+    try:
+        Luaparser.lex()
+    except ValueError:
+        Luaparser.reset()
+        return None
+    Luaparser.parse_input()
+    result = {'errors': [_error[:3] for _error in Luaparser.error_list],
+              'functions': [''.join(_f) for _f in Luaparser.function_list],
+              'stopped': Luaparser.budget_exceeded and
+              Luaparser.budget_exceeded[:3]}
+    Luaparser.reset()
+    return result
+
+def run_stream(lines):
+    '''
+    Parses lines with parse_stream, from a temporary file.
+    '''
+    with tempfile.NamedTemporaryFile('wt', suffix='.lua',
+                                     delete=False) as output_file:
+        output_file.writelines(lines)
+    result = {'errors': [], 'functions': [], 'stopped': None}
+    try:
+        for _kind, _item in Luaparser.parse_stream(output_file.name):
+            if _kind == 'error':
+                result['errors'].append(_item[:3])
+            elif _kind == 'function':
+                result['functions'].append(''.join(_item))
+            else:
+                result['stopped'] = _item[:3]
+    except ValueError:
+        Luaparser.reset()
+        return None
+    finally:
+        os.remove(output_file.name)
+    return result
+
+def run_parallel(lines):
+    '''
+    Parses lines with parse_lines_parallel in two processes.
+    '''
+    Luaparser.reset()
+    try:
+        errors, functions, stopped = Luaparser.parse_lines_parallel(lines, 2)
+    except ValueError:
+        return None
+    finally:
+        Luaparser.reset()
+    return {'errors': [_error[:3] for _error in errors],
+            'functions': [''.join(_f) for _f in functions],
+            'stopped': stopped and stopped[:3]}
+
+def run_ll1(lines):
+    '''
+    Parses lines with the table driven parser.
+    '''
+    Luaparser.reset()
+    Luaparser._line_list.extend(lines)
+    try:
+        Luaparser.lex()
+    except ValueError:
+        Luaparser.reset()
+        return None
+    errors, functions = Luallparser.parse_tokens(Luaparser.token_list,
+                                                 lines)
+    Luaparser.reset()
+    return {'errors': errors,
+            'functions': [''.join(_f) for _f in functions]}
+
+def run_outline(lines):
+    '''
+    Lists the declared functions with outline.
+    '''
+    return {'functions': [''.join(_entry[0])
+                          for _entry in Luaparser.outline(lines)]}
+
+def run_quick(lines):
+    '''
+    Screens lines with quick_check. 'valid' is False if the screen fails the
+    input and None otherwise, as a 'pass' does not vouch for the input.
+    '''
+    Luaparser.reset()
+    Luaparser._line_list.extend(lines)
+    verdict, _notes = Luaparser.quick_check()
+    Luaparser.reset()
+    return {'valid': False if verdict == 'fail' else None}
+
+def run_data(lines):
+    '''
+    Checks lines with the fast path for data files. 'valid' is None if the
+    fast path gives up.
+    '''
+    return {'valid': True if Luaparser.check_data(''.join(lines)) else None}
+
+# Engines compared with the reference: name -> (run function, contract). A
+# run function takes the lines of an input and returns the keys of the
+# result of run_backtracking its contract compares. Contracts:
+#   'exact'     errors, functions and budget stop are equal
+#   'valid'     the inputs with errors are the same, and the functions of
+#               the inputs without errors are equal
+#   'functions' the functions of the inputs without errors are equal, in
+#               any order (outline lists them in source order, the parsers
+#               as their body ends)
+#   'verdict'   'valid' is None if the engine can not tell, True only for
+#               inputs without errors and functions, False only for inputs
+#               with errors
+engines = {
+    'stream': (run_stream, 'exact'),
+    'parallel': (run_parallel, 'exact'),
+    'll1': (run_ll1, 'valid'),
+    'outline': (run_outline, 'functions'),
+    'quick': (run_quick, 'verdict'),
+    'data': (run_data, 'verdict'),
+}
+
+def register(name, run, contract='exact'):
+    '''
+    Adds an engine to the comparison.
+        Arguments:
+            <name>      :   name of the engine
+            <run>       :   function parsing a list of lines, see engines
+            <contract>  :   'exact' by default. Results compared, see engines
+
+        Output:
+            None
+    '''
+    engines[name] = (run, contract)
+
+def compare(reference, result, contract):
+    '''
+    Compares the result of an engine with the one of the reference.
+        Arguments:
+            <reference> :   result of run_backtracking
+            <result>    :   result of the engine
+            <contract>  :   contract of the engine, see engines
+
+        Output:
+            Returns a list of differences as tuples (<category>, <message>).
+    '''
+    if reference is None or result is None:
+        if contract == 'exact' and (reference is None) != (result is None):
+            return [('lexing', "{0} could not be lexed.".format(
+                "The input" if result is None else "Only the reference"))]
+        return []
+    valid = not reference['errors']
+    differences = []
+    if contract == 'exact':
+        if result['errors'] != reference['errors']:
+            differences.append(('errors', _first_difference(
+                reference['errors'], result['errors'])))
+        if result['functions'] != reference['functions']:
+            differences.append(('functions', _first_difference(
+                reference['functions'], result['functions'])))
+        if result['stopped'] != reference['stopped']:
+            differences.append(('stopped', "Budget stop {0} instead of "
+                                "{1}.".format(result['stopped'],
+                                              reference['stopped'])))
+    elif contract == 'valid' and valid == bool(result['errors']):
+        differences.append(('validity', "{0} while the reference {1}.".format(
+            _describe_errors(result['errors']), "finds none" if valid else
+            "finds " + _describe_errors(reference['errors']))))
+    elif contract == 'valid' and valid and \
+            result['functions'] != reference['functions']:
+        differences.append(('functions', _first_difference(
+            reference['functions'], result['functions'])))
+    elif contract == 'functions' and valid and \
+            sorted(result['functions']) != sorted(reference['functions']):
+        differences.append(('functions', _first_difference(
+            sorted(reference['functions']), sorted(result['functions']))))
+    elif contract == 'verdict' and (
+            result['valid'] is False and valid or
+            result['valid'] is True and (not valid or reference['functions'])):
+        differences.append(('accepted' if result['valid'] else 'rejected',
+                            "Input {0} while the reference finds {1}.".format(
+                                'accepted' if result['valid'] else 'rejected',
+                                _describe_errors(reference['errors']) if
+                                reference['errors'] else "no errors")))
+    return differences
+
+def _first_difference(expected, found):
+    '''
+    Describes the first item of two lists which differ.
+    '''
+    for _index in range(max(len(expected), len(found))):
+        _expected = expected[_index] if _index < len(expected) else None
+        _found = found[_index] if _index < len(found) else None
+        if _expected != _found:
+            return "Item {0}: {1} instead of {2}.".format(
+                _index + 1, _describe(_found), _describe(_expected))
+    return "Same items in another order."
+
+def _describe(item):
+    '''
+    Formats an error or a declaration for a message.
+    '''
+    if item is None:
+        return "nothing"
+    if isinstance(item, str):
+        return "'{0}'".format(item)
+    return "line {0} token {1} '{2}'".format(*item)
+
+def _describe_errors(errors):
+    '''
+    Formats the first error of a list and their number for a message.
+    '''
+    if not errors:
+        return "No errors"
+    return "{0} errors from {1}".format(len(errors), _describe(errors[0]))
+
+
+##############################################################################
+# Comparison of inputs
+
+def check_input(lines, names):
+    '''
+    Runs the reference and the engines on an input.
+        Arguments:
+            <lines>     :   lines of source code
+            <names>     :   names of the engines
+
+        Output:
+            Returns a tuple (<differences>, <seconds>): the list of
+            (<engine>, <category>, <message>), empty if the results agree,
+            and a dictionary from engine name (and REFERENCE) to parse time.
+            Returns (None, <seconds>) if the reference exceeds the work
+            budget.
+    '''
+    _start = time.perf_counter()
+    reference = run_backtracking(lines)
+    seconds = {REFERENCE: time.perf_counter() - _start}
+    if reference is not None and reference['stopped'] is not None:
+        return None, seconds
+    differences = []
+    for _name in names:
+        _run, _contract = engines[_name]
+        _start = time.perf_counter()
+        _result = _run(lines)
+        seconds[_name] = time.perf_counter() - _start
+        differences += [(_name,) + _difference for _difference in
+                        compare(reference, _result, _contract)]
+    return differences, seconds
+
+def shrink(lines, name, category, limit=SHRINK_TESTS):
+    '''
+    Shrinks an input on which an engine differs from the reference, first by
+    removing lines, then by removing tokens.
+        Arguments:
+            <lines>     :   lines of the failing input
+            <name>      :   name of the engine
+            <category>  :   category of the difference which must be kept
+            <limit>     :   SHRINK_TESTS by default. Most tests run
+
+        Output:
+            Returns the lines of the smallest input found which still shows a
+            difference of <category>.
+    '''
+    _run, _contract = engines[name]
+    _tests = [limit]
+
+    def _fails(candidate):
+        _tests[0] -= 1
+        reference = run_backtracking(candidate)
+        if reference is not None and reference['stopped'] is not None:
+            return False
+        return any(_category == category for _category, _message in
+                   compare(reference, _run(candidate), _contract))
+
+    # Removing lines often unbalances blocks, on which the backtracking
+    # parser can take exponential time. Candidates needing much more work
+    # than the input are given up.
+    budget = Luaparser.get_budget()
+    run_backtracking(lines)
+    Luaparser.set_budget(SHRINK_WORK * Luaparser.get_work()[0] + 10000,
+                         *budget[1:])
+    _fails_tokens = lambda _part: _fails(render(_part))
+    _size = None
+    try:
+        lines = ddmin(list(lines), _fails, _tests)
+        try:
+            tokens = list(Luaminify.tokenize(lines))
+        except ValueError:
+            return lines
+        if not _fails(render(tokens)):
+            return lines
+
+        # Each pass can unlock removals for the others, so they are repeated
+        # until the input stops shrinking.
+        while _size is None or len(tokens) < _size:
+            _size = len(tokens)
+            tokens = remove_spans(tokens, _fails_tokens, _tests)
+            tokens = ddmin(tokens, _fails_tokens, _tests)
+            tokens = list(Luaminify.tokenize(ddmin(render(tokens), _fails,
+                                                   _tests)))
+        return render(tokens)
+    finally:
+        Luaparser.set_budget(*budget)
+
+def ddmin(items, fails, tests):
+    '''
+    Removes chunks of a list as long as the rest still fails, with chunks
+    halved when no chunk can be removed.
+        Arguments:
+            <items>     :   list to shrink, which fails
+            <fails>     :   function returning true if a list still fails
+            <tests>     :   one element list holding the number of tests left,
+                            decreased by <fails>
+
+        Output:
+            Returns the shrunk list.
+    '''
+    parts = 2
+    while len(items) >= 2 and tests[0] > 0:
+        _size = -(-len(items) // parts)
+        for _start in range(0, len(items), _size):
+            _candidate = items[:_start] + items[_start + _size:]
+            if tests[0] <= 0:
+                return items
+            if fails(_candidate):
+                items = _candidate
+                parts = max(parts - 1, 2)
+                break
+        else:
+            if parts >= len(items):
+                break
+            parts = min(len(items), parts * 2)
+    return items
+
+def remove_spans(tokens, fails, tests):
+    '''
+    Removes balanced spans of tokens, from an opening bracket or keyword to
+    its closer, as long as the rest still fails. A span which is removed
+    whole keeps the blocks around it balanced, which ddmin rarely manages.
+    Blocks are also unwrapped: their head up to 'then' or 'do' and their
+    'end' are removed and their body is kept.
+        Arguments:
+            <tokens>    :   tokens of Luaminify.tokenize, which fail
+            <fails>     :   function returning true if tokens still fail
+            <tests>     :   one element list holding the number of tests left
+
+        Output:
+            Returns the remaining tokens.
+    '''
+    _removed = True
+    while _removed and tests[0] > 0:
+        _removed = False
+        for _start, _end in sorted(balanced_spans(tokens),
+                                   key=lambda _span: _span[0] - _span[1]):
+            if tests[0] <= 0:
+                break
+            _candidates = [tokens[:_start] + tokens[_end + 1:]]
+            _body = next((_index for _index in range(_start, _end)
+                          if tokens[_index][2] in ('then', 'do')), None)
+            if tokens[_end][2] == 'end' and _body is not None:
+                _candidates.append(tokens[:_start] +
+                                   tokens[_body + 1:_end] +
+                                   tokens[_end + 1:])
+            for _candidate in _candidates:
+                if tests[0] > 0 and fails(_candidate):
+                    tokens = _candidate
+                    _removed = True
+                    break
+            if _removed:
+                break
+    return tokens
+
+def balanced_spans(tokens):
+    '''
+    Returns the pairs (<first>, <last>) of the indexes of the openers of a
+    token list and of their closers. A 'for' or 'while' span starts at the
+    keyword and ends at the 'end' of its 'do', a 'repeat' span ends with the
+    line of its 'until', which usually holds the condition.
+    '''
+    spans = []
+    _stack = []
+    _loop = None
+    for _index, (_line, _kind, _text) in enumerate(tokens):
+        if _text in ('for', 'while') and _kind == 'keyword':
+            _loop = _index
+        elif _text in _span_closers and _kind in ('keyword', 'op'):
+            if _text == 'do' and _loop is not None:
+                _stack.append((_loop, 'end'))
+                _loop = None
+            else:
+                _stack.append((_index, _span_closers[_text]))
+        elif _stack and _text == _stack[-1][1]:
+            _end = _index
+            if _text == 'until':
+                while _end + 1 < len(tokens) and \
+                        tokens[_end + 1][0] == _line:
+                    _end += 1
+            spans.append((_stack.pop()[0], _end))
+    return spans
+
+def render(tokens):
+    '''
+    Joins tokens of Luaminify.tokenize into lines, one line per line of the
+    tokens.
+    '''
+    lines = []
+    _current = None
+    for _line, _kind, _text in tokens:
+        if _line != _current:
+            lines.append([])
+            _current = _line
+        lines[-1].append(_text)
+    return [' '.join(_line) + '\n' for _line in lines]
+
+
+##############################################################################
+# Generated and mutated inputs
+
+_generated_names = ('a', 'b', 'c', 'x', 'y', 't', 'm', 'self')
+_binary = ('+', '-', '*', '/', '%', '^', '..', '==', '~=', '<', '<=', '>',
+           '>=', 'and', 'or')
+_unary = ('-', 'not ', '#')
+_fragments = ('end', '(', ')', '[', ']', '{', '}', '=', ',', '.', ':', ';',
+              'function', 'local', 'then', 'do', 'return', 'if', 'x', '1',
+              '"s"', '..', 'else')
+
+def generate(rng, statements=12):
+    '''
+    Generates a random lua program.
+        Arguments:
+            <rng>           :   random.Random instance
+            <statements>    :   12 by default. Number of top level
+                                statements
+
+        Output:
+            Returns the lines of the program.
+    '''
+    lines = []
+    for _index in range(statements):
+        _statement(rng, lines, 0, False)
+    if rng.random() < 0.3:
+        lines.append('return ' + _expression(rng, 0) + '\n')
+    return lines
+
+def _statement(rng, lines, depth, loop):
+    '''
+    Appends a random statement to <lines>, indented by <depth>. 'break' is
+    only generated inside a loop.
+    '''
+    _indent = '  ' * depth
+    _choice = rng.randrange(13 if depth < 3 else 5)
+    if _choice == 0:
+        lines.append(_indent + 'local {0} = {1}\n'.format(
+            ', '.join(rng.sample(_generated_names[:6], rng.randint(1, 2))),
+            _expression_list(rng, depth)))
+    elif _choice == 1:
+        lines.append(_indent + '{0} = {1}\n'.format(_variable(rng, depth),
+                                                   _expression(rng, depth)))
+    elif _choice in (2, 3):
+        lines.append(_indent + _call(rng, depth) + '\n')
+    elif _choice == 4:
+        lines.append(_indent + '{0}, {1} = {2}\n'.format(
+            _variable(rng, depth), _variable(rng, depth),
+            _expression_list(rng, depth)))
+    elif _choice == 5:
+        _name = '.'.join(rng.choice(_generated_names[:7])
+                         for _part in range(rng.randint(1, 3)))
+        if rng.random() < 0.3:
+            _name += ':' + rng.choice(_generated_names[:7])
+        _block(rng, lines, depth, 'function {0}({1})'.format(
+            _name, _parameters(rng)), 'end', False)
+    elif _choice == 6:
+        _block(rng, lines, depth, 'local function {0}({1})'.format(
+            rng.choice(_generated_names[:7]), _parameters(rng)), 'end', False)
+    elif _choice == 7:
+        _block(rng, lines, depth, 'if {0} then'.format(
+            _expression(rng, depth)), None, loop)
+        for _branch in range(rng.randrange(3)):
+            _block(rng, lines, depth, 'elseif {0} then'.format(
+                _expression(rng, depth)), None, loop)
+        if rng.random() < 0.5:
+            _block(rng, lines, depth, 'else', None, loop)
+        lines.append(_indent + 'end\n')
+    elif _choice == 8:
+        _block(rng, lines, depth, 'while {0} do'.format(
+            _expression(rng, depth)), 'end', True)
+    elif _choice == 9:
+        _block(rng, lines, depth, 'repeat', 'until ' +
+               _expression(rng, depth), True)
+    elif _choice == 10:
+        _block(rng, lines, depth, 'for i = {0}, {1}{2} do'.format(
+            _expression(rng, depth), _expression(rng, depth),
+            ', ' + _expression(rng, depth) if rng.random() < 0.3 else ''),
+            'end', True)
+    elif _choice == 11:
+        _block(rng, lines, depth, 'for k, v in {0} do'.format(
+            _call(rng, depth)), 'end', True)
+    else:
+        _block(rng, lines, depth, 'do', 'end', loop)
+
+def _block(rng, lines, depth, opener, closer, loop):
+    '''
+    Appends a block of random statements between <opener> and <closer> (no
+    closer if None), possibly ended by a 'return' or a 'break'.
+    '''
+    _indent = '  ' * depth
+    lines.append(_indent + opener + '\n')
+    for _index in range(rng.randrange(4)):
+        _statement(rng, lines, depth + 1, loop)
+    _last = rng.random()
+    if _last < 0.2:
+        lines.append(_indent + '  return ' + _expression_list(rng, depth + 1) +
+                     '\n')
+    elif _last < 0.3 and loop:
+        lines.append(_indent + '  break\n')
+    if closer is not None:
+        lines.append(_indent + closer + '\n')
+
+def _parameters(rng):
+    '''
+    Returns a random parameter list.
+    '''
+    parameters = rng.sample(_generated_names[:6], rng.randrange(4))
+    if rng.random() < 0.2:
+        parameters.append('...')
+    return ', '.join(parameters)
+
+def _expression_list(rng, depth):
+    '''
+    Returns one to three random expressions separated by commas.
+    '''
+    return ', '.join(_expression(rng, depth)
+                     for _index in range(rng.randint(1, 3)))
+
+def _expression(rng, depth):
+    '''
+    Returns a random expression, whose nesting decreases with <depth>.
+    '''
+    _choice = rng.randrange(10 if depth < 4 else 4)
+    if _choice == 0:
+        return str(rng.randrange(1000))
+    if _choice == 1:
+        return rng.choice(('nil', 'true', 'false', '"text"', "'a b'", '...'))
+    if _choice in (2, 3):
+        return _variable(rng, depth)
+    if _choice == 4:
+        return _call(rng, depth)
+    if _choice in (5, 6):
+        return '{0} {1} {2}'.format(_expression(rng, depth + 1),
+                                    rng.choice(_binary),
+                                    _expression(rng, depth + 1))
+    if _choice == 7:
+        _operator = rng.choice(_unary)
+        _operand = _expression(rng, depth + 1)
+        # '--' would start a comment.
+        if _operator == '-' and _operand.startswith('-'):
+            _operator = '- '
+        return _operator + _operand
+    if _choice == 8:
+        return '{' + ', '.join(
+            rng.choice(('', '{0} = ', '[{0}] = ')).format(
+                rng.choice(_generated_names[:6])) +
+            _expression(rng, depth + 1)
+            for _index in range(rng.randrange(4))) + '}'
+    return 'function({0}) return {1} end'.format(_parameters(rng),
+                                                 _expression(rng, depth + 1))
+
+def _variable(rng, depth):
+    '''
+    Returns a random name, field or index.
+    '''
+    variable = rng.choice(_generated_names)
+    for _index in range(rng.randrange(3)):
+        if rng.random() < 0.7:
+            variable += '.' + rng.choice(_generated_names[:6])
+        else:
+            variable += '[' + _expression(rng, depth + 2) + ']'
+    return variable
+
+def _call(rng, depth):
+    '''
+    Returns a random function or method call.
+    '''
+    _arguments = ', '.join(_expression(rng, depth + 2)
+                           for _index in range(rng.randrange(3)))
+    if rng.random() < 0.2:
+        return '{0}:{1}({2})'.format(_variable(rng, depth),
+                                     rng.choice(_generated_names[:6]),
+                                     _arguments)
+    return '{0}({1})'.format(_variable(rng, depth), _arguments)
+
+def mutate(rng, lines):
+    '''
+    Applies one to three random token mutations to a source: deletion,
+    duplication or swap of tokens, or insertion of a fragment.
+        Arguments:
+            <rng>       :   random.Random instance
+            <lines>     :   lines of source code
+
+        Output:
+            Returns the lines of the mutated source, or None if the source
+            can not be tokenized.
+    '''
+    try:
+        tokens = list(Luaminify.tokenize(lines))
+    except ValueError:
+        return None
+    if not tokens:
+        return None
+    for _mutation in range(rng.randint(1, 3)):
+        _index = rng.randrange(len(tokens))
+        _choice = rng.randrange(4)
+        if _choice == 0 and len(tokens) > 1:
+            del tokens[_index]
+        elif _choice == 1:
+            tokens.insert(_index, tokens[_index])
+        elif _choice == 2 and _index + 1 < len(tokens):
+            _line = tokens[_index][0]
+            tokens[_index], tokens[_index + 1] = (
+                (_line,) + tokens[_index + 1][1:],
+                (tokens[_index + 1][0],) + tokens[_index][1:])
+        else:
+            tokens.insert(_index, (tokens[_index][0], 'op',
+                                   rng.choice(_fragments)))
+    return render(tokens)
+
+def inputs(paths, generated=0, mutated=0, seed=0):
+    '''
+    Lists the inputs of a run.
+        Arguments:
+            <paths>     :   files and directories of lua files
+            <generated> :   0 by default. Number of generated programs
+            <mutated>   :   0 by default. Number of mutated inputs, made from
+                            the files, or from generated programs if there
+                            are none
+            <seed>      :   0 by default. Seed of the random generator
+
+        Output:
+            Yields tuples (<name>, <lines>). Files which can not be read are
+            skipped with a message.
+    '''
+    rng = random.Random(seed)
+    files = []
+    for filename in Luascope.find_files(paths):
+        try:
+            with open(filename, 'rt') as input_file:
+                _lines = input_file.readlines()
+        except (IOError, UnicodeDecodeError):
+            print("{0}: File could not be read.".format(filename))
+            continue
+        files.append((filename, _lines))
+        yield filename, _lines
+    for _index in range(generated):
+        yield 'generated-{0}'.format(_index), generate(rng)
+    for _index in range(mutated):
+        if files:
+            _name, _lines = rng.choice(files)
+        else:
+            _name, _lines = 'generated', generate(rng)
+        _lines = mutate(rng, _lines)
+        if _lines is not None:
+            yield 'mutated-{0}-{1}'.format(_index, os.path.basename(_name)), \
+                _lines
+
+
+##############################################################################
+# Reports
+
+def print_difference(name, difference, lines=None):
+    '''
+    Prints a difference found by check_input.
+
+        Arguments:
+            name:       Name of the input.
+            difference: Tuple (<engine>, <category>, <message>).
+            lines:      None by default. Shrunk input, printed if it has
+                        at most 20 lines.
+
+        Output:
+            Prints to stdout.
+    '''
+    print("{0}: {1}: {2}: {3}".format(name, *difference))
+    if lines is not None and len(lines) <= 20:
+        print("  minimal input:")
+        for _line in lines:
+            print("    " + _line.rstrip('\n'))
+
+def write_input(directory, name, lines):
+    '''
+    Writes an input to <directory>, creating it if needed.
+    '''
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, name + '.lua'), 'wt') as output_file:
+        output_file.writelines(lines)
+
+def print_speedups(timings, names):
+    '''
+    Prints the speedup of each engine over the reference: the ratio of the
+    total parse times and the geometric mean of the ratios of the inputs.
+
+        Arguments:
+            timings:    List of dictionaries returned by check_input.
+            names:      Names of the engines.
+
+        Output:
+            Prints to stdout.
+    '''
+    print("Speedup over the backtracking parser:")
+    for _name in names:
+        _pairs = [(_t[REFERENCE], _t[_name]) for _t in timings
+                  if _name in _t and _t[_name] > 0]
+        if not _pairs:
+            continue
+        _total = sum(_p[0] for _p in _pairs) / sum(_p[1] for _p in _pairs)
+        _mean = math.exp(sum(math.log(_p[0] / _p[1]) for _p in _pairs) /
+                         len(_pairs))
+        print("  {0:<10} {1:8.2f}x total {2:8.2f}x geometric mean".format(
+            _name, _total, _mean))
+
+##############################################################################
+
+def main(argv):
+    '''
+    Runs the differential test from the command line.
+
+        Arguments:
+            argv:       Command line arguments without the program name.
+
+        Output:
+            Prints to stdout. Exits with status 1 if a difference is found.
+    '''
+    arg_parser = argparse.ArgumentParser(
+        description="Compares the backtracking parser with alternative "
+                    "engines.")
+    arg_parser.add_argument('paths', nargs='*', metavar='path')
+    arg_parser.add_argument('--engine', action='append', choices=engines,
+                            help="engine to compare (default: all), may be "
+                                 "repeated")
+    arg_parser.add_argument('--generate', type=int, default=0, metavar='N',
+                            help="number of generated programs")
+    arg_parser.add_argument('--mutate', type=int, default=0, metavar='N',
+                            help="number of mutated inputs")
+    arg_parser.add_argument('--seed', type=int, default=0,
+                            help="seed of the generator (default: 0)")
+    arg_parser.add_argument('--no-shrink', action='store_true',
+                            help="do not shrink the failing inputs")
+    arg_parser.add_argument('-o', '--output', metavar='DIRECTORY',
+                            help="directory the failing and shrunk inputs "
+                                 "are written to")
+    arg_parser.add_argument('--timings', metavar='FILE',
+                            help="CSV file the parse times of each input are "
+                                 "written to")
+    arg_parser.add_argument('--timeout', type=float, default=10.0,
+                            metavar='SECONDS',
+                            help="work budget of each parse (default: 10)")
+    arg_parser.add_argument('-v', '--verbose', action='store_true',
+                            help="print the speedups of each input")
+    args = arg_parser.parse_args(argv)
+
+    names = args.engine or list(engines)
+    Luaparser.set_budget(seconds=args.timeout)
+    timings = []
+    rows = []
+    failed = 0
+    skipped = 0
+    count = 0
+    for name, lines in inputs(args.paths, args.generate, args.mutate,
+                              args.seed):
+        count += 1
+        differences, seconds = check_input(lines, names)
+        if differences is None:
+            skipped += 1
+            continue
+        timings.append(seconds)
+        rows.append((name, seconds))
+        if args.verbose:
+            print("{0}: {1:.4f} s {2}".format(
+                name, seconds[REFERENCE], ' '.join(
+                    "{0} {1:.1f}x".format(_name, seconds[REFERENCE] /
+                                          seconds[_name])
+                    for _name in names if seconds[_name] > 0)))
+        if not differences:
+            continue
+        failed += 1
+        _label = os.path.splitext(os.path.basename(name))[0]
+        if args.output:
+            write_input(args.output, _label, lines)
+        _shrunk = set()
+        for _difference in differences:
+            _minimal = None
+            if not args.no_shrink and _difference[:2] not in _shrunk:
+                _shrunk.add(_difference[:2])
+                _minimal = shrink(lines, *_difference[:2])
+                if args.output:
+                    write_input(args.output, '{0}.{1}.{2}'.format(
+                        _label, *_difference[:2]), _minimal)
+            print_difference(name, _difference, _minimal)
+
+    if args.timings:
+        with open(args.timings, 'wt') as output_file:
+            output_file.write('input,{0}\n'.format(','.join(
+                [REFERENCE] + names)))
+            for name, seconds in rows:
+                output_file.write('{0},{1}\n'.format(name, ','.join(
+                    '{0:.6f}'.format(seconds[_name])
+                    for _name in [REFERENCE] + names)))
+    print_speedups(timings, names)
+    print("{0} inputs, {1} with differences, {2} skipped".format(
+        count, failed, skipped))
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+'''
+This script checks the lua files changed in a git repository since a
+revision, for example the files of a pull request.
+
+    Usage:
+        python3 Luagit.py [--staged] [--untracked] [-j N] [--cache <dir>]
+                          [--timeout S] [-C <repository>] [<revision>]
+
+            Checks the .lua files added or modified between the merge base
+            of <revision> (the upstream of the current branch, @{upstream},
+            by default) and HEAD. With --staged the changes staged in the
+            index are included and with --untracked the untracked files
+            which are not ignored. The files are parsed in N processes and
+            the results are cached by git blob hash in <dir> (luacache in
+            the git directory by default), so a file is only parsed once
+            whatever its name or revision. The exit status is 1 if errors
+            are found.
+
+    The checked content is the one of the selected revision: the blob of
+    HEAD, of the index with --staged, or the file for untracked files.
+'''
+import sys
+import os
+import subprocess
+import argparse
+
+import Luaparser
+import Luacache
+
+
+class GitError(Exception):
+    '''
+    Raised when a git command fails.
+    '''
+    pass
+
+
+def git(repository, *args, input=None):
+    '''
+    Runs a git command in <repository>.
+        Arguments:
+            <repository>    :   path of the working tree
+            <args>          :   arguments of the git command
+            <input>         :   None by default. Bytes sent to its input
+
+        Output:
+            Returns the output of the command as bytes. Raises GitError if
+            the command fails.
+    '''
+    try:
+        process = subprocess.run(('git', '-C', repository) + args,
+                                 input=input, stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE, check=True)
+    except subprocess.CalledProcessError as exception:
+        raise GitError(exception.stderr.decode(errors='replace').strip())
+    except OSError as exception:
+        raise GitError("git could not be run: {0}".format(exception))
+    return process.stdout
+
+def changed_files(repository, revision='@{upstream}', staged=False,
+                  untracked=False):
+    '''
+    Lists the lua files changed since the merge base of <revision> and HEAD.
+        Arguments:
+            <repository>    :   path of the working tree
+            <revision>      :   '@{upstream}' by default. Revision to
+                                compare with
+            <staged>        :   False by default. Include the index
+            <untracked>     :   False by default. Include untracked files
+
+        Output:
+            Returns a list of tuples (<path>, <blob hash>, <untracked>)
+            sorted by path, with paths relative to the top of the working
+            tree. The blob hash is the one of HEAD, of the index if <staged>
+            is true, or of the file if it is untracked, in which case the
+            blob is not in the repository.
+    '''
+    base = git(repository, 'merge-base', revision, 'HEAD').split()[0]
+    base = base.decode()
+    if staged:
+        paths = git(repository, 'diff', '--cached', '--name-only', '-z',
+                    '--diff-filter=ACMR', base, '--', '*.lua')
+    else:
+        paths = git(repository, 'diff', '--name-only', '-z',
+                    '--diff-filter=ACMR', base, 'HEAD', '--', '*.lua')
+    paths = [_p.decode() for _p in paths.split(b'\0') if _p]
+
+    files = {}
+    if paths:
+        if staged:
+            # <mode> <hash> <stage>\t<path>
+            listing = git(repository, 'ls-files', '-s', '-z', '--', *paths)
+        else:
+            # <mode> blob <hash>\t<path>
+            listing = git(repository, 'ls-tree', '-r', '-z', 'HEAD', '--',
+                          *paths)
+        for _entry in listing.split(b'\0'):
+            if _entry:
+                _info, _path = _entry.split(b'\t', 1)
+                files[_path.decode()] = (
+                    _info.split()[1 if staged else 2].decode(), False)
+
+    if untracked:
+        others = git(repository, 'ls-files', '--others', '--exclude-standard',
+                     '-z', '--', '*.lua')
+        others = [_p.decode() for _p in others.split(b'\0') if _p]
+        if others:
+            hashes = git(repository, 'hash-object', '--stdin-paths',
+                         input='\n'.join(others).encode()).split()
+            files.update(zip(others, ((_h.decode(), True) for _h in hashes)))
+    return sorted((_path, _hash, _untracked)
+                  for _path, (_hash, _untracked) in files.items())
+
+def cache_directory(repository):
+    '''
+    Returns the default cache directory of a repository, luacache in its
+    git directory, so that the cache is neither in the working tree nor
+    reported as untracked. The worktrees of a repository share it.
+    '''
+    common = git(repository, 'rev-parse', '--git-common-dir')
+    return os.path.join(repository, common.decode().rstrip('\n'), 'luacache')
+
+def read_blobs(repository, hashes):
+    '''
+    Reads the content of git blobs with a single git process.
+        Arguments:
+            <repository>    :   path of the working tree
+            <hashes>        :   list of blob hashes
+
+        Output:
+            Returns a dictionary from blob hash to content as bytes.
+    '''
+    if not hashes:
+        return {}
+    output = git(repository, 'cat-file', '--batch',
+                 input=''.join(_h + '\n' for _h in hashes).encode())
+    blobs = {}
+    offset = 0
+    for _hash in hashes:
+        _end = output.index(b'\n', offset)
+        _size = int(output[offset:_end].split()[2])
+        blobs[_hash] = output[_end + 1:_end + 1 + _size]
+        offset = _end + 1 + _size + 1
+    return blobs
+
+def check(repository, files, cache, jobs=None):
+    '''
+    Parses changed files, using the cached results of their blobs.
+        Arguments:
+            <repository>    :   path of the working tree
+            <files>         :   list of tuples (<path>, <blob hash>,
+                                <untracked>) as returned by changed_files
+            <cache>         :   directory of the cache
+            <jobs>          :   None by default. Number of processes, the
+                                number of processors if None
+
+        Output:
+            Returns a tuple (<results>, <cached>): the list of ParseResult
+            of the files (None if a file could not be lexed) and the number
+            of results read from the cache.
+    '''
+    results = {}
+    for _path, _hash, _untracked in files:
+        if _hash not in results:
+            try:
+                results[_hash] = Luacache.load(
+                    Luacache.cache_path(cache, _hash.encode()))
+            except (IOError, ValueError):
+                pass
+    cached = sum(1 for _file in files if _file[1] in results)
+
+    # Each distinct blob is parsed once. The blobs and the results, in the
+    # binary format of Luacache, are passed to and from the workers in
+    # shared memory.
+    missing = sorted(set(_file[1] for _file in files) - set(results))
+    untracked = {_hash: _path for _path, _hash, _untracked in files
+                 if _untracked and _hash in missing}
+    blobs = read_blobs(repository, [_hash for _hash in missing
+                                    if _hash not in untracked])
+    for _hash, _path in untracked.items():
+        with open(os.path.join(repository, _path), 'rb') as input_file:
+            blobs[_hash] = input_file.read()
+    if missing:
+        os.makedirs(cache, exist_ok=True)
+        for _hash, _data in zip(missing, Luacache.parse_batch(
+                [blobs[_h] for _h in missing], jobs)):
+            if _data is None:
+                results[_hash] = None
+                continue
+            results[_hash] = Luacache.loads(_data)
+            if results[_hash].stopped is not None:
+                continue
+            _path = Luacache.cache_path(cache, _hash.encode())
+            _temp = '{0}.{1}.tmp'.format(_path, os.getpid())
+            with open(_temp, 'wb') as output_file:
+                output_file.write(_data)
+            os.replace(_temp, _path)
+    return [results[_file[1]] for _file in files], cached
+
+##############################################################################
+
+def main(argv):
+    '''
+    Checks the changed files from the command line.
+
+        Arguments:
+            argv:       Command line arguments without the program name.
+
+        Output:
+            Prints to stdout. Exits with status 1 if errors are found and 2
+            if git fails.
+    '''
+    arg_parser = argparse.ArgumentParser(
+        description="Checks the lua files changed since a git revision.")
+    arg_parser.add_argument('revision', nargs='?', default='@{upstream}',
+                            help="revision to compare with (default: the "
+                                 "upstream of the current branch)")
+    arg_parser.add_argument('-C', dest='repository', default='.',
+                            metavar='REPOSITORY',
+                            help="working tree of the repository")
+    arg_parser.add_argument('--staged', action='store_true',
+                            help="include the changes staged in the index")
+    arg_parser.add_argument('--untracked', action='store_true',
+                            help="include untracked files")
+    arg_parser.add_argument('-j', '--jobs', type=int, metavar='N',
+                            help="number of processes used to parse")
+    arg_parser.add_argument('--cache', metavar='DIRECTORY',
+                            help="cache directory (default: luacache in "
+                                 "the git directory)")
+    arg_parser.add_argument('--timeout', type=float, metavar='SECONDS',
+                            help="stop the parse of a file after SECONDS "
+                                 "seconds")
+    args = arg_parser.parse_args(argv)
+
+    Luaparser.set_budget(seconds=args.timeout)
+    try:
+        top = git(args.repository, 'rev-parse', '--show-toplevel')
+        top = top.decode().rstrip('\n')
+        files = changed_files(top, args.revision, args.staged,
+                              args.untracked)
+        results, cached = check(top, files, args.cache or
+                                cache_directory(top), args.jobs)
+    except GitError as exception:
+        print("git: {0}".format(exception))
+        if args.revision == '@{upstream}' and 'upstream' in str(exception):
+            print("Give the revision to compare with, for example "
+                  "origin/main.")
+        sys.exit(2)
+
+    failed = 0
+    for (path, _hash, _untracked), result in zip(files, results):
+        if result is None:
+            print("{0}: File could not be lexed.".format(path))
+            failed += 1
+        elif result.errors or result.stopped is not None:
+            Luacache.print_result(path, result)
+            failed += 1
+    print("{0} files checked, {1} from the cache, {2} with errors".format(
+        len(files), cached, failed))
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,608 @@
+#!/usr/bin/env python3
+'''
+This script reads a declarative grammar of the lua programming language and
+generates a table driven LL(1) parser from it. The FIRST and FOLLOW sets of
+the grammar are computed and any conflict in the parse table is reported.
+
+    Usage:
+        python3 Luagrammar.py [<grammar> [<output>]]
+
+        By default lua51.grammar is read and Luallparser.py is written next
+        to this script.
+
+    The format of the grammar file is described in lua51.grammar. Conflicts
+    are resolved by taking the alternative listed first. The generator fails
+    if the number of conflicts differs from the one declared with %expect, so
+    a production added by mistake can not silently change the language.
+
+    The generated parser only validates the input and stops at the first
+    error. It does not try to recover like the backtracking parser does.
+'''
+import sys
+import os
+import re
+import pprint
+
+
+# Pattern used to split the grammar file into its symbols
+_grammar_token = re.compile(r"\s+|#[^\n]*|'[^']+'|%\w+|@\w+|\w+|[:|;]|.")
+
+# Token classes recognised by the generated lexer and the semantic actions
+# implemented by the generated driver
+token_classes = ('NAME', 'NUMBER', 'STRING')
+known_actions = ('name', 'var', 'call', 'paren', 'expr', 'assignable',
+                 'callstat', 'fieldname', 'fbeg', 'fsig', 'fend')
+
+# Name of the end of input terminal
+EOF = '___eof___'
+
+
+def generate(grammar_file, output_file):
+    '''
+    Reads a grammar file, builds the parse table and writes the table driven
+    parser to <output_file>.
+        Arguments:
+            <grammar_file>  :   grammar to be read
+            <output_file>   :   python module to be written
+
+        Output:
+            Returns the list of conflicts found in the grammar.
+    '''
+    with open(grammar_file, 'rt') as input_file:
+        rules, start, expect = read_grammar(input_file.read())
+
+    check_grammar(rules, start)
+    first, nullable = first_sets(rules)
+    follow = follow_sets(rules, start, first, nullable)
+    table, conflicts = build_table(rules, first, nullable, follow)
+
+    if expect is not None and len(conflicts) != expect:
+        raise GrammarError("{0} conflicts found, {1} expected.".format(
+            len(conflicts), expect))
+
+    with open(output_file, 'wt') as output:
+        output.write(emit(rules, start, table, os.path.basename(grammar_file)))
+
+    return conflicts
+
+def read_grammar(text):
+    '''
+    Parses the grammar description.
+        Arguments:
+            <text>      :   content of the grammar file
+
+        Output:
+            Returns a tuple (<rules>, <start>, <expect>). <rules> maps every
+            nonterminal to its list of alternatives, each being a list of
+            symbols. Order of the rules and alternatives is preserved.
+    '''
+    symbols = [_t for _t in _grammar_token.findall(text)
+               if _t.strip() and not _t.startswith('#')]
+    rules = {}
+    start = None
+    expect = None
+    i = 0
+    while i < len(symbols):
+        if symbols[i] == '%start':
+            start = symbols[i + 1]
+            i += 2
+            continue
+        if symbols[i] == '%expect':
+            expect = int(symbols[i + 1])
+            i += 2
+            continue
+
+        lhs = symbols[i]
+        if not re.fullmatch('[a-z_][a-z_0-9]*', lhs) or symbols[i + 1] != ':':
+            raise GrammarError("Invalid rule starting at '{0}'.".format(lhs))
+        if lhs in rules:
+            raise GrammarError("Rule '{0}' defined twice.".format(lhs))
+        i += 2
+
+        alternatives = [[]]
+        while symbols[i] != ';':
+            if symbols[i] == '|':
+                alternatives.append([])
+            elif symbols[i] != '%empty':
+                alternatives[-1].append(symbols[i])
+            i += 1
+            if i >= len(symbols):
+                raise GrammarError("Missing ';' after rule '{0}'.".format(lhs))
+        rules[lhs] = alternatives
+        i += 1
+
+    if start is None and rules:
+        start = next(iter(rules))
+    return rules, start, expect
+
+def check_grammar(rules, start):
+    '''
+    Checks that every symbol used in the grammar is defined and that every
+    rule can be reached from the start symbol.
+        Arguments:
+            <rules>     :   grammar as returned by read_grammar
+            <start>     :   start symbol
+
+        Output:
+            Raises GrammarError on the first problem found.
+    '''
+    if start not in rules:
+        raise GrammarError("Start symbol '{0}' is not defined.".format(start))
+
+    for lhs, alternatives in rules.items():
+        for alternative in alternatives:
+            for symbol in alternative:
+                if is_action(symbol):
+                    if symbol[1:] not in known_actions:
+                        raise GrammarError("Unknown action '{0}' in '{1}'."
+                                           .format(symbol, lhs))
+                elif not is_terminal(symbol) and symbol not in rules:
+                    raise GrammarError("Undefined symbol '{0}' in '{1}'."
+                                       .format(symbol, lhs))
+
+    reached = {start}
+    todo = [start]
+    while todo:
+        for alternative in rules[todo.pop()]:
+            for symbol in alternative:
+                if symbol in rules and symbol not in reached:
+                    reached.add(symbol)
+                    todo.append(symbol)
+    for lhs in rules:
+        if lhs not in reached:
+            raise GrammarError("Rule '{0}' is unreachable.".format(lhs))
+
+def first_sets(rules):
+    '''
+    Computes the FIRST set of every nonterminal. Actions are transparent and
+    do not contribute to the sets.
+        Arguments:
+            <rules>     :   grammar as returned by read_grammar
+
+        Output:
+            Returns a tuple (<first>, <nullable>) where <first> maps each
+            nonterminal to its set of terminals and <nullable> is the set of
+            nonterminals deriving the empty string.
+    '''
+    first = {_lhs: set() for _lhs in rules}
+    nullable = set()
+    changed = True
+    while changed:
+        changed = False
+        for lhs, alternatives in rules.items():
+            for alternative in alternatives:
+                _first, _nullable = sequence_first(alternative, first,
+                                                   nullable)
+                if not _first <= first[lhs]:
+                    first[lhs] |= _first
+                    changed = True
+                if _nullable and lhs not in nullable:
+                    nullable.add(lhs)
+                    changed = True
+    return first, nullable
+
+def sequence_first(sequence, first, nullable):
+    '''
+    Computes the FIRST set of a sequence of symbols.
+        Arguments:
+            <sequence>  :   list of symbols
+            <first>     :   FIRST sets of the nonterminals
+            <nullable>  :   set of nullable nonterminals
+
+        Output:
+            Returns a tuple (<set of terminals>, <sequence is nullable>).
+    '''
+    result = set()
+    for symbol in sequence:
+        if is_action(symbol):
+            continue
+        if is_terminal(symbol):
+            result.add(symbol)
+            return result, False
+        result |= first[symbol]
+        if symbol not in nullable:
+            return result, False
+    return result, True
+
+def follow_sets(rules, start, first, nullable):
+    '''
+    Computes the FOLLOW set of every nonterminal.
+        Arguments:
+            <rules>     :   grammar as returned by read_grammar
+            <start>     :   start symbol
+            <first>     :   FIRST sets of the nonterminals
+            <nullable>  :   set of nullable nonterminals
+
+        Output:
+            Returns a dictionary mapping each nonterminal to its FOLLOW set.
+    '''
+    follow = {_lhs: set() for _lhs in rules}
+    follow[start].add(EOF)
+    changed = True
+    while changed:
+        changed = False
+        for lhs, alternatives in rules.items():
+            for alternative in alternatives:
+                for i, symbol in enumerate(alternative):
+                    if symbol not in rules:
+                        continue
+                    _first, _nullable = sequence_first(alternative[i + 1:],
+                                                       first, nullable)
+                    if _nullable:
+                        _first = _first | follow[lhs]
+                    if not _first <= follow[symbol]:
+                        follow[symbol] |= _first
+                        changed = True
+    return follow
+
+def build_table(rules, first, nullable, follow):
+    '''
+    Builds the LL(1) parse table. When two alternatives are possible for the
+    same token the one listed first in the grammar is kept and a conflict is
+    recorded.
+        Arguments:
+            <rules>     :   grammar as returned by read_grammar
+            <first>     :   FIRST sets of the nonterminals
+            <nullable>  :   set of nullable nonterminals
+            <follow>    :   FOLLOW sets of the nonterminals
+
+        Output:
+            Returns a tuple (<table>, <conflicts>). <table> maps each
+            nonterminal to a dictionary from terminal to alternative index.
+            <conflicts> is a list of messages describing each conflict.
+    '''
+    table = {}
+    conflicts = []
+    for lhs, alternatives in rules.items():
+        row = {}
+        for index, alternative in enumerate(alternatives):
+            _first, _nullable = sequence_first(alternative, first, nullable)
+            if _nullable:
+                _first = _first | follow[lhs]
+            for terminal in sorted(_first):
+                if terminal in row:
+                    conflicts.append(
+                        "Conflict in '{0}' on {1}: alternatives {2} and {3}, "
+                        "using {2}.".format(lhs, terminal, row[terminal] + 1,
+                                            index + 1))
+                else:
+                    row[terminal] = index
+        table[lhs] = row
+    return table, conflicts
+
+def emit(rules, start, table, source):
+    '''
+    Generates the source code of the table driven parser.
+        Arguments:
+            <rules>     :   grammar as returned by read_grammar
+            <start>     :   start symbol
+            <table>     :   parse table as returned by build_table
+            <source>    :   name of the grammar file (used in the header)
+
+        Output:
+            Returns the source code as a string.
+    '''
+    terminals = [EOF]
+    for alternatives in rules.values():
+        for alternative in alternatives:
+            for symbol in alternative:
+                if is_terminal(symbol) and symbol not in terminals:
+                    terminals.append(symbol)
+    nonterminals = list(rules)
+    actions = list(known_actions)
+
+    # Symbols are numbered terminals first, then nonterminals, then actions
+    # so the driver can tell them apart with two comparisons.
+    ids = {}
+    for _symbol in terminals:
+        ids[_symbol] = len(ids)
+    for _symbol in nonterminals:
+        ids[_symbol] = len(ids)
+    for _action in actions:
+        ids['@' + _action] = len(ids)
+
+    productions = []
+    parse_table = []
+    for lhs in nonterminals:
+        numbers = []
+        for alternative in rules[lhs]:
+            rhs = tuple(ids[_s] for _s in reversed(alternative))
+            if rhs not in productions:
+                productions.append(rhs)
+            numbers.append(productions.index(rhs))
+        row = {ids[_t]: numbers[_i] for _t, _i in table[lhs].items()}
+        parse_table.append(dict(sorted(row.items())))
+
+    names = [_t.strip("'") for _t in terminals]
+    return _template.format(
+        source=source,
+        terminals=format_tuple(names),
+        nonterminals=format_tuple(nonterminals),
+        actions=format_tuple(actions),
+        productions=format_tuple(productions),
+        table=format_tuple(parse_table),
+        start=ids[start])
+
+def format_tuple(items):
+    '''
+    Formats a sequence as the source of a tuple with one indented item group
+    per line, wrapping lines at 79 characters. Dictionaries too long for a
+    line are wrapped as well.
+        Arguments:
+            <items>     :   sequence of python literals
+
+        Output:
+            Returns the source code as a string.
+    '''
+    lines = ['(']
+    for item in items:
+        if isinstance(item, dict) and item:
+            pieces = ['{0}: {1},'.format(_k, _v) for _k, _v in item.items()]
+            pieces[0] = '{' + pieces[0]
+            pieces[-1] = pieces[-1][:-1] + '},'
+        else:
+            pieces = [repr(item) + ',']
+        for index, piece in enumerate(pieces):
+            indent = '    ' if index == 0 else '     '
+            if lines[-1] == '(' or (index == 0 and isinstance(item, dict)) \
+                    or len(lines[-1]) + len(piece) + 1 > 79:
+                lines.append(indent + piece)
+            else:
+                lines[-1] += ' ' + piece
+    lines.append(')')
+    return '\n'.join(lines)
+
+def is_terminal(symbol):
+    '''
+    Returns true if <symbol> is a terminal (quoted literal or token class).
+    '''
+    return symbol.startswith("'") or symbol in token_classes
+
+def is_action(symbol):
+    '''
+    Returns true if <symbol> is a semantic action.
+    '''
+    return symbol.startswith('@')
+
+
+class GrammarError(Exception):
+    '''
+    Raised when the grammar file is invalid.
+    '''
+    pass
+
+
+##############################################################################
+# Template of the generated parser
+
+_template = """\
+# Generated by Luagrammar.py from {source}. Do not edit.
+'''
+Table driven LL(1) parser for the lua programming language. It validates a
+token list as built by Luaparser.load and stops at the first error.
+
+    Usage:
+        python3 Luallparser.py <filename>
+'''
+import sys
+import re
+
+
+TERMINALS = {terminals}
+
+NONTERMINALS = {nonterminals}
+
+ACTIONS = {actions}
+
+# Right hand sides of the productions, reversed so they can be pushed on the
+# parse stack as they are.
+PRODUCTIONS = {productions}
+
+# One row per nonterminal mapping a terminal to a production.
+TABLE = {table}
+
+START = {start}
+
+_NT = len(TERMINALS)
+_ACT = _NT + len(NONTERMINALS)
+_EOF = 0
+_UNKNOWN = -1
+
+_ids = {{_t: _i for _i, _t in enumerate(TERMINALS)}}
+_multi = tuple(sorted((_t for _t in TERMINALS if len(_t) > 1 and
+                       not re.fullmatch('[_A-Za-z0-9]+', _t)),
+                      key=len, reverse=True))
+_name = re.compile('[_A-Za-z][_A-Za-z0-9]*')
+_number = re.compile('-?[0-9]+(\\\\.[0-9]+)?')
+_string = re.compile('(\\"(\\\\.|[^\\"])*\\")|(\\'(\\\\.|[^\\'])*\\')')
+
+
+def classify(token_list, lines=None):
+    '''
+    Converts a token list as built by Luaparser.load to flat lists of token
+    kinds, texts and positions. Punctuation split by the lexer ('..', '==',
+    ...) is merged back into a single token if its characters touch in the
+    source.
+        Arguments:
+            <token_list>    :   list of lines, each being a list of tokens
+            <lines>         :   None by default. Source lines, the line n of
+                                token_list being lines[n - 1]. If None, the
+                                columns of the tokens are not known and
+                                adjacent tokens are merged even if they are
+                                separated by blanks
+
+        Output:
+            Returns a tuple (<kinds>, <texts>, <positions>).
+    '''
+    kinds = []
+    texts = []
+    positions = []
+    for _line_number, _line in enumerate(token_list):
+        _columns = None
+        if lines is not None and 0 < _line_number <= len(lines):
+            _columns = _token_columns(_line, lines[_line_number - 1])
+        i = 0
+        while i < len(_line):
+            _token = _line[i]
+            _width = 1
+            if _token in ('', '___start___'):
+                i += 1
+                continue
+            for _candidate in _multi:
+                _end = i + len(_candidate)
+                if ''.join(_line[i:_end]) == _candidate and (
+                        _columns is None or
+                        _columns[_end - 1] - _columns[i] == _end - i - 1):
+                    _token = _candidate
+                    _width = len(_candidate)
+                    break
+            if _token in _ids:
+                kinds.append(_ids[_token])
+            elif _name.fullmatch(_token):
+                kinds.append(_ids['NAME'])
+            elif _number.fullmatch(_token):
+                kinds.append(_ids['NUMBER'])
+            elif _string.fullmatch(_token):
+                kinds.append(_ids['STRING'])
+            else:
+                kinds.append(_UNKNOWN)
+            texts.append(_token)
+            positions.append((_line_number, i))
+            i += _width
+    if not kinds or kinds[-1] != _EOF:
+        kinds.append(_EOF)
+        texts.append('___eof___')
+        positions.append((len(token_list) - 1, 0))
+    return kinds, texts, positions
+
+def _token_columns(tokens, text):
+    '''
+    Returns the column of each token of a line in its source text. The
+    lexer keeps the tokens as they are written and only drops blanks, so
+    each token is the next occurrence of its text.
+    '''
+    columns = []
+    _column = 0
+    for _token in tokens:
+        _column = text.find(_token, _column)
+        columns.append(_column)
+        _column += len(_token)
+    return columns
+
+def parse_tokens(token_list, lines=None):
+    '''
+    Parses a token list with the generated tables.
+        Arguments:
+            <token_list>    :   list of lines, each being a list of tokens
+            <lines>         :   None by default. Source lines, see classify
+
+        Output:
+            Returns a tuple (<errors>, <functions>). Errors have the format
+            [<line>, <token>, <message>] used by Luaparser.error_list and
+            functions the format used by Luaparser.function_list.
+    '''
+    kinds, texts, positions = classify(token_list, lines)
+    table = TABLE
+    productions = PRODUCTIONS
+    nt = _NT
+    act = _ACT
+    a_name, a_var, a_call, a_paren, a_expr, a_assignable, a_callstat, \\
+        a_fieldname, a_fbeg, a_fsig, a_fend = range(act, act + len(ACTIONS))
+
+    errors = []
+    functions = []
+    starts = []
+    signatures = []
+    last = None
+    stack = [_EOF, START]
+    i = 0
+    kind = kinds[0]
+
+    while stack:
+        top = stack.pop()
+        if top < nt:
+            if top != kind:
+                errors.append(_expected(top, texts[i], positions[i]))
+                break
+            if kind != _EOF:
+                i += 1
+                kind = kinds[i]
+        elif top < act:
+            production = table[top - nt].get(kind)
+            if production is None:
+                errors.append(_unexpected(texts[i], positions[i]))
+                break
+            stack.extend(productions[production])
+        elif top == a_expr:
+            last = a_expr
+        elif top == a_name or top == a_var or top == a_call or \\
+                top == a_paren:
+            last = top
+        elif top == a_assignable:
+            if last != a_name and last != a_var:
+                errors.append(_error("Invalid variable.", positions[i]))
+                break
+        elif top == a_callstat:
+            if last != a_call:
+                errors.append(_error("Invalid statement.", positions[i - 1]))
+                break
+        elif top == a_fieldname:
+            if last != a_name:
+                errors.append(_error("Invalid field name.", positions[i]))
+                break
+        elif top == a_fbeg:
+            starts.append(i)
+        elif top == a_fsig:
+            signatures.append(i)
+        elif top == a_fend:
+            functions.append(texts[starts.pop():signatures.pop()])
+
+    return errors, functions
+
+def _error(message, position):
+    return [position[0], position[1], message]
+
+def _expected(terminal, text, position):
+    expected = TERMINALS[terminal]
+    if terminal == _EOF:
+        return _error("Invalid statement.", position)
+    if expected in ('NAME', 'NUMBER', 'STRING'):
+        return _error("{{0}} expected.".format(expected.capitalize()),
+                      position)
+    if re.fullmatch('[a-z]+', expected):
+        return _error("Keyword '{{0}}' expected.".format(expected), position)
+    return _error("Symbol '{{0}}' expected.".format(expected), position)
+
+def _unexpected(text, position):
+    if text == '___eof___':
+        return _error("Unexpected end of file.", position)
+    return _error("Unexpected symbol '{{0}}'.".format(text), position)
+
+
+if __name__ == "__main__":
+    import Luaparser
+    Luaparser.load(sys.argv[1])
+    _errors, _functions = parse_tokens(Luaparser.token_list,
+                                       Luaparser._line_list)
+    Luaparser.error_list.extend(_errors)
+    Luaparser.function_list.extend(_functions)
+    Luaparser.print_errors(sys.argv[1])
+    if not Luaparser.error_list:
+        Luaparser.print_functions()
+"""
+
+##############################################################################
+
+# Allow the code to be run as a main script from the command line.
+if __name__ == "__main__":
+    _here = os.path.dirname(os.path.abspath(__file__))
+    _grammar = sys.argv[1] if len(sys.argv) > 1 else \
+        os.path.join(_here, 'lua51.grammar')
+    _output = sys.argv[2] if len(sys.argv) > 2 else \
+        os.path.join(_here, 'Luallparser.py')
+    try:
+        for _conflict in generate(_grammar, _output):
+            print(_conflict)
+    except GrammarError as e:
+        print(e)
+        sys.exit(1)
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+'''
+This script keeps an index of the functions declared in a tree of lua files
+in a SQLite database, so they can be looked up without parsing the files
+again.
+
+    Usage:
+        python3 Luaindex.py index [--db <database>] [-j N] [--timeout S]
+                                  <path> ...
+
+            Parses the lua files found under the paths and stores their
+            declared functions. Files whose size, modification time or
+            content did not change since the last run are not parsed again
+            and files which disappeared are removed from the index. With
+            --timeout the parse of a file is stopped after S seconds.
+
+        python3 Luaindex.py find [--db <database>] [--prefix] <name>
+
+            Prints the files and lines declaring the function <name>, for
+            example foo.bar:baz. With --prefix all functions whose name
+            starts with <name> are printed.
+
+    The database is luaindex.db in the current directory by default.
+'''
+import sys
+import os
+import argparse
+import hashlib
+import sqlite3
+import concurrent.futures
+
+import Luacache
+import Luaparser
+import Luascope
+
+
+_schema = '''
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    errors INTEGER
+);
+CREATE TABLE IF NOT EXISTS functions (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    parameters TEXT NOT NULL,
+    line INTEGER NOT NULL,
+    local INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS functions_name ON functions(name);
+CREATE INDEX IF NOT EXISTS functions_file ON functions(file_id);
+'''
+
+
+def connect(database):
+    '''
+    Opens the index database and creates its tables if needed.
+        Arguments:
+            <database>  :   path of the SQLite database
+
+        Output:
+            Returns the connection.
+    '''
+    connection = sqlite3.connect(database)
+    connection.execute('PRAGMA foreign_keys = ON')
+    connection.executescript(_schema)
+    return connection
+
+def index(connection, paths, jobs=None, budget=None):
+    '''
+    Updates the index with the lua files found under <paths>. Only new and
+    modified files are parsed.
+        Arguments:
+            <connection>    :   connection returned by connect
+            <paths>         :   files and directories to index
+            <jobs>          :   None by default. Number of processes used to
+                                parse, the number of processors if None
+            <budget>        :   None by default. Work budget of the parse of
+                                each file as the arguments of
+                                Luaparser.set_budget
+
+        Output:
+            Returns a tuple (<parsed files>, <unchanged files>, <removed
+            files>).
+    '''
+    known = {_row[0]: _row[1:] for _row in connection.execute(
+        'SELECT path, mtime, size, hash FROM files')}
+    roots = [os.path.abspath(_p) for _p in paths]
+
+    found = set()
+    todo = []
+    unchanged = 0
+    for path in Luascope.find_files(roots):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        found.add(path)
+        if path in known and known[path][:2] == (stat.st_mtime, stat.st_size):
+            unchanged += 1
+        else:
+            todo.append(path)
+
+    parsed = 0
+    with concurrent.futures.ProcessPoolExecutor(
+            jobs, initializer=Luaparser.set_budget,
+            initargs=budget or ()) as pool:
+        for path, result in zip(todo, pool.map(index_file, todo,
+                                               chunksize=16)):
+            mtime, size, digest, errors, functions = result
+            if path in known and known[path][2] == digest:
+                connection.execute(
+                    'UPDATE files SET mtime = ?, size = ? WHERE path = ?',
+                    (mtime, size, path))
+                unchanged += 1
+                continue
+            store(connection, path, mtime, size, digest, errors, functions)
+            parsed += 1
+
+    removed = 0
+    for path in known:
+        if path not in found and is_under(path, roots):
+            connection.execute('DELETE FROM files WHERE path = ?', (path,))
+            removed += 1
+    connection.commit()
+    return parsed, unchanged, removed
+
+def is_under(path, roots):
+    '''
+    Returns true if <path> is one of <roots> or inside one of them.
+    '''
+    for root in roots:
+        if path == root or path.startswith(root.rstrip(os.sep) + os.sep):
+            return True
+    return False
+
+def index_file(path):
+    '''
+    Parses a file and extracts its declared functions. This is run in the
+    worker processes.
+        Arguments:
+            <path>      :   file to be parsed
+
+        Output:
+            Returns a tuple (<mtime>, <size>, <hash>, <errors>, <functions>).
+            <errors> is the number of errors found, or None if the file could
+            not be lexed or its parse exceeded the work budget. Functions
+            have the format (<name>, <parameters>, <line>, <local>).
+    '''
+    stat = os.stat(path)
+    with open(path, 'rb') as input_file:
+        data = input_file.read()
+    digest = hashlib.sha1(data).hexdigest()
+    try:
+        result = Luacache.parse_content(data)
+    except ValueError:
+        return stat.st_mtime, stat.st_size, digest, None, []
+
+    functions = []
+    for tokens, position in zip(result.functions,
+                                result.function_positions):
+        name, parameters = split_function(tokens)
+        functions.append((name, parameters, position[0], position[2]))
+    errors = len(result.errors) if result.stopped is None else None
+    return stat.st_mtime, stat.st_size, digest, errors, functions
+
+def split_function(tokens):
+    '''
+    Splits the tokens of a declaration as stored in Luaparser.function_list
+    into the qualified name and the parameter list.
+        Arguments:
+            <tokens>    :   tokens from the name to the closing parenthesis
+
+        Output:
+            Returns a tuple (<name>, <parameters>), e.g. ('foo.bar:baz',
+            'a, b').
+    '''
+    text = ''.join(tokens)
+    name, _sep, parameters = text.partition('(')
+    return name, ', '.join(_p for _p in parameters.rstrip(')').split(',')
+                           if _p)
+
+def store(connection, path, mtime, size, digest, errors, functions):
+    '''
+    Replaces the entry of a file and its functions in the index.
+    '''
+    connection.execute('DELETE FROM files WHERE path = ?', (path,))
+    file_id = connection.execute(
+        'INSERT INTO files (path, mtime, size, hash, errors) '
+        'VALUES (?, ?, ?, ?, ?)',
+        (path, mtime, size, digest, errors)).lastrowid
+    connection.executemany(
+        'INSERT INTO functions (file_id, name, parameters, line, local) '
+        'VALUES (?, ?, ?, ?, ?)',
+        [(file_id,) + _f for _f in functions])
+
+def find(connection, name, prefix=False):
+    '''
+    Looks up declared functions by name.
+        Arguments:
+            <connection>    :   connection returned by connect
+            <name>          :   qualified name, e.g. foo.bar:baz
+            <prefix>        :   False by default. If True, returns every
+                                function whose name starts with <name>
+
+        Output:
+            Returns a list of tuples (<name>, <parameters>, <path>, <line>,
+            <local>) sorted by name, path and line.
+    '''
+    query = ('SELECT functions.name, parameters, path, line, local '
+             'FROM functions JOIN files ON files.id = file_id WHERE ')
+    if prefix and name:
+        # A range on the name can use the index, unlike LIKE or GLOB with
+        # arbitrary user input.
+        upper = name[:-1] + chr(ord(name[-1]) + 1)
+        rows = connection.execute(
+            query + 'functions.name >= ? AND functions.name < ? '
+            'ORDER BY functions.name, path, line', (name, upper))
+    elif prefix:
+        rows = connection.execute(
+            query + '1 ORDER BY functions.name, path, line')
+    else:
+        rows = connection.execute(
+            query + 'functions.name = ? ORDER BY path, line', (name,))
+    return [(_n, _p, _f, _l, bool(_loc)) for _n, _p, _f, _l, _loc in rows]
+
+##############################################################################
+
+def main(argv):
+    '''
+    Runs the index from the command line.
+
+        Arguments:
+            argv:       Command line arguments without the program name.
+
+        Output:
+            Prints to stdout.
+    '''
+    arg_parser = argparse.ArgumentParser(
+        description="Index of the functions declared in lua files.")
+    arg_parser.add_argument('--db', default='luaindex.db',
+                            help="index database (default: luaindex.db)")
+    # --db is also accepted after the command. It is not given a default
+    # there, which would replace the one given before the command.
+    database_parser = argparse.ArgumentParser(add_help=False)
+    database_parser.add_argument('--db', default=argparse.SUPPRESS,
+                                 help="index database (default: "
+                                      "luaindex.db)")
+    commands = arg_parser.add_subparsers(dest='command', required=True)
+    index_parser = commands.add_parser('index', parents=[database_parser],
+                                       help="update the index")
+    index_parser.add_argument('paths', nargs='+', metavar='path')
+    index_parser.add_argument('-j', '--jobs', type=int, metavar='N',
+                              help="number of processes used to parse")
+    index_parser.add_argument('--timeout', type=float, metavar='SECONDS',
+                              help="stop the parse of a file after SECONDS "
+                                   "seconds")
+    find_parser = commands.add_parser('find', parents=[database_parser],
+                                      help="look up a function")
+    find_parser.add_argument('name')
+    find_parser.add_argument('--prefix', action='store_true',
+                             help="match all names starting with <name>")
+    args = arg_parser.parse_args(argv)
+
+    connection = connect(args.db)
+    if args.command == 'index':
+        parsed, unchanged, removed = index(connection, args.paths, args.jobs,
+                                           (None, None, None, args.timeout))
+        print("{0} files parsed, {1} unchanged, {2} removed".format(
+            parsed, unchanged, removed))
+    else:
+        rows = find(connection, args.name, args.prefix)
+        for name, parameters, path, line, local in rows:
+            print("{0}:{1}: {2}{3}({4})".format(
+                path, line, 'local ' if local else '', name, parameters))
+        if not rows:
+            sys.exit(1)
+    connection.close()
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,312 @@
+# Generated by Luagrammar.py from lua51.grammar. Do not edit.
+'''
+Table driven LL(1) parser for the lua programming language. It validates a
+token list as built by Luaparser.load and stops at the first error.
+
+    Usage:
+        python3 Luallparser.py <filename>
+'''
+import sys
+import re
+
+
+TERMINALS = (
+    '___eof___', ';', 'do', 'end', 'while', 'repeat', 'until', 'if', 'then',
+    'for', 'NAME', 'function', 'local', 'return', 'break', '=', ',', 'elseif',
+    'else', 'in', '.', ':', '(', ')', '...', 'nil', 'true', 'false', 'NUMBER',
+    'STRING', '[', ']', '{', '}', '-', 'not', '#', '+', '*', '/', '^', '%',
+    '..', '==', '~=', '<=', '>=', '<', '>', 'and', 'or',
+)
+
+NONTERMINALS = (
+    'chunk', 'block', 'optsemi', 'stat', 'laststat', 'retvals', 'exprstat',
+    'varlisttail', 'elseifs', 'elsepart', 'forrest', 'forstep', 'localrest',
+    'localassign', 'namelisttail', 'funcname', 'funcnamedots', 'funcmethod',
+    'namedbody', 'funcbody', 'parlist', 'parnames', 'parnext', 'explist',
+    'explisttail', 'exp', 'simpleexp', 'binoptail', 'suffixedexp',
+    'primaryexp', 'suffixes', 'suffix', 'args', 'argexps', 'tableconstructor',
+    'fieldlist', 'fieldtail', 'fieldsep', 'field', 'fieldassign', 'unop',
+    'binop',
+)
+
+ACTIONS = (
+    'name', 'var', 'call', 'paren', 'expr', 'assignable', 'callstat',
+    'fieldname', 'fbeg', 'fsig', 'fend',
+)
+
+# Right hand sides of the productions, reversed so they can be pushed on the
+# parse stack as they are.
+PRODUCTIONS = (
+    (52,), (52, 53, 54), (53, 55), (), (1,), (3, 52, 2), (3, 52, 2, 76, 4),
+    (76, 6, 52, 5), (3, 60, 59, 52, 8, 76, 7), (61, 10, 9), (69, 66, 101, 11),
+    (63, 12), (57, 79), (56, 13), (14,), (74,), (74, 15, 58, 98), (99,),
+    (58, 98, 79, 16), (59, 52, 8, 76, 17), (52, 18),
+    (3, 52, 2, 62, 76, 16, 76, 15), (3, 52, 2, 74, 19, 65), (76, 16),
+    (69, 10, 101, 11), (64, 65, 10), (74, 15), (65, 10, 16), (68, 67, 10),
+    (67, 10, 20), (10, 21), (103, 3, 52, 102, 23, 71, 22), (3, 52, 23, 71, 22),
+    (72, 10), (24,), (73, 16), (75, 76), (75, 76, 16), (97, 76, 91), (78, 77),
+    (97, 25), (97, 26), (97, 27), (97, 28), (97, 29), (97, 24), (97, 70, 11),
+    (97, 85), (79,), (97, 76, 92), (81, 80), (93, 10), (96, 23, 76, 22),
+    (81, 82), (94, 10, 20), (94, 31, 76, 30), (95, 83, 10, 21), (95, 83),
+    (23, 84, 22), (85,), (29,), (33, 86, 32), (87, 89), (86, 88), (16,),
+    (76, 15, 31, 76, 30), (90, 76), (76, 100, 15), (34,), (35,), (36,), (37,),
+    (38,), (39,), (40,), (41,), (42,), (43,), (44,), (45,), (46,), (47,),
+    (48,), (49,), (50,),
+)
+
+# One row per nonterminal mapping a terminal to a production.
+TABLE = (
+    {0: 0, 2: 0, 4: 0, 5: 0, 7: 0, 9: 0, 10: 0, 11: 0, 12: 0, 13: 0, 14: 0,
+     22: 0},
+    {0: 3, 2: 1, 3: 3, 4: 1, 5: 1, 6: 3, 7: 1, 9: 1, 10: 1, 11: 1, 12: 1,
+     13: 2, 14: 2, 17: 3, 18: 3, 22: 1},
+    {0: 3, 1: 4, 2: 3, 3: 3, 4: 3, 5: 3, 6: 3, 7: 3, 9: 3, 10: 3, 11: 3, 12: 3,
+     13: 3, 14: 3, 17: 3, 18: 3, 22: 3},
+    {2: 5, 4: 6, 5: 7, 7: 8, 9: 9, 10: 12, 11: 10, 12: 11, 22: 12},
+    {13: 13, 14: 14},
+    {0: 3, 1: 3, 3: 3, 6: 3, 10: 15, 11: 15, 17: 3, 18: 3, 22: 15, 24: 15,
+     25: 15, 26: 15, 27: 15, 28: 15, 29: 15, 32: 15, 34: 15, 35: 15, 36: 15},
+    {0: 17, 1: 17, 2: 17, 3: 17, 4: 17, 5: 17, 6: 17, 7: 17, 9: 17, 10: 17,
+     11: 17, 12: 17, 13: 17, 14: 17, 15: 16, 16: 16, 17: 17, 18: 17, 22: 17},
+    {15: 3, 16: 18},
+    {3: 3, 17: 19, 18: 3},
+    {3: 3, 18: 20},
+    {15: 21, 16: 22, 19: 22},
+    {2: 3, 16: 23},
+    {10: 25, 11: 24},
+    {0: 3, 1: 3, 2: 3, 3: 3, 4: 3, 5: 3, 6: 3, 7: 3, 9: 3, 10: 3, 11: 3, 12: 3,
+     13: 3, 14: 3, 15: 26, 17: 3, 18: 3, 22: 3},
+    {0: 3, 1: 3, 2: 3, 3: 3, 4: 3, 5: 3, 6: 3, 7: 3, 9: 3, 10: 3, 11: 3, 12: 3,
+     13: 3, 14: 3, 15: 3, 16: 27, 17: 3, 18: 3, 19: 3, 22: 3},
+    {10: 28},
+    {20: 29, 21: 3, 22: 3},
+    {21: 30, 22: 3},
+    {22: 31},
+    {22: 32},
+    {10: 33, 23: 3, 24: 34},
+    {16: 35, 23: 3},
+    {10: 33, 24: 34},
+    {10: 36, 11: 36, 22: 36, 24: 36, 25: 36, 26: 36, 27: 36, 28: 36, 29: 36,
+     32: 36, 34: 36, 35: 36, 36: 36},
+    {0: 3, 1: 3, 2: 3, 3: 3, 4: 3, 5: 3, 6: 3, 7: 3, 9: 3, 10: 3, 11: 3, 12: 3,
+     13: 3, 14: 3, 16: 37, 17: 3, 18: 3, 22: 3, 23: 3},
+    {10: 39, 11: 39, 22: 39, 24: 39, 25: 39, 26: 39, 27: 39, 28: 39, 29: 39,
+     32: 39, 34: 38, 35: 38, 36: 38},
+    {10: 48, 11: 46, 22: 48, 24: 45, 25: 40, 26: 41, 27: 42, 28: 43, 29: 44,
+     32: 47},
+    {0: 3, 1: 3, 2: 3, 3: 3, 4: 3, 5: 3, 6: 3, 7: 3, 8: 3, 9: 3, 10: 3, 11: 3,
+     12: 3, 13: 3, 14: 3, 15: 3, 16: 3, 17: 3, 18: 3, 22: 3, 23: 3, 31: 3,
+     33: 3, 34: 49, 37: 49, 38: 49, 39: 49, 40: 49, 41: 49, 42: 49, 43: 49,
+     44: 49, 45: 49, 46: 49, 47: 49, 48: 49, 49: 49, 50: 49},
+    {10: 50, 22: 50},
+    {10: 51, 22: 52},
+    {0: 3, 1: 3, 2: 3, 3: 3, 4: 3, 5: 3, 6: 3, 7: 3, 8: 3, 9: 3, 10: 3, 11: 3,
+     12: 3, 13: 3, 14: 3, 15: 3, 16: 3, 17: 3, 18: 3, 20: 53, 21: 53, 22: 53,
+     23: 3, 29: 53, 30: 53, 31: 3, 32: 53, 33: 3, 34: 3, 37: 3, 38: 3, 39: 3,
+     40: 3, 41: 3, 42: 3, 43: 3, 44: 3, 45: 3, 46: 3, 47: 3, 48: 3, 49: 3,
+     50: 3},
+    {20: 54, 21: 56, 22: 57, 29: 57, 30: 55, 32: 57},
+    {22: 58, 29: 60, 32: 59},
+    {10: 15, 11: 15, 22: 15, 23: 3, 24: 15, 25: 15, 26: 15, 27: 15, 28: 15,
+     29: 15, 32: 15, 34: 15, 35: 15, 36: 15},
+    {32: 61},
+    {10: 62, 11: 62, 22: 62, 24: 62, 25: 62, 26: 62, 27: 62, 28: 62, 29: 62,
+     30: 62, 32: 62, 33: 3, 34: 62, 35: 62, 36: 62},
+    {1: 63, 16: 63, 33: 3},
+    {1: 4, 16: 64},
+    {10: 66, 11: 66, 22: 66, 24: 66, 25: 66, 26: 66, 27: 66, 28: 66, 29: 66,
+     30: 65, 32: 66, 34: 66, 35: 66, 36: 66},
+    {1: 3, 15: 67, 16: 3, 33: 3},
+    {34: 68, 35: 69, 36: 70},
+    {34: 68, 37: 71, 38: 72, 39: 73, 40: 74, 41: 75, 42: 76, 43: 77, 44: 78,
+     45: 79, 46: 80, 47: 81, 48: 82, 49: 83, 50: 84},
+)
+
+START = 51
+
+_NT = len(TERMINALS)
+_ACT = _NT + len(NONTERMINALS)
+_EOF = 0
+_UNKNOWN = -1
+
+_ids = {_t: _i for _i, _t in enumerate(TERMINALS)}
+_multi = tuple(sorted((_t for _t in TERMINALS if len(_t) > 1 and
+                       not re.fullmatch('[_A-Za-z0-9]+', _t)),
+                      key=len, reverse=True))
+_name = re.compile('[_A-Za-z][_A-Za-z0-9]*')
+_number = re.compile('-?[0-9]+(\\.[0-9]+)?')
+_string = re.compile('(\"(\\.|[^\"])*\")|(\'(\\.|[^\'])*\')')
+
+
+def classify(token_list, lines=None):
+    '''
+    Converts a token list as built by Luaparser.load to flat lists of token
+    kinds, texts and positions. Punctuation split by the lexer ('..', '==',
+    ...) is merged back into a single token if its characters touch in the
+    source.
+        Arguments:
+            <token_list>    :   list of lines, each being a list of tokens
+            <lines>         :   None by default. Source lines, the line n of
+                                token_list being lines[n - 1]. If None, the
+                                columns of the tokens are not known and
+                                adjacent tokens are merged even if they are
+                                separated by blanks
+
+        Output:
+            Returns a tuple (<kinds>, <texts>, <positions>).
+    '''
+    kinds = []
+    texts = []
+    positions = []
+    for _line_number, _line in enumerate(token_list):
+        _columns = None
+        if lines is not None and 0 < _line_number <= len(lines):
+            _columns = _token_columns(_line, lines[_line_number - 1])
+        i = 0
+        while i < len(_line):
+            _token = _line[i]
+            _width = 1
+            if _token in ('', '___start___'):
+                i += 1
+                continue
+            for _candidate in _multi:
+                _end = i + len(_candidate)
+                if ''.join(_line[i:_end]) == _candidate and (
+                        _columns is None or
+                        _columns[_end - 1] - _columns[i] == _end - i - 1):
+                    _token = _candidate
+                    _width = len(_candidate)
+                    break
+            if _token in _ids:
+                kinds.append(_ids[_token])
+            elif _name.fullmatch(_token):
+                kinds.append(_ids['NAME'])
+            elif _number.fullmatch(_token):
+                kinds.append(_ids['NUMBER'])
+            elif _string.fullmatch(_token):
+                kinds.append(_ids['STRING'])
+            else:
+                kinds.append(_UNKNOWN)
+            texts.append(_token)
+            positions.append((_line_number, i))
+            i += _width
+    if not kinds or kinds[-1] != _EOF:
+        kinds.append(_EOF)
+        texts.append('___eof___')
+        positions.append((len(token_list) - 1, 0))
+    return kinds, texts, positions
+
+def _token_columns(tokens, text):
+    '''
+    Returns the column of each token of a line in its source text. The
+    lexer keeps the tokens as they are written and only drops blanks, so
+    each token is the next occurrence of its text.
+    '''
+    columns = []
+    _column = 0
+    for _token in tokens:
+        _column = text.find(_token, _column)
+        columns.append(_column)
+        _column += len(_token)
+    return columns
+
+def parse_tokens(token_list, lines=None):
+    '''
+    Parses a token list with the generated tables.
+        Arguments:
+            <token_list>    :   list of lines, each being a list of tokens
+            <lines>         :   None by default. Source lines, see classify
+
+        Output:
+            Returns a tuple (<errors>, <functions>). Errors have the format
+            [<line>, <token>, <message>] used by Luaparser.error_list and
+            functions the format used by Luaparser.function_list.
+    '''
+    kinds, texts, positions = classify(token_list, lines)
+    table = TABLE
+    productions = PRODUCTIONS
+    nt = _NT
+    act = _ACT
+    a_name, a_var, a_call, a_paren, a_expr, a_assignable, a_callstat, \
+        a_fieldname, a_fbeg, a_fsig, a_fend = range(act, act + len(ACTIONS))
+
+    errors = []
+    functions = []
+    starts = []
+    signatures = []
+    last = None
+    stack = [_EOF, START]
+    i = 0
+    kind = kinds[0]
+
+    while stack:
+        top = stack.pop()
+        if top < nt:
+            if top != kind:
+                errors.append(_expected(top, texts[i], positions[i]))
+                break
+            if kind != _EOF:
+                i += 1
+                kind = kinds[i]
+        elif top < act:
+            production = table[top - nt].get(kind)
+            if production is None:
+                errors.append(_unexpected(texts[i], positions[i]))
+                break
+            stack.extend(productions[production])
+        elif top == a_expr:
+            last = a_expr
+        elif top == a_name or top == a_var or top == a_call or \
+                top == a_paren:
+            last = top
+        elif top == a_assignable:
+            if last != a_name and last != a_var:
+                errors.append(_error("Invalid variable.", positions[i]))
+                break
+        elif top == a_callstat:
+            if last != a_call:
+                errors.append(_error("Invalid statement.", positions[i - 1]))
+                break
+        elif top == a_fieldname:
+            if last != a_name:
+                errors.append(_error("Invalid field name.", positions[i]))
+                break
+        elif top == a_fbeg:
+            starts.append(i)
+        elif top == a_fsig:
+            signatures.append(i)
+        elif top == a_fend:
+            functions.append(texts[starts.pop():signatures.pop()])
+
+    return errors, functions
+
+def _error(message, position):
+    return [position[0], position[1], message]
+
+def _expected(terminal, text, position):
+    expected = TERMINALS[terminal]
+    if terminal == _EOF:
+        return _error("Invalid statement.", position)
+    if expected in ('NAME', 'NUMBER', 'STRING'):
+        return _error("{0} expected.".format(expected.capitalize()),
+                      position)
+    if re.fullmatch('[a-z]+', expected):
+        return _error("Keyword '{0}' expected.".format(expected), position)
+    return _error("Symbol '{0}' expected.".format(expected), position)
+
+def _unexpected(text, position):
+    if text == '___eof___':
+        return _error("Unexpected end of file.", position)
+    return _error("Unexpected symbol '{0}'.".format(text), position)
+
+
+if __name__ == "__main__":
+    import Luaparser
+    Luaparser.load(sys.argv[1])
+    _errors, _functions = parse_tokens(Luaparser.token_list,
+                                       Luaparser._line_list)
+    Luaparser.error_list.extend(_errors)
+    Luaparser.function_list.extend(_functions)
+    Luaparser.print_errors(sys.argv[1])
+    if not Luaparser.error_list:
+        Luaparser.print_functions()
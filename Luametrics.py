@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+'''
+This script checks a tree of lua files and exports metrics about the run in
+the Prometheus text exposition format, for the monitoring of batch runs.
+
+    Usage:
+        python3 Luametrics.py [--output <file>] [--cache <dir> | --no-cache]
+                              [--timeout S] <path> ...
+
+            Checks the lua files found under the paths and writes the
+            metrics to <file> (to stdout by default). The file is replaced
+            atomically, so it can be read by the textfile collector of the
+            node exporter.
+
+        python3 Luametrics.py --serve PORT [--interval S] <path> ...
+
+            Daemon mode: checks the files every S seconds (3600 by default)
+            and serves the metrics on http://127.0.0.1:PORT/metrics.
+
+    Metrics:
+        lua_files_parsed_total              files checked
+        lua_files_failed_total              files which could not be read or
+                                            lexed
+        lua_files_with_errors_total         files with syntax errors
+        lua_source_bytes_total              bytes of the files checked
+        lua_tokens_total                    tokens of the files checked,
+                                            except the data files checked
+                                            by the fast path, which are not
+                                            lexed
+        lua_fast_path_files_total           files checked by the fast path
+                                            for data files
+        lua_errors_total{message}           syntax errors by message, with
+                                            the numbers of the message
+                                            replaced by N
+        lua_parse_duration_seconds          histogram of the parse time of
+                                            the files not found in the cache
+        lua_cache_hits_total                results read from the cache
+        lua_cache_misses_total              files parsed
+        lua_cache_hit_ratio                 hit ratio of the last run
+        lua_budget_aborts_total             parses stopped by the work budget
+        lua_last_run_timestamp_seconds      end of the last run
+        lua_last_run_duration_seconds       duration of the last run
+
+    The counters add up over the runs of the daemon mode.
+'''
+import sys
+import os
+import re
+import time
+import argparse
+import threading
+import http.server
+
+import Luaparser
+import Luacache
+import Luascope
+
+
+# Upper bounds of the buckets of the parse time histogram, in seconds
+duration_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                    1.0, 2.5, 5.0, 10.0, 30.0)
+
+_counters = (
+    ('lua_files_parsed_total', "Lua files checked."),
+    ('lua_files_failed_total', "Lua files which could not be read or lexed."),
+    ('lua_files_with_errors_total', "Lua files with syntax errors."),
+    ('lua_source_bytes_total', "Bytes of the lua files checked."),
+    ('lua_tokens_total', "Tokens of the lua files checked, except the data "
+                         "files checked without lexing them."),
+    ('lua_fast_path_files_total', "Data files checked by the fast path, "
+                                  "without lexing them."),
+    ('lua_cache_hits_total', "Parse results read from the cache."),
+    ('lua_cache_misses_total', "Lua files parsed."),
+    ('lua_budget_aborts_total', "Parses stopped by the work budget."),
+)
+_gauges = (
+    ('lua_cache_hit_ratio', "Ratio of the results read from the cache in "
+                            "the last run."),
+    ('lua_last_run_duration_seconds', "Duration of the last run."),
+    ('lua_last_run_timestamp_seconds', "Unix time of the end of the last "
+                                       "run."),
+)
+_number = re.compile('[0-9]+')
+
+
+class Metrics:
+    '''
+    Counters and histograms of the checked files.
+        counters:       dictionary from metric name to value
+        errors:         dictionary from normalized error message to count
+        durations:      counts of the parse times in each bucket of
+                        duration_buckets, plus the count above the last one
+        duration_sum:   total parse time
+        gauges:         dictionary from metric name to value for the last run
+    '''
+
+    def __init__(self):
+        self.counters = dict((_name, 0) for _name, _help in _counters)
+        self.errors = {}
+        self.durations = [0] * (len(duration_buckets) + 1)
+        self.duration_sum = 0.0
+        self.gauges = {}
+
+    def observe(self, size, result, seconds=None):
+        '''
+        Records a checked file.
+            Arguments:
+                <size>      :   size of the file in bytes
+                <result>    :   ParseResult of the file
+                <seconds>   :   None by default. Parse time, None if the
+                                result was read from the cache
+        '''
+        self.counters['lua_files_parsed_total'] += 1
+        self.counters['lua_source_bytes_total'] += size
+        if isinstance(result.tokens, Luacache.TokenTable):
+            self.counters['lua_tokens_total'] += result.tokens.count()
+        elif result.tokens is not None:
+            self.counters['lua_tokens_total'] += sum(
+                len(_line) for _line in result.tokens)
+        else:
+            self.counters['lua_fast_path_files_total'] += 1
+        if result.errors:
+            self.counters['lua_files_with_errors_total'] += 1
+        for _error in result.errors:
+            _message = _number.sub('N', _error[2])
+            self.errors[_message] = self.errors.get(_message, 0) + 1
+        if result.stopped is not None:
+            self.counters['lua_budget_aborts_total'] += 1
+        if seconds is None:
+            self.counters['lua_cache_hits_total'] += 1
+            return
+        self.counters['lua_cache_misses_total'] += 1
+        self.duration_sum += seconds
+        for _bucket, _bound in enumerate(duration_buckets):
+            if seconds <= _bound:
+                break
+        else:
+            _bucket = len(duration_buckets)
+        self.durations[_bucket] += 1
+
+    def failed(self):
+        '''
+        Records a file which could not be read or lexed.
+        '''
+        self.counters['lua_files_failed_total'] += 1
+
+    def exposition(self):
+        '''
+        Returns the metrics in the Prometheus text exposition format.
+        '''
+        lines = []
+        for _name, _help in _counters:
+            lines += ["# HELP {0} {1}".format(_name, _help),
+                      "# TYPE {0} counter".format(_name),
+                      "{0} {1}".format(_name, self.counters[_name])]
+
+        lines += ["# HELP lua_errors_total Syntax errors by message.",
+                  "# TYPE lua_errors_total counter"]
+        for _message in sorted(self.errors):
+            lines.append('lua_errors_total{{message="{0}"}} {1}'.format(
+                escape(_message), self.errors[_message]))
+
+        lines += ["# HELP lua_parse_duration_seconds Parse time of the lua "
+                  "files not found in the cache.",
+                  "# TYPE lua_parse_duration_seconds histogram"]
+        _count = 0
+        for _bound, _n in zip(duration_buckets, self.durations):
+            _count += _n
+            lines.append('lua_parse_duration_seconds_bucket{{le="{0}"}} {1}'
+                         .format(_bound, _count))
+        _count += self.durations[-1]
+        lines += ['lua_parse_duration_seconds_bucket{{le="+Inf"}} {0}'
+                  .format(_count),
+                  "lua_parse_duration_seconds_sum {0}".format(
+                      self.duration_sum),
+                  "lua_parse_duration_seconds_count {0}".format(_count)]
+
+        for _name, _help in _gauges:
+            if _name in self.gauges:
+                lines += ["# HELP {0} {1}".format(_name, _help),
+                          "# TYPE {0} gauge".format(_name),
+                          "{0} {1}".format(_name, self.gauges[_name])]
+        return '\n'.join(lines) + '\n'
+
+
+def escape(value):
+    '''
+    Escapes a label value of the text exposition format.
+    '''
+    return value.replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
+
+def check_files(paths, metrics, cache='.luacache'):
+    '''
+    Checks the lua files under a list of files and directories and records
+    them in <metrics>.
+        Arguments:
+            <paths>     :   list of files and directories
+            <metrics>   :   Metrics updated with the files
+            <cache>     :   '.luacache' by default. Directory of the cache
+                            of Luacache, or None to parse every file
+    '''
+    hits = metrics.counters['lua_cache_hits_total']
+    misses = metrics.counters['lua_cache_misses_total']
+    _start = time.perf_counter()
+    for filename in Luascope.find_files(paths):
+        try:
+            with open(filename, 'rb') as input_file:
+                _content = input_file.read()
+        except IOError:
+            metrics.failed()
+            continue
+        result = None
+        if cache is not None:
+            _path = Luacache.cache_path(cache, _content)
+            try:
+                result = Luacache.load(_path)
+            except (IOError, ValueError):
+                pass
+        if result is not None:
+            metrics.observe(len(_content), result)
+            continue
+        _parse_start = time.perf_counter()
+        try:
+            result = Luacache.parse_content(_content)
+        except ValueError:
+            metrics.failed()
+            continue
+        metrics.observe(len(_content), result,
+                        time.perf_counter() - _parse_start)
+        if cache is not None and result.stopped is None:
+            os.makedirs(cache, exist_ok=True)
+            Luacache.dump(result, _path)
+
+    hits = metrics.counters['lua_cache_hits_total'] - hits
+    misses = metrics.counters['lua_cache_misses_total'] - misses
+    metrics.gauges['lua_cache_hit_ratio'] = (hits / (hits + misses)
+                                             if hits + misses else 0.0)
+    metrics.gauges['lua_last_run_duration_seconds'] = \
+        time.perf_counter() - _start
+    metrics.gauges['lua_last_run_timestamp_seconds'] = time.time()
+
+def write(metrics, path):
+    '''
+    Writes the metrics to <path>, replacing it atomically.
+    '''
+    _temp = '{0}.{1}.tmp'.format(path, os.getpid())
+    with open(_temp, 'wt') as output_file:
+        output_file.write(metrics.exposition())
+    os.replace(_temp, path)
+
+def serve(port, paths, cache='.luacache', interval=3600.0):
+    '''
+    Checks the files every <interval> seconds and serves the metrics of the
+    runs on http://127.0.0.1:<port>/metrics. Never returns.
+    '''
+    metrics = Metrics()
+    exposition = [metrics.exposition()]
+
+    class _Handler(http.server.BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            _body = exposition[0].encode()
+            self.send_response(200)
+            self.send_header('Content-Type',
+                             'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(_body)))
+            self.end_headers()
+            self.wfile.write(_body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', port), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    while True:
+        _start = time.monotonic()
+        check_files(paths, metrics, cache)
+        exposition[0] = metrics.exposition()
+        time.sleep(max(0.0, interval - (time.monotonic() - _start)))
+
+##############################################################################
+
+def main(argv):
+    '''
+    Runs the batch check from the command line.
+
+        Arguments:
+            argv:       Command line arguments without the program name.
+
+        Output:
+            Writes the metrics to a file or stdout, or serves them.
+    '''
+    arg_parser = argparse.ArgumentParser(
+        description="Checks lua files and exports metrics in the Prometheus "
+                    "text format.")
+    arg_parser.add_argument('paths', nargs='+', metavar='path')
+    arg_parser.add_argument('-o', '--output', metavar='FILE',
+                            help="file written with the metrics (default: "
+                                 "stdout)")
+    arg_parser.add_argument('--serve', type=int, metavar='PORT',
+                            help="check the files periodically and serve "
+                                 "the metrics on localhost")
+    arg_parser.add_argument('--interval', type=float, default=3600.0,
+                            metavar='SECONDS',
+                            help="time between two runs when serving "
+                                 "(default: 3600)")
+    arg_parser.add_argument('--cache', default='.luacache',
+                            metavar='DIRECTORY',
+                            help="cache directory (default: .luacache)")
+    arg_parser.add_argument('--no-cache', action='store_true',
+                            help="parse every file")
+    arg_parser.add_argument('--timeout', type=float, metavar='SECONDS',
+                            help="stop the parse of a file after SECONDS "
+                                 "seconds")
+    args = arg_parser.parse_args(argv)
+
+    Luaparser.set_budget(seconds=args.timeout)
+    cache = None if args.no_cache else args.cache
+    if args.serve is not None:
+        try:
+            serve(args.serve, args.paths, cache, args.interval)
+        except KeyboardInterrupt:
+            return
+    metrics = Metrics()
+    check_files(args.paths, metrics, cache)
+    if args.output:
+        write(metrics, args.output)
+    else:
+        sys.stdout.write(metrics.exposition())
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,529 @@
+#!/usr/bin/env python3
+'''
+This script minifies lua scripts: comments and the whitespace which does not
+separate tokens are removed, and local variables can be renamed to short
+names. The tokens of the output are the ones of the input and every line
+break is kept, so line numbers in error messages still match the source.
+
+    Usage:
+        python3 Luaminify.py [--rename] [--no-verify] [-o <output>]
+                             <filename>
+
+            Writes the minified script to <output> (to stdout by default).
+            With --rename the local variables, loop variables and
+            parameters are renamed using the scopes found by the parser,
+            which requires the file to parse without errors. The output is
+            verified unless --no-verify is given: it is lexed again and
+            must give the same tokens, and it is parsed again and must give
+            the same errors and, with --rename, every variable must refer
+            to the same declaration. <output> is only replaced when the
+            verification succeeds. The exit status is 1 if the file can not
+            be minified or the verification fails.
+
+    The script is lexed as lua 5.1 by a lexer of its own, as the line lexer
+    of Luaparser does not handle comments, long strings and decimal numbers.
+    The tokens are given to Luaparser as placeholders when the script is
+    parsed. Lexing and writing run in a single pass over the input; renaming
+    needs a parse of the whole file first.
+'''
+import sys
+import os
+import re
+import argparse
+
+import Luaparser
+
+
+keywords = frozenset((
+    'and', 'break', 'do', 'else', 'elseif', 'end', 'false', 'for',
+    'function', 'if', 'in', 'local', 'nil', 'not', 'or', 'repeat', 'return',
+    'then', 'true', 'until', 'while'))
+
+# Tokens of lua 5.1. Numbers are read as llex does: digits and dots, an
+# optional exponent sign, then any letters and digits.
+_token = re.compile(
+    '(?P<space>[ \t\r\n\f\v]+)|'
+    '(?P<long_comment>--\\[(?P<comment_level>=*)\\[)|'
+    '(?P<comment>--[^\n]*)|'
+    '(?P<long_string>\\[(?P<string_level>=*)\\[)|'
+    '(?P<name>[A-Za-z_][A-Za-z0-9_]*)|'
+    '(?P<number>(?:[0-9]|\\.[0-9])[0-9.]*(?:[eE][+-]?)?[A-Za-z0-9_]*)|'
+    '(?P<string>"(?:[^"\\\\\n]|\\\\.)*"|\'(?:[^\'\\\\\n]|\\\\.)*\')|'
+    '(?P<continued>"(?:[^"\\\\\n]|\\\\.)*\\\\\n|'
+    '\'(?:[^\'\\\\\n]|\\\\.)*\\\\\n)|'
+    '(?P<op>\\.\\.\\.|\\.\\.|==|~=|<=|>=|[-+*/%^#<>=(){}\\[\\];:,.])')
+_string_end = {'"': re.compile('(?:[^"\\\\\n]|\\\\.)*"'),
+               "'": re.compile('(?:[^\'\\\\\n]|\\\\.)*\'')}
+_string_more = {'"': re.compile('(?:[^"\\\\\n]|\\\\.)*\\\\\n'),
+                "'": re.compile('(?:[^\'\\\\\n]|\\\\.)*\\\\\n')}
+_word = frozenset('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+                  '0123456789_')
+_first_letters = ('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ_')
+_letters = _first_letters + '0123456789'
+
+
+def tokenize(lines):
+    '''
+    Lexes lua source code.
+        Arguments:
+            <lines>     :   iterable of the lines of the source, with their
+                            line breaks
+
+        Output:
+            Yields tuples (<line number>, <kind>, <text>) where <kind> is
+            'name', 'keyword', 'number', 'string', 'op' or 'comment', and
+            <line number> is the line the token starts on. Long strings and
+            comments are single tokens. Raises ValueError on a character
+            which can not start a token or an unterminated string.
+    '''
+    _open = None
+    _number = 0
+    for _number, _line in enumerate(lines, 1):
+        _offset = 0
+
+        # Continue a long bracket or a string opened on a previous line
+        if _open is not None:
+            _start, _kind, _closer, _parts = _open
+            if _kind in ('string', 'comment'):
+                _end = _line.find(_closer)
+                if _end < 0:
+                    _parts.append(_line)
+                    continue
+                _offset = _end + len(_closer)
+            else:
+                _match = _string_end[_closer].match(_line)
+                if _match is None:
+                    _match = _string_more[_closer].match(_line)
+                    if _match is None:
+                        raise ValueError("Unterminated string at line "
+                                         "{0}.".format(_start))
+                    _parts.append(_line)
+                    continue
+                _offset = _match.end()
+                _kind = 'string'
+            _parts.append(_line[:_offset])
+            yield _start, _kind, ''.join(_parts)
+            _open = None
+
+        _length = len(_line)
+        while _offset < _length:
+            _match = _token.match(_line, _offset)
+            if _match is None:
+                if _line[_offset] in '"\'':
+                    raise ValueError("Unterminated string at line {0}."
+                                     .format(_number))
+                raise ValueError("Unexpected character '{0}' at line {1}."
+                                 .format(_line[_offset], _number))
+            _kind = _match.lastgroup
+            _text = _match.group()
+            _offset = _match.end()
+            if _kind == 'space':
+                continue
+            if _kind in ('long_comment', 'long_string'):
+                _level = _match.group('comment_level' if _kind ==
+                                      'long_comment' else 'string_level')
+                _kind = 'comment' if _kind == 'long_comment' else 'string'
+                _closer = ']' + _level + ']'
+                _end = _line.find(_closer, _offset)
+                if _end < 0:
+                    _open = (_number, _kind, _closer, [_line[_match.start():]])
+                    break
+                _text = _line[_match.start():_end + len(_closer)]
+                _offset = _end + len(_closer)
+            elif _kind == 'continued':
+                _open = (_number, 'continued', _text[0], [_text])
+                break
+            elif _kind == 'name' and _text in keywords:
+                _kind = 'keyword'
+            elif _kind == 'comment':
+                _text = _text.rstrip('\r\n')
+            yield _number, _kind, _text
+
+    if _open is not None:
+        raise ValueError("Unterminated {0} starting at line {1}.".format(
+            'long comment' if _open[1] == 'comment' else 'string', _open[0]))
+
+def separated(previous, token):
+    '''
+    Returns true if <token> must be separated from the token <previous>
+    written before it so that they are not read as other tokens.
+    '''
+    _last = previous[-1]
+    _first = token[0]
+    if _last in _word:
+        return (_first in _word or
+                (_first == '.' and previous[0] in '0123456789.') or
+                (_first in '+-' and _last in 'eE' and
+                 previous[0] in '0123456789.'))
+    if _last == '.':
+        return _first == '.' or _first in '0123456789'
+    if _last == '-':
+        return _first == '-'
+    if _last in '=<>~':
+        return _first == '='
+    if _last == '[':
+        return _first == '[' or _first == '='
+    return False
+
+def minify(lines, renames=None):
+    '''
+    Minifies lua source code.
+        Arguments:
+            <lines>     :   iterable of the lines of the source
+            <renames>   :   None by default. Dictionary from token index (in
+                            the tokens of tokenize without the comments) to
+                            new name, as returned by plan_renames
+
+        Output:
+            Yields the minified code in pieces. Every line break of the
+            source is kept. Raises ValueError if the source can not be
+            lexed.
+    '''
+    _line = 1
+    _previous = None
+    _index = 0
+    _count = [0, False]
+    for _number, _kind, _text in tokenize(_counted(lines, _count)):
+        if _kind == 'comment':
+            continue
+        if renames and _index in renames:
+            _text = renames[_index]
+        _index += 1
+        if _number > _line:
+            yield '\n' * (_number - _line)
+            _line = _number
+        elif _previous is not None and separated(_previous, _text):
+            yield ' '
+        yield _text
+        _line += _text.count('\n')
+        _previous = _text
+    if _count[0] > _line:
+        yield '\n' * (_count[0] - _line)
+    if _count[1]:
+        yield '\n'
+
+def _counted(lines, count):
+    '''
+    Yields <lines>, storing their number and whether the last one ends with a
+    line break in the list <count>.
+    '''
+    count[0] = 0
+    count[1] = False
+    for _line in lines:
+        count[0] += 1
+        count[1] = _line.endswith('\n')
+        yield _line
+
+##############################################################################
+# Parse and scopes
+
+class _Scopes:
+    '''
+    Analysis pass recording the scope events of a parse, in order.
+    '''
+
+    def start(self):
+        self.events = []
+
+    def open_scope(self, position):
+        self.events.append(('open', position, None))
+
+    def close_scope(self, position):
+        self.events.append(('close', position, None))
+
+    def local(self, position, name):
+        self.events.append(('local', position, name))
+
+    def variable(self, position, name, write):
+        self.events.append(('variable', position, name))
+
+
+def parse_tokens(tokens):
+    '''
+    Parses lua tokens with Luaparser. Strings and numbers are given to the
+    parser as the placeholders "" and 0, and operators as their characters
+    as the line lexer of Luaparser does. The errors, and the tokens of the
+    parser, are left in Luaparser until the next parse.
+        Arguments:
+            <tokens>    :   list of tuples (<line number>, <kind>, <text>)
+                            as returned by tokenize, without the comments
+
+        Output:
+            Returns a tuple (<completed>, <positions>, <events>). <completed>
+            is false if the parse was stopped by the work budget.
+            <positions> maps the position of the first parser token of each
+            token to its index in <tokens>, and <events> is the list of the
+            scope events (<kind>, <position>, <name>) of the parse.
+    '''
+    Luaparser.reset()
+    token_list = Luaparser.token_list
+    token_list.append(['___start___'])
+    positions = {}
+    _tokens = []
+    for _index, (_number, _kind, _text) in enumerate(tokens):
+        while len(token_list) < _number:
+            token_list.append(_tokens or [''])
+            Luaparser.index_line(len(token_list) - 1, token_list[-1])
+            _tokens = []
+        positions[(_number, len(_tokens))] = _index
+        if _kind == 'string':
+            _tokens.append('""')
+        elif _kind == 'number':
+            _tokens.append('0')
+        elif _kind == 'op':
+            _tokens.extend(_text)
+        else:
+            _tokens.append(_text)
+    token_list.append(_tokens or [''])
+    Luaparser.index_line(len(token_list) - 1, token_list[-1])
+    token_list.append(['___eof___'])
+    Luaparser.close_index()
+
+    analysis = _Scopes()
+    Luaparser.add_pass(analysis)
+    try:
+        completed = Luaparser.parse_input()
+    finally:
+        Luaparser.remove_pass(analysis)
+    return completed, positions, analysis.events
+
+def resolve(tokens, positions, events):
+    '''
+    Resolves the variables of a parse to their declarations.
+        Arguments:
+            <tokens>    :   tokens given to parse_tokens
+            <positions>, <events>:  as returned by parse_tokens
+
+        Output:
+            Returns a dictionary from the index of each variable token to
+            the index of the token declaring it, or None for a global
+            variable. Implicit declarations such as the 'self' of methods
+            have the index of the token they are attached to.
+    '''
+    references = {}
+    _scopes = [{}]
+    for _kind, _position, _name in events:
+        if _kind == 'open':
+            _scopes.append({})
+        elif _kind == 'close':
+            if len(_scopes) > 1:
+                _scopes.pop()
+        elif _kind == 'local':
+            _scopes[-1][_name] = positions[_position]
+        else:
+            for _scope in reversed(_scopes):
+                if _name in _scope:
+                    references[positions[_position]] = _scope[_name]
+                    break
+            else:
+                references[positions[_position]] = None
+    return references
+
+def plan_renames(tokens):
+    '''
+    Chooses short names for the local variables of a script. A new name is
+    never the name of a global variable used in the script, nor the new name
+    of a declaration visible where it is declared, so no variable can refer
+    to another declaration after renaming. The names are allocated like a
+    stack: a declaration takes the name following the ones of the visible
+    declarations, and the names of a scope are free again when it closes.
+        Arguments:
+            <tokens>    :   list of tuples (<line number>, <kind>, <text>)
+                            as returned by tokenize, without the comments
+
+        Output:
+            Returns a tuple (<renames>, <references>): a dictionary from
+            token index to new name for minify, and the resolution of the
+            variables as returned by resolve. Returns None if the script
+            does not parse without errors; they are then left in
+            Luaparser.error_list.
+    '''
+    completed, positions, events = parse_tokens(tokens)
+    if not completed or Luaparser.error_list:
+        return None
+    references = resolve(tokens, positions, events)
+
+    # Names which must keep their meaning: globals, the implicit 'self' and
+    # the keywords
+    _reserved = set(tokens[_index][2] for _index, _declaration in
+                    references.items() if _declaration is None)
+    _reserved.add('self')
+    _reserved.update(keywords)
+
+    renames = {}
+    _scopes = []
+    _next = 0
+    for _kind, _position, _name in events:
+        if _kind == 'open':
+            _scopes.append(_next)
+        elif _kind == 'close':
+            if _scopes:
+                _next = _scopes.pop()
+        elif _kind == 'local':
+            _index = positions[_position]
+            if tokens[_index][2] == _name:
+                while short_name(_next) in _reserved:
+                    _next += 1
+                renames[_index] = short_name(_next)
+                _next += 1
+
+    for _index, _declaration in references.items():
+        if _declaration in renames:
+            renames[_index] = renames[_declaration]
+    return renames, references
+
+def short_name(number):
+    '''
+    Returns the name number <number> in the sequence a, b, ..., _, aa, ba,
+    ... of all names, shortest first.
+    '''
+    _name = _first_letters[number % len(_first_letters)]
+    _rest = number // len(_first_letters)
+    while _rest:
+        _rest -= 1
+        _name += _letters[_rest % len(_letters)]
+        _rest //= len(_letters)
+    return _name
+
+##############################################################################
+# Verification
+
+def verify(source, output, renames=None, references=None):
+    '''
+    Checks that minified code has the tokens and the meaning of its source.
+        Arguments:
+            <source>    :   iterable of the lines of the source
+            <output>    :   iterable of the lines of the minified code
+            <renames>, <references>:    None by default. As returned by
+                            plan_renames if the locals were renamed
+
+        Output:
+            Returns a list of messages, empty if the output is correct: the
+            tokens of the output, with the new names, must be the tokens of
+            the source, and parsing the output must give the same errors
+            and, if the locals were renamed, resolve every variable to the
+            same declaration. Raises ValueError if the source can not be
+            lexed.
+    '''
+    problems = []
+    _source = [_t for _t in tokenize(source) if _t[1] != 'comment']
+    try:
+        _output = [_t for _t in tokenize(output) if _t[1] != 'comment']
+    except ValueError as exception:
+        return ["Output could not be lexed: {0}".format(exception)]
+    if len(_source) != len(_output):
+        problems.append("Output has {0} tokens instead of {1}.".format(
+            len(_output), len(_source)))
+    for _index, (_token, _result) in enumerate(zip(_source, _output)):
+        _text = renames.get(_index, _token[2]) if renames else _token[2]
+        if (_token[0], _token[1], _text) != _result:
+            problems.append("Token '{0}' of line {1} became '{2}' of line "
+                            "{3}.".format(_text, _token[0], _result[2],
+                                          _result[0]))
+            break
+    if problems:
+        return problems
+
+    _completed, _positions, _events = parse_tokens(_source)
+    _errors = [_e[:3] for _e in Luaparser.error_list]
+    _completed_output, _positions, _events = parse_tokens(_output)
+    if not (_completed and _completed_output):
+        problems.append("Parse stopped: {0}".format(
+            (Luaparser.budget_exceeded or ['', '', ''])[2]))
+    elif _errors != [_e[:3] for _e in Luaparser.error_list]:
+        problems.append("Output does not give the errors of the source.")
+    elif references is not None:
+        if resolve(_output, _positions, _events) != references:
+            problems.append("Variables of the output refer to other "
+                            "declarations.")
+    return problems
+
+##############################################################################
+
+def main(argv):
+    '''
+    Minifies a file from the command line.
+
+        Arguments:
+            argv:       Command line arguments without the program name.
+
+        Output:
+            Writes the minified script to a file or stdout. Exits with status
+            1 if the file can not be minified or the output is not correct.
+    '''
+    arg_parser = argparse.ArgumentParser(
+        description="Minifies a lua script.")
+    arg_parser.add_argument('filename', help="file to be minified")
+    arg_parser.add_argument('-o', '--output', metavar='FILE',
+                            help="file written (default: stdout)")
+    arg_parser.add_argument('--rename', action='store_true',
+                            help="rename local variables to short names")
+    arg_parser.add_argument('--no-verify', action='store_true',
+                            help="do not lex and parse the output again")
+    args = arg_parser.parse_args(argv)
+
+    try:
+        with open(args.filename, 'rt') as input_file:
+            source = input_file.readlines()
+    except IOError:
+        print("{0}: File not found.".format(args.filename), file=sys.stderr)
+        sys.exit(1)
+
+    _temp = None
+    try:
+        renames = references = None
+        if args.rename:
+            renames = plan_renames([_t for _t in tokenize(source)
+                                    if _t[1] != 'comment'])
+            if renames is None:
+                _error = (Luaparser.error_list or
+                          [Luaparser.budget_exceeded])[0]
+                print("{0}: Locals can not be renamed, the parse failed at "
+                      "line {1}: {2}".format(args.filename, _error[0],
+                                              _error[2]), file=sys.stderr)
+                sys.exit(1)
+            renames, references = renames
+
+        # The output is written as it is produced to a temporary file, which
+        # replaces <output> once verified. Written to stdout, it is held
+        # until verified, so that a wrong output is never printed.
+        if args.output:
+            _temp = '{0}.{1}.tmp'.format(args.output, os.getpid())
+            output_file = open(_temp, 'wt')
+        elif args.no_verify:
+            output_file = sys.stdout
+        else:
+            output_file = None
+        output = []
+        try:
+            for _piece in minify(source, renames):
+                if output_file is not None:
+                    output_file.write(_piece)
+                if not args.no_verify:
+                    output.append(_piece)
+        finally:
+            if args.output:
+                output_file.close()
+    except ValueError as exception:
+        print("{0}: {1}".format(args.filename, exception), file=sys.stderr)
+        if _temp is not None:
+            os.remove(_temp)
+        sys.exit(1)
+
+    if not args.no_verify:
+        problems = verify(source, ''.join(output).splitlines(True), renames,
+                          references)
+        if problems:
+            for _problem in problems:
+                print("{0}: {1}".format(args.filename, _problem),
+                      file=sys.stderr)
+            if args.output:
+                os.remove(_temp)
+            sys.exit(1)
+    if args.output:
+        os.replace(_temp, args.output)
+    elif not args.no_verify:
+        sys.stdout.write(''.join(output))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -12,6 +12,41 @@ potential errors in the source code (only context free errors).
 
         if PATH is correctly configured.
 
+    Options:
+        --stream    Parse one top level statement at a time and report errors
+                    and declared functions as soon as they are found. Memory
+                    use does not depend on the size of the file.
+        -j N        Split the file at top level statements and parse the
+                    parts in N processes.
+        --max-tokens N, --max-steps N, --max-depth N, --timeout SECONDS
+                    Stop the parse when it visits more than N tokens, moves
+                    back more than N times, nests more than N blocks and
+                    expressions or takes longer than SECONDS. The errors
+                    found so far are printed with the reason the parse was
+                    stopped and the exit status is 3.
+        --memory    Print the memory used by each phase of the parse (read,
+                    lex, parse and report) after the results.
+        --quick     Screen the file with a single pass over its tokens
+                    instead of parsing it: balance of brackets and blocks,
+                    statements after 'return' or 'break' and unterminated
+                    strings. Comments are left out of the screen. The exit
+                    status is 0 if the file passes, 1 if it fails and 4 if
+                    it needs the full parse (long strings or decimal
+                    numbers).
+        --heat      Count the visits of each token and print the
+                    amplification of the file (visits divided by tokens), its
+                    most amplified lines and the source annotated with the
+                    amplification of each line.
+        --heat-map FILE
+                    Count the visits of each token and write them to FILE in
+                    JSON, with the amplification of the file and its lines.
+        --progress  Show the progress of the parse on stderr. Ctrl-C stops
+                    the parse and prints what was found so far.
+
+    The modes --stream, -j, --memory, --quick, --outline and --heat or
+    --heat-map can not be combined, and --progress is only shown by the
+    parse, --stream, --memory and the heat map.
+
     Note this script can also be used as a module for another program to
     recover the parse(<filename>) function or any other indiviual function
     declared in this code.
@@ -19,8 +54,23 @@ potential errors in the source code (only context free errors).
     Author: 1407176
 '''
 import sys
+import os
 import shlex
 import re
+import json
+import argparse
+import time
+import signal
+import threading
+import tracemalloc
+import concurrent.futures
+import queue
+import functools
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 # Precompile BREs for later use in pattern recognition
@@ -34,1262 +84,3722 @@ binop_1 = re.compile('\+|-|\*|/|\^|%|and|or')
 binop_2 = re.compile('>=|<=|==|~=|\.\.')
 binop_3 = re.compile('<|>')
 fieldsep = re.compile(',|;')
+# Position of the keyword of the last entry of function_position_list,
+# compared with the head when it moves back, or _NO_FUNCTION
+_NO_FUNCTION = (-1, -1)
 
-# Temporary line list for improved lexer. This will be used as temporary
-# storage for each lexed line of input
-_line_list = []
-
-# Storage list for declared functions and global variables used to temporarily
-# store head positions
-function_list = []
-_function_temp_beg = []
-_function_temp_end = []
-_named_function = False
-
-# Storage list for errors found by the parser
-error_list = []
-
-# Storage list for all tokens from the input stream and head position
-# indicators
-token_list = []
-_cl = 0
-_ct = 0
+# Reason a parse stopped by its cancellation token, see set_progress
+CANCELLED = "Parse cancelled."
 
-
-def parse(filename):
+def lex_line(line):
     '''
-    Reads an input file and parses the stream for errors according to the lua
-    programming language.
+    Splits a single line of input into its tokens. Empty lines are represented
+    by a list containing the empty token so that line numbers are preserved.
         Arguments:
-            <filename>  :   file to be parsed
+            <line>      :   line of source code
 
         Output:
-            Prints messages about syntax errors to the console / terminal.
+            Returns the list of tokens on the line.
     '''
+    lexer = shlex.shlex(line)
+    lexer.commenters = ''
+    _temp_token_list = list(lexer)
+    if _temp_token_list:
+        return _temp_token_list
+    return ['']
 
-    # Read source file to line_list and close the file to minimize errors.
-    # This also catches any errors if the file is not found or another I/O
-    # related error occurs.
-    try:
-        with open(filename, 'rt') as input_file:
-            for _line in input_file:
-                _line_list.append(_line)
-        input_file.close()
-    except IOError:
-        print("File not found.")
-        sys.exit(1)
-
-    # Reads input and creates a token list. Each line is a list within the
-    # token list and two symbols are added to indicate the start and the
-    # end of the token stream.
-    token_list.append(['___start___'])
-    for _line in _line_list:
-        _temp_token_list = []
-        lexer = shlex.shlex(_line)
-        lexer.commenters = ''
-        for _token in lexer:
-            _temp_token_list.append(_token)
-        if _temp_token_list:
-            token_list.append(_temp_token_list)
-        else:
-            token_list.append([''])
-    token_list.append(['___eof___'])
-
-    # Reset curent line and curent token indeces
-    global _cl, _ct
-    _cl = 0
-    _ct = 0
-
-    # Parse as long as the eof symbol is not reached and skip over completely
-    # invalid statements.
-    while True:
-        parse_chunk()
-        if get_next_token() == '___eof___':
-            break
-        error("Invalid statement.")
-        next_statement()
-
-    # Print the errors (or "No errors found." if none are found)
-    print_errors(filename)
 
-    # Print the list of declared functions if no errors have been recorded.
-    if len(error_list) == 0:
-        print_functions()
+##############################################################################
+# Pre-scan
+# The pre-scan splits whole lines into the tokens lex_line returns, without
+# the character by character loop of shlex. Outside quotes, shlex returns
+# every run of word characters and every other character but whitespace as
+# a token. Lines with a quote are left to lex_line, which handles strings
+# and the quotes found in comments. With NumPy the characters of many lines
+# are classified at once, otherwise each line is split by a regular
+# expression.
+
+# Maximum number of characters classified at once by the NumPy pre-scan
+PRESCAN_CHARS = 1 << 22
+
+_prescan_token = re.compile('[_A-Za-z0-9]+|[^ \t\r\n]')
+
+# Classes of the characters for the NumPy pre-scan, indexed by code point.
+# Every code point from 128 is classified as the last entry.
+_OTHER, _WORD, _SPACE, _QUOTE = range(4)
+_prescan_classes = None
+if numpy is not None:
+    _prescan_classes = numpy.full(129, _OTHER, dtype=numpy.uint8)
+    for _character in ('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+                       '0123456789_'):
+        _prescan_classes[ord(_character)] = _WORD
+    for _character in ' \t\r\n':
+        _prescan_classes[ord(_character)] = _SPACE
+    for _character in '"\'':
+        _prescan_classes[ord(_character)] = _QUOTE
+
+def prescan(lines, vectorized=True):
+    '''
+    Splits lines into their tokens as lex_line does.
+        Arguments:
+            <lines>         :   list of lines
+            <vectorized>    :   True by default. Whether NumPy is used. It is
+                                not used if it is not installed
 
+        Output:
+            Returns the list of the token lists of the lines. Raises
+            ValueError as lex_line if a quote is not closed.
+    '''
+    if not vectorized or numpy is None:
+        return [_prescan_line(_line) for _line in lines]
+    if not lines:
+        return []
+
+    # The lines are classified in chunks of about PRESCAN_CHARS characters.
+    line_ends = numpy.cumsum(numpy.fromiter(map(len, lines), dtype=numpy.int64,
+                                            count=len(lines)))
+    bounds = [0] + (numpy.unique(numpy.searchsorted(line_ends, numpy.arange(
+        PRESCAN_CHARS, line_ends[-1], PRESCAN_CHARS))) + 1).tolist()
+    if bounds[-1] != len(lines):
+        bounds.append(len(lines))
+    tokens = []
+    for _start, _end in zip(bounds, bounds[1:]):
+        _line_starts = numpy.concatenate(([0], line_ends[_start:_end]))
+        if _start:
+            _line_starts -= line_ends[_start - 1]
+        tokens.extend(_prescan_numpy(lines[_start:_end], _line_starts))
+    return tokens
+
+def _prescan_line(line):
+    '''
+    Returns the tokens of a line as lex_line, with a regular expression if
+    the line has no quote.
+    '''
+    if '"' in line or "'" in line:
+        return lex_line(line)
+    return _prescan_token.findall(line) or ['']
+
+def _prescan_numpy(lines, line_starts):
+    '''
+    Returns the token lists of lines as lex_line, classifying their
+    characters with NumPy. <line_starts> holds the offset of each line in
+    their concatenation, followed by its length.
+    '''
+    text = ''.join(lines)
+    codes = numpy.frombuffer(text.encode('utf-32-le', 'surrogatepass'),
+                             dtype=numpy.uint32)
+    classes = _prescan_classes[numpy.minimum(codes, 128)]
+
+    # joined[i] is true if the characters i and i + 1 are in the same word.
+    # Words never continue on the next line, even without a newline.
+    word = classes == _WORD
+    joined = word[1:] & word[:-1]
+    _breaks = line_starts[1:-1]
+    joined[_breaks[(_breaks > 0) & (_breaks < len(codes))] - 1] = False
+    token = classes != _SPACE
+    starts = numpy.flatnonzero(token & ~numpy.concatenate(([False], joined)))
+    ends = numpy.flatnonzero(token & ~numpy.concatenate((joined, [False])))
+    offsets = numpy.zeros(len(lines) + 1, dtype=numpy.int64)
+    numpy.cumsum(numpy.bincount(
+        numpy.searchsorted(line_starts, starts, 'right') - 1,
+        minlength=len(lines)), out=offsets[1:])
+
+    # The characters of the tokens are copied with a newline after each
+    # token, which is never part of a token, so that the strings are made by
+    # a single split.
+    kept = numpy.flatnonzero(token)
+    last = numpy.zeros(len(codes), dtype=numpy.int64)
+    last[ends] = 1
+    last = last[kept]
+    packed = numpy.full(len(kept) + len(ends), 10, dtype=numpy.uint32)
+    packed[numpy.arange(len(kept)) + numpy.cumsum(last) - last] = codes[kept]
+    strings = packed.tobytes().decode('utf-32-le',
+                                      'surrogatepass').split('\n')
+    tokens = [strings[_start:_end] or [''] for _start, _end in
+              zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+    for _line in numpy.unique(numpy.searchsorted(
+            line_starts, numpy.flatnonzero(classes == _QUOTE),
+            'right') - 1).tolist():
+        tokens[_line] = lex_line(lines[_line])
+    return tokens
 
 
 ##############################################################################
-# Individual parse functions
+# Bracket and block matching
 
-def parse_block():
-    '''
-    Parses the production:
-            <block> -> <chunk>
-
-        Arguments:
-            None
+_match_closers = {'(': ')', '[': ']', '{': '}', 'function': 'end',
+                  'do': 'end', 'if': 'end', 'repeat': 'until'}
+_match_tokens = frozenset(_match_closers) | frozenset(_match_closers.values())
+_code_scan = re.compile('"(?:\\\\.|[^"\\\\\\n])*"?|'
+                        '\'(?:\\\\.|[^\'\\\\\\n])*\'?|'
+                        '--(?:\\[(=*)\\[)?|\\[(=*)\\[')
 
-        Output:
-            Returns true if the parse could be completed
+def token_columns(tokens, text):
     '''
-    return parse_chunk()
-
-def parse_chunk():
+    Returns the column of each token of a line in its text. The lexer keeps
+    the tokens as they are written and only drops blanks, so each token is
+    the next occurrence of its text.
     '''
-    Parses the production:
-            <chunk> -> {<stat> [;]} [<laststat> [;]]
+    columns = []
+    _column = 0
+    for _token in tokens:
+        _column = text.find(_token, _column)
+        columns.append(_column)
+        _column += len(_token)
+    return columns
 
-        Arguments:
-            None
 
-        Output:
-            Returns true if the parse could be completed
-    '''
-    _save = position_get()
-    while parse_stat():
-        if match(';'):
-            pass
-        else:
-            red_position()
-    if parse_laststat():
-        if match(';'):
-            pass
-        else:
-            red_position()
-    return True
+##############################################################################
+# Quick screen
+# The quick screen checks what can be decided by a single pass over the
+# tokens: balance of brackets and blocks (from the index built while
+# lexing), statements following a 'return' or 'break' in the same block and
+# strings or long brackets left open. It does not run the parser. Comments
+# are skipped with the mask of code_tokens, as the bracket index does.
+_quick_keywords = frozenset((
+    'and', 'break', 'do', 'else', 'elseif', 'end', 'false', 'for',
+    'function', 'if', 'in', 'local', 'nil', 'not', 'or', 'repeat', 'return',
+    'then', 'true', 'until', 'while'))
+_quick_enders = frozenset(('end', 'until', 'else', 'elseif', '___eof___'))
+_quick_statements = frozenset(('local', 'while', 'for', 'do', 'repeat', 'if',
+                               'return', 'break', '='))
+_quick_values = frozenset(('nil', 'true', 'false', 'function', '...'))
+_quick_closed = frozenset(('nil', 'true', 'false', 'end', ')', ']', '}'))
+_quick_openers = frozenset(_match_closers)
+_quick_closers = frozenset(_match_closers.values())
 
-def parse_stat():
+def _quick_token(tokens, text, column):
     '''
-    Parses the production:
-            <stat> -> <varlist> = <explist>
-                    | <functioncall>
-                    | do <block> end
-                    | while <exp> do <block> end
-                    | repeat <block> until <exp>
-                    | if <exp> then <block> {elseif <exp> then <block>}
-                        [else <block>] end
-                    | for <name> = <exp> , <exp> [, <exp>] do <block> end
-                    | for <namelist> in <explist> do <block> end
-                    | function <funcname> <funcbody>
-                    | local function <name> <funcbody>
-                    | local <namelist> [= <explist>]
-
-        Arguments:
-            None
-
-        Output:
-            Returns true if the parse could be completed
+    Returns the number of the first token of a line starting at or after
+    <column> of its text, or 0.
     '''
-    global _function_temp_beg, _named_function
-    _save = position_get()
-    if parse_varlist() and match('='):
-        skip_and_test("Invalid expression list.", parse_explist,
-                      last_stat=True)
-        return True
-
-    elif position_set(_save) and parse_functioncall():
-        return True
+    for _number, _column in enumerate(token_columns(tokens, text)):
+        if _column >= column:
+            return _number
+    return 0
 
-    elif position_set(_save) and match('do') and parse_block():
-        skip_and_test("Invalid statement. Keyword 'end' expected.", match,
-                      'end')
-        return True
+def _quick_comparison(tokens, index):
+    '''
+    Returns true if the token at <index> is an '=' of a comparison operator,
+    which the lexer splits into single characters.
+    '''
+    return tokens[index] == '=' and (
+        index > 0 and tokens[index - 1] in ('=', '<', '>', '~') or
+        index + 1 < len(tokens) and tokens[index + 1] == '=')
 
-    elif position_set(_save) and match('while'):
-        skip_and_test("Invalid expression.", parse_exp)
-        skip_and_test("Invalid statement. Keyword 'do' expected.", match,
-                      'do')
-        parse_block()
-        skip_and_test("Invalid statement. Keyword 'end' expected.", match,
-                      'end')
-        return True
+def _quick_closes(token):
+    '''
+    Returns true if <token> can end an expression: an operand, a string or a
+    closing bracket or 'end'.
+    '''
+    return (token in _quick_closed or token[0] in '"\'' or
+            _quick_operand(token))
 
-    elif position_set(_save) and match('repeat') and parse_block():
-        skip_and_test("Invalid statement. Keyword 'until' expected.", match,
-                      'until')
-        skip_and_test("Invalid expression.", parse_exp, last_stat=True)
+def _quick_operand(token):
+    '''
+    Returns true if <token> is a name, a number or a value keyword, which
+    can neither follow nor be followed by another one in an expression.
+    '''
+    if token in _quick_values:
         return True
+    _first = token[0]
+    return ((_first.isalpha() or _first == '_' or _first.isdigit()) and
+            token not in _quick_keywords)
 
-    elif position_set(_save) and match('if'):
-        skip_and_test("Invalid expression.", parse_exp)
-        skip_and_test("Invalid statement. Keyword 'then' expected.", match,
-                      'then')
-        parse_block()
-        _save00 = position_get()
-
-        while True:
-            if match('elseif'):
-                skip_and_test("Invalid expression.", parse_exp)
-                skip_and_test("Invalid statement. Keyword 'then' expected.",
-                              match, 'then')
-            elif (position_set(_save00) and (not inc_position()) and
-                  parse_exp() and match('then')):
-                _temp = position_get()
-                position_set(_save00)
-                inc_position()
-                error("Keyword 'elseif' expected.")
-                position_set(_temp)
-            else:
-                break
-            parse_block()
-            _save00 = position_get()
-
-        if position_set(_save00) and match('else') and parse_block():
-            pass
-        else:
-            red_position()
 
-        skip_and_test("Invalid statement. Keyword 'end' expected.", match,
-                      'end')
-        return True
+##############################################################################
+# Outline
+# The outline lists the declared functions of a source without parsing it,
+# so it also works on files with syntax errors. The text is split into
+# tokens by a single regular expression which skips comments and strings,
+# and blocks are followed by their opening and closing keywords.
+_outline_token = re.compile(
+    '(?P<long>-?-?\\[(?P<level>=*)\\[(?:.*?\\](?P=level)\\]|.*))|'
+    '(?P<comment>--[^\\n]*)|'
+    '(?P<string>"(?:\\\\.|[^"\\\\\\n])*"?|\'(?:\\\\.|[^\'\\\\\\n])*\'?)|'
+    '(?P<newline>\\n)|'
+    '(?P<token>[_A-Za-z][_A-Za-z0-9]*|[0-9][.0-9A-Za-z_]*|\\.\\.\\.|\\S)',
+    re.DOTALL)
+_outline_openers = frozenset(('function', 'do', 'if', 'repeat'))
+_outline_closers = frozenset(('end', 'until'))
+
+def _outline_declaration(tokens, first):
+    '''
+    Reads '<funcname>(<parameters>)' from the token at <first> in a list of
+    (<line>, <token>) pairs.
+        Arguments:
+            <tokens>    :   tokens of the source
+            <first>     :   index of the token following 'function'
 
-    elif position_set(_save) and match('for'):
-        if parse_name() and match('='):
-            skip_and_test("Invalid expression.", parse_exp)
-            skip_and_test("Missing comma after expression.", match, ',')
-            skip_and_test("Invalid expression.", parse_exp)
-            if match(','):
-                skip_and_test("Invalid expression.", parse_exp)
+        Output:
+            Returns the tokens of the declaration, or None if the tokens do
+            not form a function name and a parameter list.
+    '''
+    declared = []
+    _expected = 'name'
+    for _line, _token in tokens[first:first + 2048]:
+        declared.append(_token)
+        if _expected == 'name' or _expected == 'method':
+            if not (name.fullmatch(_token) and _token not in _quick_keywords):
+                return None
+            _expected = 'dot' if _expected == 'name' else 'open'
+        elif _expected == 'dot':
+            if _token == '.' or _token == ':':
+                _expected = 'name' if _token == '.' else 'method'
+            elif _token == '(':
+                _expected = 'parameter'
             else:
-                red_position()
-
-            skip_and_test("Invalid statement. Keyword 'do' expected.", match,
-                          'do')
-            parse_block()
-            skip_and_test("Invalid statement. Keyword 'end' expected.", match,
-                          'end')
-            return True
-
-        elif parse_namelist():
-            skip_and_test("Invalid statement. Keyword 'in' expected.", match,
-                          'in')
-            skip_and_test("Invalid expression list.", parse_explist)
-            skip_and_test("Invalid statement. Keyword 'do' expected.", match,
-                          'do')
-            parse_block()
-            skip_and_test("Invalid statement. Keyword 'end' expected", match,
-                          'end')
-            return True
-
-        else:
-            position_set(_save)
-            return False
-
-    elif position_set(_save) and match('function') and parse_funcname():
-        _named_function = True
-        if parse_funcbody():
-
-            _function_temp_beg = _save
-            save_function()
-
-            return True
-        else:
-            position_set(_save)
-            return False
-
-    elif position_set(_save) and match('local'):
-        _save00 = position_get()
-        if match('function') and parse_name():
-            _named_function = True
-            if parse_funcbody():
-
-                _function_temp_beg = _save00
-                save_function()
-
-                return True
-        elif position_set(_save00) and parse_namelist():
-            if match('='):
-                skip_and_test("Invalid expression list.", parse_explist)
+                return None
+        elif _expected == 'open':
+            if _token != '(':
+                return None
+            _expected = 'parameter'
+        elif _token == ')':
+            return declared
+        elif _expected == 'parameter':
+            if _token == '...':
+                _expected = 'close'
+            elif name.fullmatch(_token) and _token not in _quick_keywords:
+                _expected = 'comma'
             else:
-                red_position()
-            return True
+                return None
+        elif _expected == 'comma' and _token == ',':
+            _expected = 'parameter'
         else:
-            position_set(_save)
-            return False
-
-    else:
-        position_set(_save)
-        return False
+            return None
+    return None
 
-def parse_laststat():
+def print_outline(functions):
     '''
-    Parses the production:
-            <laststat> -> return [<explist>]
-                        | break
+    Prints the declarations returned by outline, indented by their nesting,
+    with their line ranges.
 
         Arguments:
-            None
+            functions:  List returned by outline.
 
         Output:
-            Returns true if the parse could be completed
+            Prints to stdout.
     '''
-    _save = position_get()
-    if match('return'):
-        if parse_explist():
-            pass
-        return True
-    elif position_set(_save) and match('break'):
-        return True
-    else:
-        position_set(_save)
-        return False
+    print("Declared functions:")
+    _depths = []
+    for _tokens, _line, _end, _local, _parent in functions:
+        _depths.append(0 if _parent is None else _depths[_parent] + 1)
+        print("{0}{1}{2}  lines {3}-{4}".format(
+            '  ' * (_depths[-1] + 1), 'local ' if _local else '',
+            ''.join(_tokens), _line, '?' if _end is None else _end))
 
-def parse_field():
-    '''
-    Parses the production:
-            <field> -> '[' <exp> ']'  = <exp>
-                     | <name> = <exp>
-                     | <exp>
+
+##############################################################################
+# Fast path for data files
+# Data only files are checked by rewriting them with a few regular expression
+# passes. Literals are replaced by placeholders, then tables only made of
+# placeholders are folded into a value placeholder until none is left. Each
+# pass runs over the whole text without going back to python for every token.
+_DATA_VALUE = '\x01'
+_DATA_NAME = '\x02'
+_DATA_RETURN = '\x03'
+
+# Maximum nesting of tables handled by the fast path. Deeper files are left to
+# the parser so the number of passes stays bounded.
+_DATA_MAX_DEPTH = 200
+
+_data_ws = '[ \t\r\n]*'
+_data_start = re.compile('[ \t\r\n]*(?:$|return(?![_A-Za-z0-9])|'
+                         '[_A-Za-z][_A-Za-z0-9]*[ \t\r\n]*=)')
+_data_literal = re.compile('"[^"\\\\\n]*"|\'[^\'\\\\\n]*\'|'
+                           '\\b(?:[0-9]+\\b(?!\\.)|true\\b|false\\b|nil\\b)',
+                           re.ASCII)
+_data_invalid = re.compile('\\b(?:and|break|do|else|elseif|end|for|function|'
+                           'if|in|local|not|or|repeat|then|until|while)\\b|'
+                           '\\b[0-9]', re.ASCII)
+_data_return = re.compile('\\breturn\\b', re.ASCII)
+_data_name = re.compile('\\b[_A-Za-z][_A-Za-z0-9]*', re.ASCII)
+_data_negative = re.compile('-[ \t\r]*' + _DATA_VALUE)
+_data_field = ('(?:(?:' + _DATA_NAME + _data_ws + '|\\[' + _data_ws +
+               _DATA_VALUE + _data_ws + '\\]' + _data_ws + ')=' + _data_ws +
+               ')?' + _DATA_VALUE)
+_data_table = re.compile('\\{' + _data_ws + '(?:' + _data_field + '(?:' +
+                         _data_ws + '[,;]' + _data_ws + _data_field +
+                         ')*(?:' + _data_ws + '[,;])?' + _data_ws + ')?\\}')
+_data_chunk = re.compile('(?:' + _data_ws + _DATA_NAME + _data_ws + '=' +
+                         _data_ws + _DATA_VALUE + '[ \t\r]*;?[ \t\r]*' +
+                         '(?=\\n|$))*' + _data_ws + '(?:' + _DATA_RETURN +
+                         _data_ws + _DATA_VALUE + '?)?' + _data_ws)
+
+def check_data(text):
+    '''
+    Checks a file made only of literal data without running the parser. Such
+    files are a list of assignments <name> = <value> each ending its line,
+    optionally followed by a single return <value>. Values are tables,
+    strings, integers, booleans or nil and table keys are names or values.
+    The check gives up as soon as anything else is found, so a negative answer
+    only means the file has to go through the parser.
 
         Arguments:
-            None
+            text:       Content of the file.
 
         Output:
-            Returns true if the parse could be completed
+            Returns true if the file is valid. In this case parse() would
+            report neither errors nor declared functions.
     '''
-    _save = position_get()
-    if match('\['):
-        skip_and_test("Invalid expression.", parse_exp)
-        skip_and_test("Closing braket expected.", match, '\]')
-        skip_and_test("Invalid statement. Equal sign expected.", match, '=')
-        skip_and_test("Invalid expression.", parse_exp)
-        return True
-    elif position_set(_save) and parse_name() and match('='):
-        skip_and_test("Invalid expression.", parse_exp)
-        return True
-    elif position_set(_save) and parse_exp():
-        return True
-    else:
-        position_set(_save)
+    if (not _data_start.match(text) or _DATA_VALUE in text or
+            _DATA_NAME in text or _DATA_RETURN in text):
         return False
 
-def parse_fieldlist():
-    '''
-    Parses the production:
-            <fieldlist> -> <field> {<fieldsep> <field>} [<fieldsep>]
-
-        Arguments:
-            None
-
-        Output:
-            Returns true if the parse could be completed
-    '''
-    _save = position_get()
-    if parse_field():
-        while parse_fieldsep() and parse_field():
-            pass
-        return True
+    text = _data_literal.sub(_DATA_VALUE, text)
+    if _data_invalid.search(text):
+        return False
+    if 'return' in text:
+        text = _data_return.sub(_DATA_RETURN, text)
+    text = _data_name.sub(_DATA_NAME, text)
+    if '-' in text:
+        text = _data_negative.sub(_DATA_VALUE, text)
+
+    for _depth in range(_DATA_MAX_DEPTH):
+        _folded = _data_table.sub(_DATA_VALUE, text)
+        if _folded == text:
+            break
+        text = _folded
     else:
-        position_set(_save)
         return False
 
-def parse_tableconstructor():
-    '''
-    Parses the production:
-            <tableconstructor> -> '{' [fieldlist] '}'
+    return _data_chunk.fullmatch(text) is not None
 
-        Arguments:
-            None
 
-        Output:
-            Returns true if the parse could be completed
-    '''
-    _save = position_get()
-    if match('\{'):
-        if parse_fieldlist():
-            skip_and_test("Closing curly brace expected.", match, '\}')
-            return True
-        elif match('\}'):
-            return True
-    else:
-        position_set(_save)
-        return False
+##############################################################################
+# Memory profiling
 
-def parse_functioncall():
+def _measure(phases, phase, function, *args):
     '''
-    Parses the production:
-            <functioncall> -> <name> <prefixexp_bis> <args> <functioncall_bis>
-                            | ( <exp> ) <prefixexp_bis> <args> <functioncall_bis>
-                            | <name> <prefixexp_bis> : <name> <args> <functioncall_bis>
-                            | ( <exp> ) <prefixexp_bis> : <name> <args> <functioncall_bis>
-
+    Runs one phase of profile_memory and appends its measures to <phases>.
+    The memory used before the phase is kept under 'before' so that the peak
+    of the whole parse can be computed.
         Arguments:
-            None
+            <phases>    :   list of the measures of the previous phases
+            <phase>     :   name of the phase
+            <function>  :   function running the phase and its <args>
 
         Output:
-            Returns true if the parse could be completed
+            Returns the result of <function>.
     '''
-    _save = position_get()
-    if parse_name() and parse_prefixexp_bis():
-        if match(':') and parse_name():
-            pass
-        else:
-            red_position()
-
-        if parse_args():
-            pass
-        else:
-            position_set(_save)
-            return False
-
-        parse_functioncall_bis()
-        return True
-    elif position_set(_save) and match('\('):
-        skip_and_test("Invalid expression.", parse_exp)
-        skip_and_test("Closing parenthesis expected.", match, '\)')
-        parse_prefixexp_bis()
-        if parse_args():
-            pass
-        if match(':') and parse_name():
-            pass
-        else:
-            position_set(_save)
-            return False
-
-        parse_functioncall_bis()
-        return True
-    else:
-        position_set(_save)
-        return False
+    tracemalloc.reset_peak()
+    _before = tracemalloc.get_traced_memory()[0]
+    _result = function(*args)
+    _current, _peak = tracemalloc.get_traced_memory()
+    phases.append({'phase': phase, 'peak': _peak - _before,
+                   'retained': _current - _before, 'before': _before})
+    return _result
 
-def parse_functioncall_bis():
+def print_memory(profile):
     '''
-    Parses the production:
-            <functioncall_bis> -> <prefixexp_bis> <args> <functioncall_bis>
-                                | <prefixexp_bis> : <name> <args> <functioncall_bis>
-                                | None
+    Prints a memory profile returned by profile_memory.
 
         Arguments:
-            None
+            profile:    Dictionary returned by profile_memory.
 
         Output:
-            Returns true if the parse could be completed
+            Prints to stdout.
     '''
-    _save = position_get()
-    parse_prefixexp_bis()
+    print("\nMemory use ({0} bytes, {1} lines, {2} tokens, {3} errors, "
+          "{4} functions):".format(profile['source_bytes'], profile['lines'],
+                                   profile['tokens'], profile['errors'],
+                                   profile['functions']))
+    for _phase in profile['phases']:
+        print("  {0:<8}peak {1:>12} bytes   retained {2:>12} bytes".format(
+            _phase['phase'], _phase['peak'], _phase['retained']))
+    print("  {0:<8}peak {1:>12} bytes   retained {2:>12} bytes".format(
+        'total', profile['peak'], profile['retained']))
+    print("  {0:.1f} bytes peak and {1:.1f} bytes retained per source "
+          "byte".format(profile['peak_per_source_byte'],
+                        profile['retained_per_source_byte']))
 
-    if parse_args():
-        pass
-    elif match(':') and parse_name() and parse_args():
-        pass
-    else:
-        position_set(_save)
-        return True
-
-    parse_functioncall_bis()
-    return True
-
-def parse_prefixexp():
-    '''
-    Parses the production:
-            <prefixexp> -> <name> <prefixexp_bis>
-                         | <functioncall> <prefixexp_bis>
-                         | ( <exp> ) <prefixexp_bis>
 
+##############################################################################
+# Parallel parse
+# Keywords and brackets changing the nesting depth and words allowed to start
+# a statement at which a file may be split.
+_openers = frozenset(('function', 'do', 'if', 'repeat', '(', '[', '{'))
+_closers = frozenset(('end', 'until', ')', ']', '}'))
+_starters = frozenset(('do', 'while', 'repeat', 'if', 'for', 'function',
+                       'local'))
+# Strings, comments and long brackets are matched first, as by code_tokens,
+# so that the words and brackets they contain are skipped.
+_depth_token = re.compile(_code_scan.pattern +
+                          '|[_A-Za-z][_A-Za-z0-9]*|[(){}\\[\\]]')
+_first_word = re.compile('[ \t\r]*([_A-Za-z][_A-Za-z0-9]*)')
+
+# Files are split in about this many parts per process, but parts are never
+# shorter than _PART_MIN_LINES lines.
+_PARTS_PER_JOB = 4
+_PART_MIN_LINES = 2000
+
+def find_boundaries(lines, parts):
+    '''
+    Finds the lines at which the input can be split. A line can start a part
+    if it starts with a statement keyword or a name while no block, bracket
+    or parenthesis is open. The words and brackets of strings and comments
+    are skipped, and no line inside a long string or comment is a split.
+    No split is made after a top level return or break as everything
+    following them is an error.
         Arguments:
-            None
+            <lines>     :   lines of the input
+            <parts>     :   wanted number of parts
 
         Output:
-            Returns true if the parse could be completed
-    '''
-    _save = position_get()
-    if parse_functioncall():
-        parse_prefixexp_bis()
-    elif position_set(_save) and parse_name():
-        parse_prefixexp_bis()
-    elif position_set(_save) and match('\('):
-        skip_and_test("Invalid expression.", parse_exp)
-        skip_and_test("Closing parenthesis expected.", match, '\)')
-        parse_prefixexp_bis()
-    else:
-        position_set(_save)
-        return False
-
-    return True
+            Returns the sorted list of indices of the first line of each part,
+            starting with 0.
+    '''
+    step = max(len(lines) // max(parts, 1), _PART_MIN_LINES)
+    starts = [0]
+    depth = 0
+    # Level of the long string or comment left open by the previous line
+    long_level = None
+    for number, line in enumerate(lines):
+        _start = 0
+        if long_level is not None:
+            _end = line.find(']' + long_level + ']')
+            if _end < 0:
+                continue
+            _start = _end + len(long_level) + 2
+            long_level = None
+        elif depth == 0 and number >= starts[-1] + step:
+            _match = _first_word.match(line)
+            if _match and (_match.group(1) in _starters or
+                           not re.fullmatch(keyword, _match.group(1))):
+                starts.append(number)
+        while True:
+            _match = _depth_token.search(line, _start)
+            if _match is None:
+                break
+            _start = _match.end()
+            _token = _match.group()
+            _level = _match.group(1)
+            if _level is None:
+                _level = _match.group(2)
+            if _level is not None:
+                _end = line.find(']' + _level + ']', _start)
+                if _end < 0:
+                    long_level = _level
+                    break
+                _start = _end + len(_level) + 2
+            elif _token[:2] == '--':
+                break
+            elif _token in _openers:
+                depth += 1
+            elif _token in _closers:
+                depth -= 1
+            elif depth == 0 and (_token == 'return' or _token == 'break'):
+                return starts
+    return starts
 
-def parse_prefixexp_bis():
+def _share_budget(budget, lines, total):
     '''
-    Parses the production:
-            <prefixexp_bis> -> '[' <exp> ']' <prefixexp_bis>
-                             | . <name> <prefixexp_bis>
-                             | None
-
-        Arguments:
-            None
-
-        Output:
-            Returns true if the parse could be completed
+    Returns the work budget of a part of <lines> lines of an input of <total>
+    lines: its share of the token visits and backtracking steps of <budget>,
+    as returned by get_budget, and the same nesting depth and time limit.
     '''
-    _save = position_get()
-    if match('\['):
-        skip_and_test("Invalid expression.", parse_exp)
-        skip_and_test("Closing braket expected.", match, '\]')
-        parse_prefixexp_bis()
-    elif position_set(_save) and match('\.') and parse_name():
-        parse_prefixexp_bis()
-    else:
-        position_set(_save)
-        return True
-
-    return True
+    return tuple(None if _limit is None else
+                 max(_limit * lines // max(total, 1), 1)
+                 for _limit in budget[:2]) + budget[2:]
 
-def parse_args():
+def _parse_in_worker(part):
     '''
-    Parses the production:
-            <args> -> ( [<explist>] )
-                    | <tableconstructor>
-                    | <string>
+    Parses a part of the input with the default parser of a worker process,
+    see Parser._parse_part.
+    '''
+    return _parser._parse_part(part)
+
 
+##############################################################################
+# Thread parse
+# A thread parses with a parser of its own, so no mutable state is shared
+# between threads. Parsers are kept in _parsers while they are idle and
+# reused by later parses.
+_parsers = queue.SimpleQueue()
+
+def parse_isolated(lines):
+    '''
+    Parses lines with a parser of their own, so that several threads can
+    parse at the same time. The work budget is the one set by set_budget
+    when the parse starts. The analyses registered with add_pass are not
+    run.
         Arguments:
-            None
+            <lines>     :   lines of the input
 
         Output:
-            Returns true if the parse could be completed
-    '''
-    _save = position_get()
-    if match('\('):
-        if parse_explist() and match('\)'):
-            return True
-        elif match('\)'):
-            return True
-        else:
-            position_set(_save)
-            return False
-    elif position_set(_save) and parse_tableconstructor():
-        return True
-    elif position_set(_save) and parse_string():
-        return True
-    else:
-        position_set(_save)
-        return False
-
-def parse_var():
+            Returns a tuple (<errors>, <functions>, <budget exceeded>) as
+            parse_lines_parallel. Raises ValueError if the lines can not be
+            lexed.
     '''
-    Parses the production:
-            <var>  -> <name>
-                    | <prefixexp> '[' <exp> ']'
-                    | <prefixexp> . <name>
-
+    parser = _acquire_parser()
+    try:
+        parser.set_budget(*get_budget())
+        parser._line_list.extend(lines)
+        parser.lex()
+        parser.parse_input()
+        errors = [_error[:3] + [parser.token_list[_error[0]]]
+                  for _error in parser.error_list]
+        functions = parser.function_list
+        stopped = parser.budget_exceeded
+        if stopped is not None:
+            stopped = stopped[:3] + [parser.token_list[stopped[0]]]
+        return errors, functions, stopped
+    finally:
+        parser.reset()
+        _parsers.put(parser)
+
+def parse_many(sources, threads=None):
+    '''
+    Parses several inputs in a pool of threads with parse_isolated. The
+    sources are not copied, which makes threads cheaper than processes for
+    many small inputs, and on a free-threaded interpreter they also parse in
+    parallel.
         Arguments:
-            None
+            <sources>   :   list of file names and of lists of lines
+            <threads>   :   None by default. Number of threads. If None, the
+                            number of processors on a free-threaded
+                            interpreter and 1 otherwise, as threads taking
+                            turns on the interpreter lock only add switches
 
         Output:
-            Returns true if the parse could be completed
+            Returns the list of the results of parse_isolated in the order of
+            <sources>, None for a file which can not be read or lexed.
     '''
-    _save = position_get()
-    if parse_prefixexp() and match('\['):
-        skip_and_test("Invalid expression.", parse_exp)
-        skip_and_test("Closing braket expected.", match, '\]')
-        return True
-    elif position_set(_save) and parse_prefixexp():
-        return True
-    elif position_set(_save) and parse_name():
-        return True
-    else:
-        position_set(_save)
-        return False
+    if threads is None:
+        threads = 1 if gil_enabled() else os.cpu_count() or 1
+    with concurrent.futures.ThreadPoolExecutor(threads) as pool:
+        return list(pool.map(_parse_source, sources))
 
-def parse_varlist():
+def gil_enabled():
     '''
-    Parses the production:
-            <varlist> -> <var> {, <var>}
-
-        Arguments:
-            None
+    Returns false on a free-threaded interpreter running without its global
+    interpreter lock, true otherwise.
+    '''
+    return getattr(sys, '_is_gil_enabled', lambda: True)()
 
-        Output:
-            Returns true if the parse could be completed
+def _parse_source(source):
     '''
-    _save = position_get()
-    if parse_var():
-        while match(','):
-            skip_and_test("Invalid variable.", parse_var)
-        red_position()
-        return True
-    else:
-        position_set(_save)
-        return False
+    Parses a source of parse_many. This is run in the threads of the pool.
+    '''
+    try:
+        if isinstance(source, str):
+            with open(source, 'rt') as input_file:
+                source = input_file.readlines()
+        return parse_isolated(source)
+    except (IOError, ValueError):
+        return None
 
-def parse_exp():
+def _acquire_parser():
     '''
-    Parses the production:
-            <exp>  -> nil <exp_bis>
-                    | true <exp_bis>
-                    | false <exp_bis>
-                    | <number> <exp_bis>
-                    | <string> <exp_bis>
-                    | ... <exp_bis>
-                    | <function> <exp_bis>
-                    | <prefixexp> <exp_bis>
-                    | <tableconstructor> <exp_bis>
-                    | <unop> <exp> <exp_bis>
+    Returns an idle parser, making a new one if there is none.
+    '''
+    try:
+        return _parsers.get_nowait()
+    except queue.Empty:
+        return Parser()
 
-        Arguments:
-            None
 
-        Output:
-            Returns true if the parse could be completed
-    '''
-    _save = position_get()
-    if match('nil') and parse_exp_bis():
-        return True
-    elif position_set(_save) and match('false') and parse_exp_bis():
-        return True
-    elif position_set(_save) and match('true') and parse_exp_bis():
-        return True
-    elif position_set(_save) and parse_number() and parse_exp_bis():
-        return True
-    elif position_set(_save) and parse_string() and parse_exp_bis():
-        return True
-    elif position_set(_save) and parse_tripledot() and parse_exp_bis():
-        return True
-    elif position_set(_save) and parse_function() and parse_exp_bis():
-        return True
-    elif position_set(_save) and parse_prefixexp() and parse_exp_bis():
-        return True
-    elif (position_set(_save) and parse_tableconstructor() and
-          parse_exp_bis()):
-        return True
-    elif (position_set(_save) and parse_unop() and parse_exp() and
-          parse_exp_bis()):
-        return True
-    else:
-        position_set(_save)
-        return False
+##############################################################################
+# Streaming parse
+
+class _TokenStream:
+    '''
+    Replacement for token_list used by parse_stream. Lines are lexed when the
+    parser first reaches them and dropped when released. Line numbers are
+    kept, so the parse functions can use it like the token list.
+    '''
+
+    def __init__(self, parser, lines):
+        self._parser = parser
+        self._lines = iter(lines)
+        self._tokens = [['___start___']]
+        self._base = 0
+        self._done = False
+
+    def __len__(self):
+        # One line more than lexed is announced until the end of the input
+        # is reached, which makes inc_position move to it.
+        return self._base + len(self._tokens) + (0 if self._done else 1)
+
+    def __getitem__(self, index):
+        while index >= self._base + len(self._tokens) and not self._done:
+            _line = next(self._lines, None)
+            if _line is None:
+                self._tokens.append(['___eof___'])
+                self._done = True
+                self._parser.close_index()
+            else:
+                _tokens = lex_line(_line)
+                self._tokens.append(_tokens)
+                self._parser.index_line(
+                    self._base + len(self._tokens) - 1, _tokens,
+                    code=self._parser.code_tokens(_tokens, _line))
+        if index < self._base:
+            raise IndexError("Line {0} was already released.".format(index))
+        return self._tokens[index - self._base]
+
+    def release(self, index):
+        '''
+        Drops all lines before line <index>.
+        '''
+        if index > self._base:
+            del self._tokens[:index - self._base]
+            for _line in range(self._base, index):
+                self._parser.match_index.pop(_line, None)
+            self._base = index
 
-def parse_exp_bis():
-    '''
-    Parses the production:
-            <exp_bis>  -> <binop> <exp> <exp_bis>
-                        | None
 
-        Arguments:
-            None
+##############################################################################
+# Analysis passes
 
-        Output:
-            Returns true if the parse could be completed
-    '''
-    _save = position_get()
-    if parse_binop() and parse_exp():
-        parse_exp_bis()
-        return True
-    else:
-        position_set(_save)
-        return True
+_pass_events = ('statement', 'function', 'name', 'open_scope', 'close_scope',
+                'local', 'variable')
 
-def parse_explist():
-    '''
-    Parses the production:
-            <explist> -> {<exp> ,} <exp>
 
-        Arguments:
-            None
+##############################################################################
+# Work budget
 
-        Output:
-            Returns true if the parse could be completed
+class BudgetExceeded(Exception):
     '''
-    _save = position_get()
-    if parse_exp():
-        while match(','):
-            skip_and_test("Invalid expression.", parse_exp)
-        red_position()
-        return True
-    else:
-        position_set(_save)
-        return False
-
-def parse_function():
+    Raised by the parse functions to stop a parse when a limit of the work
+    budget is exceeded.
     '''
-    Parses the production:
-            <function> -> function <funcbody>
+    pass
 
-        Arguments:
-            None
 
-        Output:
-            Returns true if the parse could be completed
-    '''
-    _save = position_get()
-    if match('function') and parse_funcbody():
-        return True
-    else:
-        position_set(_save)
-        return False
+##############################################################################
+# Heat map
 
-def parse_funcbody():
+def write_heat_map(filename, summary, path):
     '''
-    Parses the production:
-            <funcbody> -> ( [<parlist>] ) <block> end
-
+    Writes a heat map to a JSON file.
         Arguments:
-            None
+            filename:   Name of the parsed file, stored in the heat map.
+            summary:    Dictionary returned by heat_summary.
+            path:       JSON file written.
 
         Output:
-            Returns true if the parse could be completed
+            None
     '''
-    global _function_temp_end, _named_function
-    _save = position_get()
-    if match('\('):
-        _save00 = position_get()
-        if parse_parlist():
-            skip_and_test("Missing closing parenthesis.", match, '\)')
-            if _named_function:
-                _function_temp_end = position_get()
-                _named_function = False
+    with open(path, 'wt') as output_file:
+        json.dump(dict(summary, file=filename), output_file)
+        output_file.write('\n')
+
+
+##############################################################################
+# Parser
+
+class Parser:
+    '''
+    State of a parse and the functions running it. Each parser parses one
+    input at a time with its own token list, results, work budget, progress
+    callback, heat map and analyses, so parsers can be used by several
+    threads at the same time. The functions of the module of the same names
+    use the default parser of the module, see the Default parser section.
+    '''
+
+    def __init__(self):
+        # Temporary line list for improved lexer. This will be used as
+        # temporary storage for each lexed line of input
+        self._line_list = []
+
+        # Storage list for declared functions and global variables used to
+        # temporarily store head positions
+        self.function_list = []
+        self.function_position_list = []
+        self._last_function = _NO_FUNCTION
+        self._function_temp_beg = []
+        self._function_temp_end = []
+        self._named_function = False
+        self._method_body = False
+
+        # Index of matching brackets and blocks built while lexing. match_index
+        # maps a line number to a dictionary from the token numbers of the
+        # openers and closers on the line to the position of their partner.
+        # Openers and closers without partner are stored in unbalanced_list as
+        # errors with the tokens of their line, [<line>, <token>, <message>,
+        # <line tokens>].
+        self.match_index = {}
+        self.unbalanced_list = []
+        self._match_stack = []
+
+        # Level ('=' signs) of the long comment or long string left open by the
+        # lines given to code_tokens so far, or None
+        self._long_level = None
+
+        # Analysis passes registered with add_pass, the events at least one of
+        # them handles and the events of the current parse not delivered yet,
+        # with format (<head position>, <event>, <arguments>).
+        self._passes = []
+        self._subscribed = frozenset()
+        self._scoping = False
+        self._events = []
+
+        # Storage list for errors found by the parser
+        self.error_list = []
+
+        # Storage list for all tokens from the input stream and head position
+        # indicators
+        self.token_list = []
+        self._cl = 0
+        self._ct = 0
+
+        # Work budget of a parse. A limit set to None is not checked. When a
+        # limit is exceeded the parse stops and budget_exceeded holds the
+        # position where it stopped and the reason, with the same format as an
+        # error.
+        self.max_token_visits = None
+        self.max_backtracking_steps = None
+        self.max_nesting_depth = None
+        self.max_seconds = None
+        self.budget_exceeded = None
+
+        # Counters of the current parse and limits in the form checked by the
+        # parse functions
+        self._visits = 0
+        self._steps = 0
+        self._depth = 0
+        self._visit_limit = float('inf')
+        self._step_limit = float('inf')
+        self._depth_limit = float('inf')
+        self._deadline = None
+
+        # Progress callback and cancellation token of a parse, see
+        # set_progress, and the state of the current parse. _watching is true
+        # if either is set.
+        self.progress_callback = None
+        self.progress_interval = 0.01
+        self.cancel_token = None
+        self._watching = False
+        self._progress_total = None
+        self._progress_step = 1
+        self._progress_line = 0
+
+        # Heat map of a parse, see set_heat_map: visits of each token position,
+        # indexed like token_list, or None if the visits are not counted.
+        self.heat_map_enabled = False
+        self._heat = None
+
+    def parse(self, filename, fast_path=True):
+        '''
+        Reads an input file and parses the stream for errors according to the
+        lua programming language.
+            Arguments:
+                <filename>  :   file to be parsed
+                <fast_path> :   True by default. Allows data only files to be
+                                checked by check_data instead of the parser
+                                when no analysis is registered with add_pass
+
+            Output:
+                Prints messages about syntax errors to the console / terminal.
+        '''
+
+        # Read the source file. Files only made of literal data are checked by
+        # the fast path, anything else is lexed and parsed.
+        self.read(filename)
+        if (fast_path and not self._passes and
+            check_data(''.join(self._line_list))):
+            self.print_errors(filename)
+            self.print_functions()
+            return
+        self.lex()
+        self.parse_input()
+
+        # Print the errors (or "No errors found." if none are found)
+        self.print_errors(filename)
+
+        # Print the list of declared functions if no errors have been recorded.
+        if len(self.error_list) == 0 and self.budget_exceeded is None:
+            self.print_functions()
+
+
+
+    def parse_input(self):
+        '''
+        Parses token_list from its start to the ___eof___ symbol. Errors and
+        declared functions are stored in error_list and function_list.
+            Arguments:
+                None
+
+            Output:
+                Returns false if the parse was stopped because the work budget
+                was exceeded or it was cancelled, see set_progress. The reason
+                is then stored in budget_exceeded.
+        '''
+
+        # Reset curent line and curent token indeces
+        self._cl = 0
+        self._ct = 0
+        self.start_budget()
+        self.start_watch()
+        self.start_heat()
+        self.notify_passes('start')
+
+        # Parse as long as the eof symbol is not reached and skip over
+        # completely invalid statements.
+        _completed = True
+        try:
+            while True:
+                self.parse_chunk()
+                if self.get_next_token() == '___eof___':
+                    break
+                self.error("Invalid statement.")
+                self.next_statement()
+        except BudgetExceeded:
+            _completed = False
+        except RecursionError:
+            self.budget_stop_message("Parse stopped. Maximum nesting depth of "
+                                     "the interpreter reached.")
+            _completed = False
+        if _completed and self._progress_total is not None:
+            self.progress_callback(1.0)
+
+        self.dispatch_events()
+        self.notify_passes('finish')
+        return _completed
+
+    def load(self, filename):
+        '''
+        Reads an input file to _line_list and lexes it to token_list.
+            Arguments:
+                <filename>  :   file to be read
+
+            Output:
+                None
+        '''
+        self.read(filename)
+        self.lex()
+
+    def read(self, filename):
+        '''
+        Reads an input file to _line_list.
+            Arguments:
+                <filename>  :   file to be read
+
+            Output:
+                None
+        '''
+
+        # Read source file to line_list and close the file to minimize errors.
+        # This also catches any errors if the file is not found or another I/O
+        # related error occurs.
+        try:
+            with open(filename, 'rt') as input_file:
+                for _line in input_file:
+                    self._line_list.append(_line)
+            input_file.close()
+        except IOError:
+            print("File not found.")
+            sys.exit(1)
+
+    def lex(self, line_offset=0):
+        '''
+        Lexes _line_list to token_list. Each line is a list within the token
+        list and two symbols are added to indicate the start and the end of the
+        token stream. The lines are split by prescan.
+            Arguments:
+                <line_offset>   :   0 by default. Number of lines preceding
+                                    _line_list in the file, see index_line
+
+            Output:
+                None
+        '''
+        self.token_list.append(['___start___'])
+        for _line, _tokens in zip(self._line_list, prescan(self._line_list)):
+            self.token_list.append(_tokens)
+            self.index_line(len(self.token_list) - 1, _tokens, line_offset,
+                            self.code_tokens(_tokens, _line))
+        self.token_list.append(['___eof___'])
+        self.close_index()
+
+
+    def reset(self):
+        '''
+        Clears the state left by a previous parse so that several files can be
+        parsed by the same process.
+            Arguments:
+                None
+
+            Output:
+                None
+        '''
+        self._line_list = []
+        self.token_list = []
+        self.error_list = []
+        self.function_list = []
+        self.function_position_list = []
+        self._last_function = _NO_FUNCTION
+        self._function_temp_beg = []
+        self._function_temp_end = []
+        self._named_function = False
+        self._method_body = False
+        self._cl = 0
+        self._ct = 0
+        self.budget_exceeded = None
+        self.match_index = {}
+        self.unbalanced_list = []
+        self._match_stack = []
+        self._long_level = None
+        self._events = []
+        self._heat = None
+
+
+    ##########################################################################
+    # Bracket and block matching
+
+    def index_line(self, line_number, tokens, line_offset=0, code=None):
+        '''
+        Adds the openers and closers of a lexed line to match_index. Blocks are
+        opened by 'function', 'do', 'if' and 'repeat' ('while' and 'for' blocks
+        are opened by their 'do', and an 'if' and its 'elseif' share the same
+        'end'). Lines must be indexed in order.
+            Arguments:
+                <line_number>   :   line number of the tokens in token_list
+                <tokens>        :   tokens of the line
+                <line_offset>   :   0 by default. Number of lines preceding
+                                    token_list in the file, added to the line
+                                    numbers shown in messages
+                <code>          :   None by default. List returned by
+                                    code_tokens for the line. Tokens which are
+                                    not code, such as those of comments, are
+                                    not indexed
+
+            Output:
+                None
+        '''
+        if _match_tokens.isdisjoint(tokens):
+            return
+        for _number, _token in enumerate(tokens):
+            if code is not None and not code[_number]:
+                continue
+            if _token in _match_closers:
+                self._match_stack.append((line_number, _number, _token, tokens,
+                                          line_number + line_offset))
+            elif _token in _match_tokens:
+                self._close_match(line_number, _number, _token, tokens)
+
+    def code_tokens(self, tokens, text):
+        '''
+        Tells which tokens of a line are code rather than part of a comment or
+        of a long string. A long comment or string left open by the previous
+        line is followed, so the lines of a file must be given in order.
+            Arguments:
+                <tokens>    :   tokens of the line, as returned by lex_line
+                <text>      :   text of the line
+
+            Output:
+                Returns a list with a boolean per token, or None if all the
+                tokens are code.
+        '''
+        if self._long_level is None and '--' not in text and '[' not in text:
+            return None
+        spans = []
+        _start = 0
+        if self._long_level is not None:
+            _end = text.find(']' + self._long_level + ']')
+            if _end < 0:
+                return [False] * len(tokens)
+            _start = _end + len(self._long_level) + 2
+            spans.append((0, _start))
+            self._long_level = None
+        while True:
+            _match = _code_scan.search(text, _start)
+            if _match is None:
+                break
+            _start = _match.end()
+            if _match.group()[0] in '"\'':
+                continue
+            _level = _match.group(1)
+            if _level is None:
+                _level = _match.group(2)
+            if _level is None:
+                spans.append((_match.start(), len(text)))
+                break
+            _end = text.find(']' + _level + ']', _start)
+            if _end < 0:
+                spans.append((_match.start(), len(text)))
+                self._long_level = _level
+                break
+            _start = _end + len(_level) + 2
+            spans.append((_match.start(), _start))
+        if not spans:
+            return None
+        return [not any(_span[0] <= _column < _span[1] for _span in spans)
+                for _column in token_columns(tokens, text)]
+
+    def _close_match(self, line_number, token_number, closer, tokens):
+        '''
+        Pairs a closer with the innermost open opener of its kind. Openers
+        opened after this one are left unclosed.
+            Arguments:
+                <line_number>, <token_number>:  position of the closer
+                <closer>        :   closing token
+                <tokens>        :   tokens of the line of the closer
+
+            Output:
+                None
+        '''
+        for _index in range(len(self._match_stack) - 1, -1, -1):
+            if _match_closers[self._match_stack[_index][2]] == closer:
+                break
+        else:
+            self.unbalanced_list.append([line_number, token_number,
+                                         "Unexpected '{0}', no matching '{1}' "
+                                         "is open.".format(closer, "' or '"
+                                         .join(_o for _o in _match_closers
+                                               if _match_closers[_o] ==
+                                               closer)),
+                                         tokens])
+            return
+        while len(self._match_stack) > _index + 1:
+            self._unclosed(self._match_stack.pop())
+        _line, _token = self._match_stack.pop()[:2]
+        self.match_index.setdefault(_line, {})[_token] = (line_number,
+                                                          token_number)
+        self.match_index.setdefault(line_number, {})[token_number] = (_line,
+                                                                      _token)
+
+    def _unclosed(self, opener):
+        '''
+        Records an opener left without closer in unbalanced_list.
+        '''
+        _line, _token, _text, _tokens, _shown = opener
+        self.unbalanced_list.append([_line, _token,
+                                     "Unclosed '{0}' opened at line {1}."
+                                     .format(_text, _shown), _tokens])
+
+    def close_index(self):
+        '''
+        Records the openers still open at the end of the input as unclosed.
+            Arguments:
+                None
+
+            Output:
+                None
+        '''
+        for _opener in self._match_stack:
+            self._unclosed(_opener)
+        del self._match_stack[:]
+
+    def matching_position(self, position):
+        '''
+        Returns the position of the token matching an opener or a closer, for
+        example the ')' closing a '(' or the 'function' a 'end' belongs to.
+            Arguments:
+                <position>  :   position with format (<line_number>,
+                                <token_number>)
+
+            Output:
+                Returns the position of the partner, or None if the token has
+                no partner.
+        '''
+        return self.match_index.get(position[0], {}).get(position[1])
+
+    def skip_construct(self):
+        '''
+        Moves the head over the bracketed expression, table or block opened by
+        the next token to its closer, without visiting the tokens in between.
+        This is used by the error recovery, which looks for the end of a
+        statement or for an expected token: those of a nested construct, such
+        as the ';' of a table or the 'end' of a function, are not the ones
+        looked for. Only constructs opened on the line of the head and closed
+        on the same line are skipped: the recovery stops at the end of the
+        line, and the closer of a later line may not be lexed yet by
+        parse_stream.
+            Arguments:
+                None
+
+            Output:
+                Returns true if the head was moved.
+        '''
+        _next = self.next_position((self._cl, self._ct))
+        if _next[0] != self._cl:
+            return False
+        _partner = self.match_index.get(self._cl, {}).get(_next[1])
+        if _partner is None or _partner[0] != self._cl or _partner < _next:
+            return False
+        return self.position_set(_partner)
+
+
+    ##########################################################################
+    # Quick screen
+
+    def quick_check(self):
+        '''
+        Screens _line_list with a single linear pass over its tokens instead of
+        parsing it. token_list and match_index are built as by lex, so
+        parse_input can be run afterwards without lexing again. The tokens of
+        comments and long strings are left out of the screen.
+            Arguments:
+                None
+
+            Output:
+                Returns a tuple (<verdict>, <notes>). <verdict> is 'fail' if
+                errors were found, they are then stored in error_list, 'full'
+                if the file contains constructs the screen can not vouch for,
+                long strings and decimal numbers, and 'pass' otherwise. <notes>
+                lists these constructs as [<line>, <token>, <message>].
+        '''
+        notes = []
+        _long = None
+        # Results of code_tokens for each line of token_list
+        _codes = [None]
+        self.token_list.append(['___start___'])
+        for _number, _line in enumerate(self._line_list, 1):
+            try:
+                _tokens = lex_line(_line)
+            except ValueError:
+                _tokens = ['']
+                self.error_list.append([_number, 0, "Unterminated string.",
+                                        [_line.rstrip('\n')]])
+            self.token_list.append(_tokens)
+            _code = self.code_tokens(_tokens, _line)
+            _codes.append(_code)
+            self.index_line(_number, _tokens, code=_code)
+
+            # Long strings and comments are searched in the text of the line,
+            # as the lexer splits them into tokens.
+            _start = 0
+            if _long is not None:
+                _end = _line.find(']' + _long[2] + ']')
+                if _end < 0:
+                    continue
+                _start = _end + len(_long[2]) + 2
+                _long = None
+            while True:
+                _match = _code_scan.search(_line, _start)
+                if _match is None:
+                    break
+                _start = _match.end()
+                _text = _match.group()
+                if _text[0] in '"\'':
+                    continue
+                _level = _match.group(1)
+                if _level is None:
+                    _level = _match.group(2)
+                if _level is None:
+                    break
+                if _text[0] == '[':
+                    notes.append([_number, _quick_token(
+                        _tokens, _line, _match.start()), "Long string."])
+                _end = _line.find(']' + _level + ']', _start)
+                if _end < 0:
+                    _long = (_number, _quick_token(_tokens, _line,
+                                                   _match.start()),
+                             _level, _text[0] == '-')
+                    break
+                _start = _end + len(_level) + 2
+            if '.' in _tokens:
+                for _index in range(1, len(_tokens) - 1):
+                    if (_tokens[_index] == '.' and
+                        _tokens[_index - 1][0].isdigit()
+                            and _tokens[_index + 1][0].isdigit() and
+                            (_code is None or _code[_index])):
+                        notes.append([_number, _index - 1, "Decimal number."])
+        self.token_list.append(['___eof___'])
+        _codes.append(None)
+        self.close_index()
+        if _long is not None:
+            self.error_list.append([_long[0], _long[1],
+                                    "Unterminated long {0}.".format(
+                                        "comment" if _long[3] else
+                                        "string")])
+
+        self.error_list.extend(self.unbalanced_list)
+        self._quick_statements_after_last(_codes)
+        if self.error_list:
+            self.error_list.sort(key=lambda _error: _error[:2])
+            return 'fail', notes
+        return ('full' if notes else 'pass'), notes
+
+    def _quick_statements_after_last(self, codes):
+        '''
+        Records an error for each 'return' or 'break' followed by a statement
+        in the same block. A 'return' may be followed by an expression list
+        which is followed by the end of the block, a 'break' by the end of the
+        block only. The tokens of nested brackets and blocks are skipped by
+        following the depth of openers and closers, so each token is looked at
+        once. <codes> holds the result of code_tokens for each line of
+        token_list, and the tokens which are not code are skipped.
+        '''
+        # Entries of _pending are [<depth>, <keyword>, <last token at the
+        # depth>, <semicolon seen>] for the last statements whose block is
+        # still open.
+        _pending = []
+        _depth = 0
+        for _line, _tokens in enumerate(self.token_list):
+            _code = codes[_line]
+            for _index, _token in enumerate(_tokens):
+                if _token == '' or _code is not None and not _code[_index]:
+                    continue
+                if _pending and _pending[-1][0] == _depth:
+                    _entry = _pending[-1]
+                    if _token in _quick_enders:
+                        _pending.pop()
+                    elif _token == ';' and not _entry[3]:
+                        _entry[3] = True
+                    elif (_entry[3] or _entry[1] == 'break' or
+                          (_token in _quick_statements and
+                           not _quick_comparison(_tokens, _index)) or
+                          (_quick_operand(_token) and _entry[2] is not None and
+                           _quick_closes(_entry[2]))):
+                        self.error_list.append([
+                            _line, _index, "Statement after '{0}', keyword "
+                            "'end' expected.".format(_entry[1])])
+                        _pending.pop()
+                if _token in _quick_openers:
+                    _depth += 1
+                elif _token in _quick_closers:
+                    _depth -= 1
+                    while _pending and _pending[-1][0] > _depth:
+                        _pending.pop()
+                if _pending and _pending[-1][0] == _depth:
+                    _pending[-1][2] = _token
+                if _token == 'return' or _token == 'break':
+                    _pending.append([_depth, _token, None, False])
+
+    def print_quick(self, filename, verdict, notes):
+        '''
+        Prints the result of quick_check.
+
+            Arguments:
+                filename:   File name used for the error leader.
+                verdict:    'pass', 'fail' or 'full'.
+                notes:      Constructs which need the full parse.
+
+            Output:
+                Prints to stdout.
+        '''
+        if verdict == 'fail':
+            self.print_errors(filename)
+        elif verdict == 'full':
+            print("Full parse needed\n")
+            for _note in notes:
+                self.print_error(filename, _note)
         else:
-            skip_and_test("Missing closing parenthesis", match, '\)')
-            if _named_function:
-                _function_temp_end = position_get()
-                _named_function = False
-
-        parse_block()
-        skip_and_test("Invalid statement. Keyword 'end' expected.", match,
-                      'end')
+            print("Quick check passed")
+
+
+    ##########################################################################
+    # Outline
+
+    def outline(self, lines=None):
+        '''
+        Finds the declarations 'function <funcname>(...)' and 'local function
+        <name>(...)' of a source with a single pass over its tokens. Anonymous
+        functions are not listed but are followed for the nesting.
+            Arguments:
+                <lines>     :   None by default. Lines of source code,
+                                _line_list if None
+
+            Output:
+                Returns a list of declarations in source order with format
+                [<tokens>, <line>, <end line>, <local>, <parent>]. <tokens> are
+                the tokens from the name to the closing parenthesis, as in
+                function_list, <end line> is the line of the closing 'end' or
+                None if it is missing, and <parent> is the index in the list of
+                the innermost declaration containing this one, or None.
+        '''
+        if lines is None:
+            lines = self._line_list
+        tokens = []
+        _line = 1
+        for _match in _outline_token.finditer(''.join(lines)):
+            _kind = _match.lastgroup
+            if _kind == 'token':
+                tokens.append((_line, _match.group()))
+            elif _kind == 'newline':
+                _line += 1
+            elif _kind != 'comment':
+                _line += _match.group().count('\n')
+
+        # Entries of _blocks are [<opener>, <owner>, <own>]: the innermost
+        # declaration containing the block and whether the block is its body.
+        functions = []
+        _blocks = []
+        _previous = None
+        for _index, (_line, _token) in enumerate(tokens):
+            if _token in _outline_openers:
+                _owner = _blocks[-1][1] if _blocks else None
+                _own = False
+                if _token == 'function':
+                    _declared = _outline_declaration(tokens, _index + 1)
+                    if _declared is not None:
+                        functions.append([_declared, _line, None,
+                                          _previous == 'local', _owner])
+                        _owner = len(functions) - 1
+                        _own = True
+                _blocks.append([_token, _owner, _own])
+            elif _token in _outline_closers:
+                for _position in range(len(_blocks) - 1, -1, -1):
+                    if ((_blocks[_position][0] == 'repeat') ==
+                            (_token == 'until')):
+                        break
+                else:
+                    _previous = _token
+                    continue
+                _entry = _blocks[_position]
+                del _blocks[_position:]
+                if _entry[2]:
+                    functions[_entry[1]][2] = _line
+            _previous = _token
+        return functions
+
+
+    ##########################################################################
+    # Memory profiling
+
+    def profile_memory(self, filename, fast_path=True):
+        '''
+        Parses a file like parse() while tracing memory allocations with
+        tracemalloc. For every phase the peak memory used while it runs and the
+        memory it leaves allocated are recorded.
+            Arguments:
+                <filename>  :   file to be parsed
+                <fast_path> :   True by default. Same as for parse()
+
+            Output:
+                Prints the results of the parse like parse() and returns a
+                dictionary:
+                    'source_bytes':     size of the input
+                    'lines', 'tokens', 'errors', 'functions':
+                                        number of objects held by the parser
+                    'phases':           list of dictionaries with the keys
+                                        'phase' ('read', 'check', 'lex',
+                                        'parse' or 'report'), 'peak' and
+                                        'retained' in bytes
+                    'peak':             peak memory of the whole parse in bytes
+                    'retained':         memory held at the end of the parse
+                    'peak_per_source_byte', 'retained_per_source_byte':
+                                        the last two divided by 'source_bytes'
+                Phases which are not run are not listed: 'check' is the data
+                fast path and replaces 'lex' and 'parse' when it accepts the
+                file.
+        '''
+        # The first pre-scan with NumPy makes allocations of its own, which
+        # would be charged to the lex phase.
+        prescan(['_prescan = "warm up"\n', '_prescan = 1\n'])
+        _tracing = tracemalloc.is_tracing()
+        if not _tracing:
+            tracemalloc.start()
+        _base = tracemalloc.get_traced_memory()[0]
+        phases = []
+        # The methods are passed unbound, as a bound method would be
+        # allocated before the phase and charged to it.
+        try:
+            _measure(phases, 'read', Parser.read, self, filename)
+            if (not fast_path or self._passes or
+                    not _measure(phases, 'check', check_data,
+                                 ''.join(self._line_list))):
+                _measure(phases, 'lex', Parser.lex, self)
+                _measure(phases, 'parse', Parser.parse_input, self)
+            _measure(phases, 'report', Parser._report, self, filename)
+            _retained = tracemalloc.get_traced_memory()[0] - _base
+        finally:
+            if not _tracing:
+                tracemalloc.stop()
+
+        source_bytes = sum(len(_line.encode()) for _line in self._line_list)
+        peak = max(_phase['peak'] + _phase['before'] for _phase in phases)
+        for _phase in phases:
+            del _phase['before']
+        return {
+            'source_bytes': source_bytes,
+            'lines': len(self._line_list),
+            'tokens': sum(len(_tokens) for _tokens in self.token_list),
+            'errors': len(self.error_list),
+            'functions': len(self.function_list),
+            'phases': phases,
+            'peak': peak,
+            'retained': _retained,
+            'peak_per_source_byte': peak / max(source_bytes, 1),
+            'retained_per_source_byte': _retained / max(source_bytes, 1),
+        }
+
+    def _report(self, filename):
+        '''
+        Prints the errors and the declared functions as parse() does.
+        '''
+        self.print_errors(filename)
+        if len(self.error_list) == 0 and self.budget_exceeded is None:
+            self.print_functions()
+
+
+    ##########################################################################
+    # Parallel parse
+
+    def parse_parallel(self, filename, jobs=None):
+        '''
+        Parses a file in several processes. The file is split at top level
+        statements and the parts are parsed at the same time. Errors and
+        declared functions are the same as the ones found by parse().
+            Arguments:
+                <filename>  :   file to be parsed
+                <jobs>      :   None by default. Number of processes, the
+                                number of processors if None
+
+            Output:
+                Prints messages about syntax errors to the console / terminal.
+        '''
+        self.reset()
+        self.read(filename)
+        if not self._passes and check_data(''.join(self._line_list)):
+            self.print_errors(filename)
+            self.print_functions()
+            return
+
+        errors, functions, stopped = self.parse_lines_parallel(self._line_list,
+                                                               jobs)
+        self.error_list.extend(errors)
+        self.function_list.extend(functions)
+        self.budget_exceeded = stopped
+
+        self.print_errors(filename)
+        if len(self.error_list) == 0 and self.budget_exceeded is None:
+            self.print_functions()
+
+    def parse_lines_parallel(self, lines, jobs=None):
+        '''
+        Parses a list of source lines in several processes.
+
+        A part is parsed from its first line as if it was a file of its own,
+        which gives the same result as the sequential parse as long as the
+        parts before it are free of errors. When a part other than the last one
+        has errors the sequential parser could recover differently across the
+        split, so the input is parsed again from the start of this part to the
+        end, in this process and without the results of the following parts.
+        This limits the speedup to the parts before the first part with errors:
+        an error in the first part makes the whole parse sequential, after the
+        time spent on the parallel one.
+
+        The token visits and backtracking steps of the work budget set by
+        set_budget are shared between the parts in proportion to their lines,
+        and its time limit is the one of the whole parse. The parse stops at
+        the first part which exceeds its budget. The events of the parts are
+        delivered to the registered analyses in the order of the input.
+            Arguments:
+                <lines>     :   lines of the input
+                <jobs>      :   None by default. Number of processes, the
+                                number of processors if None
+
+            Output:
+                Returns a tuple (<errors>, <functions>, <budget exceeded>).
+                Errors have the format [<line>, <token>, <message>, <line
+                tokens>]. <budget exceeded> is None or the reason the parse was
+                stopped with the same format.
+        '''
+        if jobs is None:
+            jobs = os.cpu_count() or 1
+        starts = find_boundaries(lines, jobs * _PARTS_PER_JOB)
+        budget = self.get_budget()
+        deadline = None if budget[3] is None else time.time() + budget[3]
+        parts = [(lines[_a:_b], _a, _share_budget(budget, _b - _a, len(lines)),
+                  deadline, self._subscribed)
+                 for _a, _b in zip(starts, starts[1:] + [len(lines)])]
+        self.notify_passes('start')
+        if jobs == 1 or len(parts) == 1:
+            errors, functions, stopped, events = self._parse_part(
+                (lines, 0, budget, deadline, self._subscribed))
+            self.deliver_events(events)
+            self.notify_passes('finish')
+            return errors, functions, stopped
+
+        errors = []
+        functions = []
+        stopped = None
+        with concurrent.futures.ProcessPoolExecutor(jobs) as pool:
+            for index, (_errors, _functions, _stopped, _events) in enumerate(
+                    pool.map(_parse_in_worker, parts)):
+                if _errors and _stopped is None and index < len(parts) - 1:
+                    _rest = len(lines) - starts[index]
+                    _errors, _functions, _stopped, _events = self._parse_part(
+                        (lines[starts[index]:], starts[index],
+                         _share_budget(budget, _rest, len(lines)), deadline,
+                         self._subscribed))
+                    errors.extend(_errors)
+                    functions.extend(_functions)
+                    self.deliver_events(_events)
+                    stopped = _stopped
+                    break
+                errors.extend(_errors)
+                functions.extend(_functions)
+                self.deliver_events(_events)
+                if _stopped is not None:
+                    stopped = _stopped
+                    break
+        self.notify_passes('finish')
+        return errors, functions, stopped
+
+    def _parse_part(self, part):
+        '''
+        Parses a part of the input. This is run in the worker processes,
+        by the default parser of the process.
+            Arguments:
+                <part>      :   tuple (<lines>, <number of lines before the
+                                part>, <work budget as returned by get_budget>,
+                                <Unix time at which the whole parse must end,
+                                or None>, <events to record>)
+
+            Output:
+                Returns a tuple (<errors>, <functions>, <budget exceeded>,
+                <events>). The first three are as in parse_lines_parallel and
+                events are tuples (<event>, <arguments>) to be delivered by
+                deliver_events.
+        '''
+        lines, offset, budget, deadline, subscribed = part
+        self.reset()
+        if deadline is not None:
+            budget = budget[:3] + (max(deadline - time.time(), 0.0),)
+        self.set_budget(*budget)
+        self._line_list.extend(lines)
+        self.lex(offset)
+
+        # The events are recorded but not delivered here: the analyses are
+        # registered in the main process.
+        _analyses = list(self._passes)
+        del self._passes[:]
+        self._subscribed = subscribed
+        try:
+            self.parse_input()
+        finally:
+            self._passes.extend(_analyses)
+            self._subscribe()
+        events = [(_e, ((_a[0][0] + offset, _a[0][1]),) + _a[1:])
+                  for _p, _e, _a in self._events]
+        errors = [[_e[0] + offset, _e[1], _e[2], self.token_list[_e[0]]]
+                  for _e in self.error_list]
+        functions = self.function_list
+        stopped = None
+        if self.budget_exceeded is not None:
+            stopped = [self.budget_exceeded[0] + offset,
+                       self.budget_exceeded[1], self.budget_exceeded[2],
+                       self.token_list[self.budget_exceeded[0]]]
+        self.reset()
+        return errors, functions, stopped, events
+
+
+    ##########################################################################
+    # Streaming parse
+
+    def parse_stream(self, filename):
+        '''
+        Parses a file one top level statement at a time. The file is read and
+        lexed lazily and the tokens of a statement are released once it has
+        been parsed, so memory use does not grow with the size of the input.
+        The errors and declared functions are the same as the ones found by
+        parse(). Memory is traded for speed: on a file of 190,000 lines the
+        parse took 15.1 s with a constant resident size of about 33 MB, against
+        10.7 s and 238 MB for parse().
+            Arguments:
+                <filename>  :   file to be parsed
+
+            Output:
+                Generator yielding tuples (<kind>, <item>) as soon as they are
+                found:
+                    ('error', [<line>, <token>, <message>, <line tokens>])
+                    ('function', [<tokens of the declaration>])
+                    ('budget', [<line>, <token>, <message>, <line tokens>])
+                The last item is a 'budget' one if the parse was stopped
+                because the work budget was exceeded. Raises IOError if the
+                file can not be read.
+        '''
+        self.reset()
+        try:
+            with open(filename, 'rt') as input_file:
+                self.token_list = _TokenStream(self, input_file)
+                self._cl = 0
+                self._ct = 0
+                self.start_budget()
+                self.start_watch()
+                self.notify_passes('start')
+
+                # This is the loop of parse() with parse_chunk() unrolled so
+                # that results can be reported after every statement.
+                try:
+                    while True:
+                        _save = self.position_get()
+                        while self.parse_stat():
+                            if 'statement' in self._subscribed:
+                                self.emit_statement(_save)
+                            if self.match(';'):
+                                pass
+                            else:
+                                self.red_position()
+                            yield from self._flush_stream()
+                            if self._watching:
+                                self.watch()
+                            _save = self.position_get()
+                        if self.parse_laststat():
+                            if 'statement' in self._subscribed:
+                                self.emit_statement(_save)
+                            if self.match(';'):
+                                pass
+                            else:
+                                self.red_position()
+                        if self.get_next_token() == '___eof___':
+                            break
+                        self.error("Invalid statement.")
+                        self.next_statement()
+                        yield from self._flush_stream()
+                except RecursionError:
+                    self.budget_stop_message("Parse stopped. Maximum nesting "
+                                             "depth of the interpreter "
+                                             "reached.")
+                except BudgetExceeded:
+                    pass
+                _stopped = self.budget_exceeded
+                yield from self._flush_stream()
+                if _stopped is not None:
+                    yield ('budget', _stopped + [self.token_list[_stopped[0]]])
+                self.notify_passes('finish')
+        finally:
+            # Also run when the caller stops iterating early or closes the
+            # generator.
+            self.reset()
+
+    def _flush_stream(self):
+        '''
+        Yields the errors and functions recorded since the last call, delivers
+        the events to the registered analyses and releases the lines the parser
+        will not visit again.
+            Arguments:
+                None
+
+            Output:
+                Generator as described in parse_stream.
+        '''
+        for _error in self.error_list:
+            yield ('error', _error + [self.token_list[_error[0]]])
+        for _function in self.function_list:
+            yield ('function', _function)
+        del self.error_list[:]
+        del self.function_list[:]
+        del self.function_position_list[:]
+        self._last_function = _NO_FUNCTION
+        self.dispatch_events()
+        self.token_list.release(self._cl)
+
+
+    ##########################################################################
+    # Individual parse functions
+
+    def parse_block(self):
+        '''
+        Parses the production:
+                <block> -> <chunk>
+
+            Arguments:
+                None
+
+            Output:
+                Returns true if the parse could be completed
+        '''
+        self._depth += 1
+        if self._depth > self._depth_limit:
+            self.stop_budget("Parse stopped. More than {0} nested blocks and "
+                             "expressions.".format(self.max_nesting_depth))
+        _result = self.parse_chunk()
+        self._depth -= 1
+        return _result
+
+    def parse_chunk(self):
+        '''
+        Parses the production:
+                <chunk> -> {<stat> [;]} [<laststat> [;]]
+
+            Arguments:
+                None
+
+            Output:
+                Returns true if the parse could be completed
+        '''
+        _save = self.position_get()
+        while self.parse_stat():
+            if 'statement' in self._subscribed:
+                self.emit_statement(_save)
+            if self.match(';'):
+                pass
+            else:
+                self.red_position()
+            if self._watching:
+                self.watch()
+            _save = self.position_get()
+        if self.parse_laststat():
+            if 'statement' in self._subscribed:
+                self.emit_statement(_save)
+            if self.match(';'):
+                pass
+            else:
+                self.red_position()
         return True
-    else:
-        position_set(_save)
-        return False
 
-def parse_funcname():
-    '''
-    Parses the production:
-            <funcname> -> <name> {. <name>} [: <name>]
+    def parse_stat(self):
+        '''
+        Parses the production:
+                <stat> -> <varlist> = <explist>
+                        | <functioncall>
+                        | do <block> end
+                        | while <exp> do <block> end
+                        | repeat <block> until <exp>
+                        | if <exp> then <block> {elseif <exp> then <block>}
+                            [else <block>] end
+                        | for <name> = <exp> , <exp> [, <exp>] do <block> end
+                        | for <namelist> in <explist> do <block> end
+                        | function <funcname> <funcbody>
+                        | local function <name> <funcbody>
+                        | local <namelist> [= <explist>]
+
+            Arguments:
+                None
+
+            Output:
+                Returns true if the parse could be completed
+        '''
+        _save = self.position_get()
+
+        # Assignments and calls both start with a suffixed expression, which is
+        # parsed once. Its last suffix tells which statement it starts.
+        _kind = self.parse_suffixedexp()
+        if _kind == 'call':
+            return True
 
-        Arguments:
-            None
+        elif _kind == 'var' and self.parse_varlist(_save) and self.match('='):
+            self.skip_and_test("Invalid expression list.", self.parse_explist,
+                               last_stat=True)
+            return True
 
-        Output:
-            Returns true if the parse could be completed
-    '''
-    if parse_name():
-        while match('\.'):
-            if not parse_name():
-                error("Invalid identifier after period.")
-                if match('\('):
-                    red_position()
-        red_position()
-
-        if match(':'):
-            if not parse_name():
-                error("Invalid identifier after colon.")
-                if match('\('):
-                    red_position()
+        elif (self.position_set(_save) and self.match('do') and
+              self.open_scope() and self.parse_block()):
+            self.skip_and_test("Invalid statement. Keyword 'end' expected.",
+                               self.match, 'end')
+            self.close_scope()
             return True
-        else:
-            red_position()
+
+        elif self.position_set(_save) and self.match('while'):
+            self.skip_and_test("Invalid expression.", self.parse_exp)
+            self.skip_and_test("Invalid statement. Keyword 'do' expected.",
+                               self.match, 'do')
+            self.open_scope()
+            self.parse_block()
+            self.skip_and_test("Invalid statement. Keyword 'end' expected.",
+                               self.match, 'end')
+            self.close_scope()
             return True
 
-    else:
-        return False
-
-def parse_parlist():
-    '''
-    Parses the production:
-            <parlist>  -> <namelist> [, ...]
-                        | ...
+        # The locals of the block of a repeat are visible in its condition
+        elif (self.position_set(_save) and self.match('repeat') and
+              self.open_scope() and self.parse_block()):
+            self.skip_and_test("Invalid statement. Keyword 'until' expected.",
+                               self.match, 'until')
+            self.skip_and_test("Invalid expression.", self.parse_exp,
+                               last_stat=True)
+            self.close_scope()
+            return True
 
-        Arguments:
-            None
+        elif self.position_set(_save) and self.match('if'):
+            self.skip_and_test("Invalid expression.", self.parse_exp)
+            self.skip_and_test("Invalid statement. Keyword 'then' expected.",
+                               self.match, 'then')
+            self.open_scope()
+            self.parse_block()
+            self.close_scope()
+            _save00 = self.position_get()
+
+            while True:
+                if self.match('elseif'):
+                    self.skip_and_test("Invalid expression.", self.parse_exp)
+                    self.skip_and_test("Invalid statement. Keyword 'then' "
+                                       "expected.", self.match, 'then')
+                elif (self.position_set(_save00) and
+                      (not self.inc_position()) and
+                      self.parse_exp() and self.match('then')):
+                    _temp = self.position_get()
+                    self.position_set(_save00)
+                    self.inc_position()
+                    self.error("Keyword 'elseif' expected.")
+                    self.position_set(_temp)
+                else:
+                    break
+                self.open_scope()
+                self.parse_block()
+                self.close_scope()
+                _save00 = self.position_get()
+
+            if (self.position_set(_save00) and self.match('else') and
+                self.open_scope() and
+                    self.parse_block() and self.close_scope()):
+                pass
+            else:
+                self.red_position()
 
-        Output:
-            Returns true if the parse could be completed
-    '''
-    if parse_namelist():
-        if match(','):
-            skip_and_test("Invalid syntax.", parse_tripledot)
+            self.skip_and_test("Invalid statement. Keyword 'end' expected.",
+                               self.match, 'end')
             return True
-        else:
-            red_position()
-            return True
-    elif parse_tripledot():
-        return True
-    else:
-        return False
 
-def parse_namelist():
-    '''
-    Parses the production:
-            <namelist> -> <name> {, <name>}
-
-        Arguments:
-            None
+        elif self.position_set(_save) and self.match('for'):
+            if self.parse_name() and self.match('='):
+                self.skip_and_test("Invalid expression.", self.parse_exp)
+                self.skip_and_test("Missing comma after expression.",
+                                   self.match, ',')
+                self.skip_and_test("Invalid expression.", self.parse_exp)
+                if self.match(','):
+                    self.skip_and_test("Invalid expression.", self.parse_exp)
+                else:
+                    self.red_position()
+
+                self.skip_and_test("Invalid statement. Keyword 'do' expected.",
+                                   self.match, 'do')
+                self.open_scope()
+                self.declare_names(self.next_position(
+                    self.next_position(_save)))
+                self.parse_block()
+                self.skip_and_test("Invalid statement. Keyword 'end' "
+                                   "expected.", self.match, 'end')
+                self.close_scope()
+                return True
 
-        Output:
-            Returns true if the parse could be completed
-    '''
-    if parse_name():
-        while match(',') and parse_name():
-            pass
-        red_position()
-        return True
-    else:
-        return False
+            elif self.parse_namelist():
+                self.skip_and_test("Invalid statement. Keyword 'in' expected.",
+                                   self.match, 'in')
+                self.skip_and_test("Invalid expression list.",
+                                   self.parse_explist)
+                self.skip_and_test("Invalid statement. Keyword 'do' expected.",
+                                   self.match, 'do')
+                self.open_scope()
+                self.declare_names(self.next_position(
+                    self.next_position(_save)))
+                self.parse_block()
+                self.skip_and_test("Invalid statement. Keyword 'end' expected",
+                                   self.match, 'end')
+                self.close_scope()
+                return True
 
-def parse_number():
-    '''
-    Checks if the input token is a valid number.
+            else:
+                self.position_set(_save)
+                return False
 
-        Arguments:
-            None
+        elif (self.position_set(_save) and self.match('function') and
+              self.parse_funcname()):
+            self._named_function = True
+            if self._scoping:
+                self._method_body = self.reference_funcname(
+                    self.next_position(_save))
+            if self.parse_funcbody():
 
-        Output:
-            Returns true if the parse could be completed
-    '''
-    if match(number):
-        return True
-    else:
-        red_position()
-        return False
+                self._function_temp_beg = _save
+                self.save_function()
 
-def parse_string():
-    '''
-    Checks if the input token is a valid string literal.
+                return True
+            else:
+                self.position_set(_save)
+                return False
+
+        elif self.position_set(_save) and self.match('local'):
+            _save00 = self.position_get()
+            if self.match('function') and self.parse_name():
+                self._named_function = True
+                self.declare_names(self.position_get())
+                if self.parse_funcbody():
+
+                    self._function_temp_beg = _save00
+                    self.save_function()
+
+                    return True
+            elif self.position_set(_save00) and self.parse_namelist():
+                if self.match('='):
+                    self.skip_and_test("Invalid expression list.",
+                                       self.parse_explist)
+                else:
+                    self.red_position()
+                self.declare_names(self.next_position(_save00))
+                return True
+            else:
+                self.position_set(_save)
+                return False
 
-        Arguments:
-            None
+        else:
+            self.position_set(_save)
+            return False
 
-        Output:
-            Returns true if the parse could be completed
-    '''
-    if match(string):
-        return True
-    else:
-        red_position()
-        return False
+    def parse_laststat(self):
+        '''
+        Parses the production:
+                <laststat> -> return [<explist>]
+                            | break
+
+            Arguments:
+                None
+
+            Output:
+                Returns true if the parse could be completed
+        '''
+        _save = self.position_get()
+        if self.match('return'):
+            if self.parse_explist():
+                pass
+            return True
+        elif self.position_set(_save) and self.match('break'):
+            return True
+        else:
+            self.position_set(_save)
+            return False
 
-def parse_tripledot():
-    '''
-    Checks if the input token is a ellipsis (...).
+    def parse_field(self):
+        '''
+        Parses the production:
+                <field> -> '[' <exp> ']'  = <exp>
+                         | <name> = <exp>
+                         | <exp>
+
+            Arguments:
+                None
+
+            Output:
+                Returns true if the parse could be completed
+        '''
+        _save = self.position_get()
+        if self.match('\['):
+            self.skip_and_test("Invalid expression.", self.parse_exp)
+            self.skip_and_test("Closing braket expected.", self.match, '\]')
+            self.skip_and_test("Invalid statement. Equal sign expected.",
+                               self.match, '=')
+            self.skip_and_test("Invalid expression.", self.parse_exp)
+            return True
+        elif (self.position_set(_save) and self.parse_name() and
+              self.match('=')):
+            self.skip_and_test("Invalid expression.", self.parse_exp)
+            return True
+        elif self.position_set(_save) and self.parse_exp():
+            return True
+        else:
+            self.position_set(_save)
+            return False
 
-        Arguments:
-            None
+    def parse_fieldlist(self):
+        '''
+        Parses the production:
+                <fieldlist> -> <field> {<fieldsep> <field>} [<fieldsep>]
+
+            Arguments:
+                None
+
+            Output:
+                Returns true if the parse could be completed
+        '''
+        _save = self.position_get()
+        if self.parse_field():
+            while self.parse_fieldsep() and self.parse_field():
+                pass
+            return True
+        else:
+            self.position_set(_save)
+            return False
 
-        Output:
-            Returns true if the parse could be completed
-    '''
-    _save = position_get()
-    if match('\.') and match('\.') and match('\.'):
-        return True
-    else:
-        position_set(_save)
-        return False
+    def parse_tableconstructor(self):
+        '''
+        Parses the production:
+                <tableconstructor> -> '{' [fieldlist] '}'
+
+            Arguments:
+                None
+
+            Output:
+                Returns true if the parse could be completed
+        '''
+        _save = self.position_get()
+        if self.match('\{'):
+            if self.parse_fieldlist():
+                self.skip_and_test("Closing curly brace expected.", self.match,
+                                   '\}')
+                return True
+            elif self.match('\}'):
+                return True
+        else:
+            self.position_set(_save)
+            return False
 
-def parse_name():
-    '''
-    Checks if the input token is a valid identifier.
+    def parse_suffixedexp(self):
+        '''
+        Parses the productions of <prefixexp>, <var> and <functioncall> at
+        once, left factored as a primary expression followed by a chain of
+        suffixes:
+                <suffixedexp> -> <name> {<suffix>}
+                               | ( <exp> ) {<suffix>}
+                <suffix> -> '[' <exp> ']'
+                          | . <name>
+                          | : <name> <args>
+                          | <args>
+
+            The kind of the chain is given by its last part: a <var> ends with
+            a name, an index or a field and a <functioncall> with arguments.
+            Each token of the chain is parsed once, whatever the kind.
+
+            Arguments:
+                None
+
+            Output:
+                Returns 'var', 'call' or 'exp' (an expression in parentheses
+                without suffix) if the parse could be completed, False
+                otherwise.
+        '''
+        _save = self.position_get()
+        if self.parse_name() and self.reference():
+            _kind = 'var'
+        elif self.position_set(_save) and self.match('\('):
+            self.skip_and_test("Invalid expression.", self.parse_exp)
+            self.skip_and_test("Closing parenthesis expected.", self.match,
+                               '\)')
+            _kind = 'exp'
+        else:
+            self.position_set(_save)
+            return False
 
-        Arguments:
-            None
+        while True:
+            _save = self.position_get()
+            if self.match('\['):
+                self.skip_and_test("Invalid expression.", self.parse_exp)
+                self.skip_and_test("Closing braket expected.", self.match,
+                                   '\]')
+                _kind = 'var'
+            elif (self.position_set(_save) and self.match('\.') and
+                  self.parse_name()):
+                _kind = 'var'
+            elif (self.position_set(_save) and self.match(':') and
+                  self.parse_name() and self.parse_args()):
+                _kind = 'call'
+            elif self.position_set(_save) and self.parse_args():
+                _kind = 'call'
+            else:
+                self.position_set(_save)
+                return _kind
+
+    def parse_functioncall(self):
+        '''
+        Parses the production:
+                <functioncall> -> <prefixexp> <args>
+                                | <prefixexp> : <name> <args>
+
+            Arguments:
+                None
+
+            Output:
+                Returns true if the parse could be completed
+        '''
+        _save = self.position_get()
+        if self.parse_suffixedexp() == 'call':
+            return True
+        else:
+            self.position_set(_save)
+            return False
 
-        Output:
-            Returns true if the parse could be completed
-    '''
-    _save = position_get()
-    if match(name):
-        red_position()
-        if not match(keyword):
+    def parse_prefixexp(self):
+        '''
+        Parses the production:
+                <prefixexp> -> <var>
+                             | <functioncall>
+                             | ( <exp> )
+
+            Arguments:
+                None
+
+            Output:
+                Returns true if the parse could be completed
+        '''
+        _save = self.position_get()
+        if self.parse_suffixedexp():
             return True
         else:
-            position_set(_save)
+            self.position_set(_save)
             return False
-    else:
-        position_set(_save)
-        return False
 
-def parse_fieldsep():
-    '''
-    Checks if the input token is a valid field separator (',', ';').
+    def parse_args(self):
+        '''
+        Parses the production:
+                <args> -> ( [<explist>] )
+                        | <tableconstructor>
+                        | <string>
+
+            Arguments:
+                None
+
+            Output:
+                Returns true if the parse could be completed
+        '''
+        _save = self.position_get()
+        if self.match('\('):
+            if self.parse_explist() and self.match('\)'):
+                return True
+            elif (self.position_set(_save) and self.match('\(') and
+                  self.match('\)')):
+                return True
+            else:
+                self.position_set(_save)
+                return False
+        elif self.position_set(_save) and self.parse_tableconstructor():
+            return True
+        elif self.position_set(_save) and self.parse_string():
+            return True
+        else:
+            self.position_set(_save)
+            return False
 
-        Arguments:
-            None
+    def parse_var(self):
+        '''
+        Parses the production:
+                <var>  -> <name>
+                        | <prefixexp> '[' <exp> ']'
+                        | <prefixexp> . <name>
+
+            Arguments:
+                None
+
+            Output:
+                Returns true if the parse could be completed
+        '''
+        _save = self.position_get()
+        if self.parse_suffixedexp() == 'var':
+            if self._scoping:
+                self.assign_reference(_save)
+            return True
+        else:
+            self.position_set(_save)
+            return False
 
-        Output:
-            Returns true if the parse could be completed
-    '''
-    if match(fieldsep):
+    def parse_varlist(self, first=None):
+        '''
+        Parses the production:
+                <varlist> -> <var> {, <var>}
+
+            Arguments:
+                <first>     :   None by default. Position before the first
+                                <var> if it was already parsed by
+                                parse_suffixedexp
+
+            Output:
+                Returns true if the parse could be completed
+        '''
+        if first is None:
+            _save = self.position_get()
+            if not self.parse_var():
+                self.position_set(_save)
+                return False
+        elif self._scoping:
+            self.assign_reference(first)
+        while self.match(','):
+            self.skip_and_test("Invalid variable.", self.parse_var)
+        self.red_position()
         return True
-    else:
-        red_position()
-        return False
 
-def parse_binop():
-    '''
-    Checks if the input token is a valid binary operator symbol.
+    def parse_exp(self):
+        '''
+        Parses the production:
+                <exp>  -> nil <exp_bis>
+                        | true <exp_bis>
+                        | false <exp_bis>
+                        | <number> <exp_bis>
+                        | <string> <exp_bis>
+                        | ... <exp_bis>
+                        | <function> <exp_bis>
+                        | <prefixexp> <exp_bis>
+                        | <tableconstructor> <exp_bis>
+                        | <unop> <exp> <exp_bis>
+
+            Arguments:
+                None
+
+            Output:
+                Returns true if the parse could be completed
+        '''
+        self._depth += 1
+        if self._depth > self._depth_limit:
+            self.stop_budget("Parse stopped. More than {0} nested blocks and "
+                             "expressions.".format(self.max_nesting_depth))
+        _save = self.position_get()
+        if self.match('nil') and self.parse_exp_bis():
+            _result = True
+        elif (self.position_set(_save) and self.match('false') and
+              self.parse_exp_bis()):
+            _result = True
+        elif (self.position_set(_save) and self.match('true') and
+              self.parse_exp_bis()):
+            _result = True
+        elif (self.position_set(_save) and self.parse_number() and
+              self.parse_exp_bis()):
+            _result = True
+        elif (self.position_set(_save) and self.parse_string() and
+              self.parse_exp_bis()):
+            _result = True
+        elif (self.position_set(_save) and self.parse_tripledot() and
+              self.parse_exp_bis()):
+            _result = True
+        elif (self.position_set(_save) and self.parse_function() and
+              self.parse_exp_bis()):
+            _result = True
+        elif (self.position_set(_save) and self.parse_prefixexp() and
+              self.parse_exp_bis()):
+            _result = True
+        elif (self.position_set(_save) and self.parse_tableconstructor() and
+              self.parse_exp_bis()):
+            _result = True
+        elif (self.position_set(_save) and self.parse_unop() and
+              self.parse_exp() and self.parse_exp_bis()):
+            _result = True
+        else:
+            self.position_set(_save)
+            _result = False
+
+        self._depth -= 1
+        return _result
+
+    def parse_exp_bis(self):
+        '''
+        Parses the production:
+                <exp_bis>  -> <binop> <exp> <exp_bis>
+                            | None
+
+            Arguments:
+                None
+
+            Output:
+                Returns true if the parse could be completed
+        '''
+        _save = self.position_get()
+        if self.parse_binop() and self.parse_exp():
+            self.parse_exp_bis()
+            return True
+        else:
+            self.position_set(_save)
+            return True
 
-        Arguments:
-            None
+    def parse_explist(self):
+        '''
+        Parses the production:
+                <explist> -> {<exp> ,} <exp>
+
+            Arguments:
+                None
+
+            Output:
+                Returns true if the parse could be completed
+        '''
+        _save = self.position_get()
+        if self.parse_exp():
+            while self.match(','):
+                self.skip_and_test("Invalid expression.", self.parse_exp)
+            self.red_position()
+            return True
+        else:
+            self.position_set(_save)
+            return False
 
-        Output:
-            Returns true if the parse could be completed
-    '''
-    _save = position_get()
-    if match(binop_1):
-        return True
-    elif re.fullmatch(binop_2, get_token() + get_next_token()):
-        return True
-    else:
-        position_set(_save)
-        if match(binop_3):
+    def parse_function(self):
+        '''
+        Parses the production:
+                <function> -> function <funcbody>
+
+            Arguments:
+                None
+
+            Output:
+                Returns true if the parse could be completed
+        '''
+        _save = self.position_get()
+        if self.match('function') and self.parse_funcbody():
             return True
         else:
-            position_set(_save)
+            self.position_set(_save)
             return False
 
-def parse_unop():
-    '''
-    Checks if the input token is a valid unary operator symbol.
+    def parse_funcbody(self):
+        '''
+        Parses the production:
+                <funcbody> -> ( [<parlist>] ) <block> end
+
+            Arguments:
+                None
+
+            Output:
+                Returns true if the parse could be completed
+        '''
+        _save = self.position_get()
+        _method = self._method_body
+        self._method_body = False
+        _end = None
+        if self.match('\('):
+            _save00 = self.position_get()
+            self.open_scope()
+            if _method and 'local' in self._subscribed:
+                self.emit('local', self.position_get(), 'self')
+            if self.parse_parlist():
+                self.skip_and_test("Missing closing parenthesis.", self.match,
+                                   '\)')
+                if self._named_function:
+                    _end = self.position_get()
+                    self._named_function = False
+            else:
+                self.skip_and_test("Missing closing parenthesis", self.match,
+                                   '\)')
+                if self._named_function:
+                    _end = self.position_get()
+                    self._named_function = False
+
+            self.declare_names(self.next_position(_save00))
+            self.parse_block()
+            self.skip_and_test("Invalid statement. Keyword 'end' expected.",
+                               self.match, 'end')
+            self.close_scope()
+
+            # Declarations in the body overwrite the end of the signature, so
+            # it is only stored for save_function once the body is parsed.
+            if _end is not None:
+                self._function_temp_end = _end
+            return True
+        else:
+            self.position_set(_save)
+            return False
 
-        Arguments:
-            None
+    def parse_funcname(self):
+        '''
+        Parses the production:
+                <funcname> -> <name> {. <name>} [: <name>]
+
+            Arguments:
+                None
+
+            Output:
+                Returns true if the parse could be completed
+        '''
+        if self.parse_name():
+            while self.match('\.'):
+                if not self.parse_name():
+                    self.error("Invalid identifier after period.")
+                    if self.match('\('):
+                        self.red_position()
+            self.red_position()
+
+            if self.match(':'):
+                if not self.parse_name():
+                    self.error("Invalid identifier after colon.")
+                    if self.match('\('):
+                        self.red_position()
+                return True
+            else:
+                self.red_position()
+                return True
 
-        Output:
-            Returns true if the parse could be completed
-    '''
-    if re.fullmatch(unop, get_next_token()):
-        return True
-    else:
-        red_position()
-        return False
+        else:
+            return False
 
-def match(string):
-    '''
-    Shorthand function for matching regular expressions. This is equivalent
-    to re.fullmatch(string, get_next_token()) except it returns a boolean
-    instead of the matched string.
+    def parse_parlist(self):
+        '''
+        Parses the production:
+                <parlist>  -> <namelist> [, ...]
+                            | ...
+
+            Arguments:
+                None
+
+            Output:
+                Returns true if the parse could be completed
+        '''
+        if self.parse_namelist():
+            if self.match(','):
+                self.skip_and_test("Invalid syntax.", self.parse_tripledot)
+                return True
+            else:
+                self.red_position()
+                return True
+        elif self.parse_tripledot():
+            return True
+        else:
+            return False
 
-        Arguments:
-            Regular expression pattern.
+    def parse_namelist(self):
+        '''
+        Parses the production:
+                <namelist> -> <name> {, <name>}
+
+            Arguments:
+                None
+
+            Output:
+                Returns true if the parse could be completed
+        '''
+        if self.parse_name():
+            while self.match(',') and self.parse_name():
+                pass
+            self.red_position()
+            return True
+        else:
+            return False
 
-        Output:
-            Returns true if the next token matches the pattern. False otherwise
-    '''
-    if re.fullmatch(string, get_next_token()):
-        return True
-    else:
-        return False
+    def parse_number(self):
+        '''
+        Checks if the input token is a valid number.
 
-##############################################################################
-# Functions for token pointer movement
+            Arguments:
+                None
 
-def next_statement():
-    '''
-    Moves the head to the start of the next statement. A new statement is
-    detected when a semicolon appears in the input stream or a new line is
-    started.
+            Output:
+                Returns true if the parse could be completed
+        '''
+        if self.match(number):
+            return True
+        else:
+            self.red_position()
+            return False
 
-        Arguments:
-            None
+    def parse_string(self):
+        '''
+        Checks if the input token is a valid string literal.
 
-        Output:
-            None
-    '''
-    _save = position_get()
-    while position_get()[0] == _save[0]:
-        if re.fullmatch(';', get_next_token()):
-            break
-    red_position()
+            Arguments:
+                None
 
-def inc_position():
-    '''
-    Increases header position by one token. This is equivalent to consuming
-    the token.
+            Output:
+                Returns true if the parse could be completed
+        '''
+        if self.match(string):
+            return True
+        else:
+            self.red_position()
+            return False
 
-        Arguments:
-            None
+    def parse_tripledot(self):
+        '''
+        Checks if the input token is a ellipsis (...).
 
-        Output:
-            None
-    '''
-    global _cl, _ct
-    if _ct + 1 >= len(token_list[_cl]):
-        if _cl + 1 >= len(token_list):
-            _cl = len(token_list) - 1
-            _ct = len(token_list[_cl]) - 1
+            Arguments:
+                None
+
+            Output:
+                Returns true if the parse could be completed
+        '''
+        _save = self.position_get()
+        if self.match('\.') and self.match('\.') and self.match('\.'):
+            return True
         else:
-            _cl += 1
-            _ct = 0
-    else:
-        _ct += 1
+            self.position_set(_save)
+            return False
 
-    while get_token() == '':
-        inc_position()
+    def parse_name(self):
+        '''
+        Checks if the input token is a valid identifier.
+
+            Arguments:
+                None
+
+            Output:
+                Returns true if the parse could be completed
+        '''
+        _save = self.position_get()
+        # The end of the input is the symbol ___eof___, which is not a name.
+        if self.match(name) and self.get_token() != '___eof___':
+            self.red_position()
+            if not self.match(keyword):
+                if 'name' in self._subscribed:
+                    self.emit('name', self.position_get(), self.get_token())
+                return True
+            else:
+                self.position_set(_save)
+                return False
+        else:
+            self.position_set(_save)
+            return False
 
-def red_position():
-    '''
-    Reduces the header position by one token. This is the opposite to consuming
-    a token.
+    def parse_fieldsep(self):
+        '''
+        Checks if the input token is a valid field separator (',', ';').
 
-        Arguments:
-            None
+            Arguments:
+                None
 
-        Output:
-            None
-    '''
-    global _cl, _ct
-    if _ct - 1 < 0:
-        if _cl - 1 < 0:
-            _cl = 0
-            _ct = 0
+            Output:
+                Returns true if the parse could be completed
+        '''
+        if self.match(fieldsep):
+            return True
         else:
-            _cl -= 1
-            _ct = len(token_list[_cl]) - 1
-    else:
-        _ct -= 1
+            self.red_position()
+            return False
 
-    while get_token() == '':
-        red_position()
+    def parse_binop(self):
+        '''
+        Checks if the input token is a valid binary operator symbol.
 
-def get_token():
-    '''
-    Returns the token at the current header position. Note that this does not
-    consume the token.
+            Arguments:
+                None
 
-        Arguments:
-            None
+            Output:
+                Returns true if the parse could be completed
+        '''
+        _save = self.position_get()
+        if self.match(binop_1):
+            return True
+        elif re.fullmatch(binop_2, self.get_token() + self.get_next_token()):
+            return True
+        else:
+            self.position_set(_save)
+            if self.match(binop_3):
+                return True
+            else:
+                self.position_set(_save)
+                return False
 
-        Output:
-            Current token.
-    '''
-    return token_list[_cl][_ct]
+    def parse_unop(self):
+        '''
+        Checks if the input token is a valid unary operator symbol.
 
-def get_next_token():
-    '''
-    Consumes the current token and reads the next token in the input stream.
+            Arguments:
+                None
 
-        Arguments:
-            None
+            Output:
+                Returns true if the parse could be completed
+        '''
+        if re.fullmatch(unop, self.get_next_token()):
+            return True
+        else:
+            self.red_position()
+            return False
 
-        Output:
-            Next token.
-    '''
-    inc_position()
-    return get_token()
+    def match(self, string):
+        '''
+        Shorthand function for matching regular expressions. This is equivalent
+        to re.fullmatch(string, get_next_token()) except it returns a boolean
+        instead of the matched string.
+
+            Arguments:
+                Regular expression pattern.
+
+            Output:
+                Returns true if the next token matches the pattern. False
+                otherwise
+        '''
+        self.inc_position()
+        if re.fullmatch(string, self.token_list[self._cl][self._ct]):
+            return True
+        else:
+            return False
 
-def position_get():
-    '''
-    Returns the current position of the header in the input stream. This gives
-    a tuple containing the line number and token number.
 
-        Arguments:
-            None
+    ##########################################################################
+    # Functions for token pointer movement
 
-        Output:
-            Token position with format (<line_number>, <token_number>).
-    '''
-    return (_cl, _ct)
+    def next_statement(self):
+        '''
+        Moves the head to the start of the next statement. A new statement is
+        detected when a semicolon appears in the input stream or a new line is
+        started. The constructs closed on the line are skipped with
+        skip_construct, so the semicolons of a table do not end the statement.
 
-def position_set(position):
-    '''
-    Sets the position of the header to the one specified in the argument.
+            Arguments:
+                None
 
-        Arguments:
-            Position tuple with format (<line_number>, <token_number>).
+            Output:
+                None
+        '''
+        _save = self.position_get()
+        while self.position_get()[0] == _save[0]:
+            if self.skip_construct():
+                continue
+            if re.fullmatch(';', self.get_next_token()):
+                break
+        self.red_position()
+
+    def inc_position(self):
+        '''
+        Increases header position by one token. This is equivalent to consuming
+        the token.
+
+            Arguments:
+                None
+
+            Output:
+                None
+        '''
+        # This runs for every token: the attributes are read once.
+        _visits = self._visits = self._visits + 1
+        if _visits > self._visit_limit:
+            self.stop_budget("Parse stopped. More than {0} token visits."
+                             .format(self.max_token_visits))
+        if self._deadline is not None and not _visits & 1023 and \
+                time.monotonic() > self._deadline:
+            self.stop_budget("Parse stopped. Time limit of {0} seconds "
+                             "exceeded.".format(self.max_seconds))
+        _tokens = self.token_list
+        _line = self._cl
+        _token = self._ct + 1
+        if _token >= len(_tokens[_line]):
+            if _line + 1 >= len(_tokens):
+                _line = len(_tokens) - 1
+                _token = len(_tokens[_line]) - 1
+            else:
+                _line += 1
+                _token = 0
+        self._cl = _line
+        self._ct = _token
+        if self._heat is not None:
+            self._heat[_line][_token] += 1
+
+        if _tokens[_line][_token] == '':
+            self.inc_position()
+
+    def red_position(self):
+        '''
+        Reduces the header position by one token. This is the opposite to
+        consuming a token.
+
+            Arguments:
+                None
+
+            Output:
+                None
+        '''
+        self._steps += 1
+        if self._steps > self._step_limit:
+            self.stop_budget("Parse stopped. More than {0} backtracking "
+                             "steps.".format(self.max_backtracking_steps))
+        _line = self._cl
+        _token = self._ct - 1
+        if _token < 0:
+            if _line - 1 < 0:
+                _line = 0
+                _token = 0
+            else:
+                _line -= 1
+                _token = len(self.token_list[_line]) - 1
+        self._cl = _line
+        self._ct = _token
+        if self._events and self._events[-1][0] > (_line, _token):
+            self.retract_events()
+        if self._last_function > (_line, _token):
+            self.retract_functions()
+
+        while self.get_token() == '':
+            self.red_position()
+
+    def get_token(self):
+        '''
+        Returns the token at the current header position. Note that this does
+        not consume the token.
+
+            Arguments:
+                None
+
+            Output:
+                Current token.
+        '''
+        return self.token_list[self._cl][self._ct]
+
+    def get_next_token(self):
+        '''
+        Consumes the current token and reads the next token in the input
+        stream.
+
+            Arguments:
+                None
+
+            Output:
+                Next token.
+        '''
+        self.inc_position()
+        return self.token_list[self._cl][self._ct]
+
+    def position_get(self):
+        '''
+        Returns the current position of the header in the input stream. This
+        gives a tuple containing the line number and token number.
+
+            Arguments:
+                None
+
+            Output:
+                Token position with format (<line_number>, <token_number>).
+        '''
+        return (self._cl, self._ct)
+
+    def position_set(self, position):
+        '''
+        Sets the position of the header to the one specified in the argument.
+
+            Arguments:
+                Position tuple with format (<line_number>, <token_number>).
+
+            Output:
+                Returns true if the no error occured.
+                Returns false if an error occured (such as index out of bounds
+                error).
+        '''
+        _moved = position != (self._cl, self._ct)
+        if _moved:
+            self._steps += 1
+            if self._steps > self._step_limit:
+                self.stop_budget("Parse stopped. More than {0} backtracking "
+                                 "steps.".format(self.max_backtracking_steps))
+        try:
+            line, token = position
+            if self._heat is not None and _moved:
+                self._heat[line][token] += 1
+            self._cl = line
+            self._ct = token
+            if self._events and self._events[-1][0] > (line, token):
+                self.retract_events()
+            if self._last_function > (line, token):
+                self.retract_functions()
+            return True
+        except:
+            return False
 
-        Output:
-            Returns true if the no error occured.
-            Returns false if an error occured (such as index out of bounds
-            error).
-    '''
-    global _cl, _ct
-    try:
-        line, token = position
-        _cl = line
-        _ct = token
+    def next_position(self, position):
+        '''
+        Returns the position following <position> as inc_position would move
+        the head, without moving it.
+
+            Arguments:
+                Position tuple with format (<line_number>, <token_number>).
+
+            Output:
+                Position tuple of the next token.
+        '''
+        _line, _token = position
+        while True:
+            if _token + 1 >= len(self.token_list[_line]):
+                if _line + 1 >= len(self.token_list):
+                    _line = len(self.token_list) - 1
+                    _token = len(self.token_list[_line]) - 1
+                else:
+                    _line += 1
+                    _token = 0
+            else:
+                _token += 1
+            if self.token_list[_line][_token] != '':
+                return (_line, _token)
+
+
+    ##########################################################################
+    # Analysis passes
+
+    def add_pass(self, analysis):
+        '''
+        Registers an analysis run during the following parses. An analysis is
+        any object with one or more of the following methods, called in the
+        order of the input:
+            start()                             before the parse
+            statement(position, keyword)        after each statement, <keyword>
+                                                is its first token
+            function(position, tokens, local)   after each named function
+                                                declaration, with the tokens of
+                                                its name and parameters as in
+                                                function_list
+            name(position, name)                for each identifier
+            open_scope(position)                at the start of a block, a loop
+                                                or a function body
+            close_scope(position)               at the end of the same
+            local(position, name)               when a local variable, loop
+                                                variable or parameter becomes
+                                                visible in the current scope
+            variable(position, name, write)     for each use of a variable (the
+                                                name starting a prefix
+                                                expression), <write> is true if
+                                                the variable itself is assigned
+            finish()                            after the parse
+        Positions have the format (<line_number>, <token_number>) and are the
+        ones of the first token of the construct. Events are delivered once the
+        parser will no longer backtrack over them, at the end of the parse (or
+        after each top level statement with parse_stream). Events no registered
+        analysis handles are not recorded.
+            Arguments:
+                <analysis>  :   object handling the events
+
+            Output:
+                None
+        '''
+        self._passes.append(analysis)
+        self._subscribe()
+
+    def remove_pass(self, analysis):
+        '''
+        Unregisters an analysis registered with add_pass.
+        '''
+        self._passes.remove(analysis)
+        self._subscribe()
+
+    def _subscribe(self):
+        '''
+        Updates the set of events handled by at least one registered analysis.
+        '''
+        self._subscribed = frozenset(_event for _event in _pass_events
+                                     for _analysis in self._passes
+                                     if hasattr(_analysis, _event))
+        self._scoping = not self._subscribed.isdisjoint((
+            'open_scope', 'close_scope', 'local', 'variable'))
+
+    def emit(self, event, *args):
+        '''
+        Records an event at the current head position. Events are only
+        delivered if the head does not move back before this position.
+            Arguments:
+                <event>     :   name of the method of the analyses to call
+                <args>      :   arguments of the method, starting with the
+                                position of the construct
+
+            Output:
+                None
+        '''
+        self._events.append((self.position_get(), event, args))
+
+    def emit_statement(self, before):
+        '''
+        Records a statement event for the statement following position
+        <before>.
+        '''
+        _position = self.next_position(before)
+        self.emit('statement', _position,
+                  self.token_list[_position[0]][_position[1]])
+
+    def retract_events(self):
+        '''
+        Drops the events recorded after the current head position, whose tokens
+        will be parsed again.
+        '''
+        _head = (self._cl, self._ct)
+        while self._events and self._events[-1][0] > _head:
+            self._events.pop()
+
+    def retract_functions(self):
+        '''
+        Drops the function declarations whose keyword is after the current head
+        position, as they will be parsed, and saved, again.
+        '''
+        _head = [self._cl, self._ct]
+        while (self.function_position_list and
+               self.function_position_list[-1][:2] > _head):
+            self.function_position_list.pop()
+            self.function_list.pop()
+        self._last_function = tuple(self.function_position_list[-1][:2]) if \
+            self.function_position_list else _NO_FUNCTION
+
+    def dispatch_events(self):
+        '''
+        Delivers the recorded events to the registered analyses. The events are
+        kept if no analysis is registered.
+            Arguments:
+                None
+
+            Output:
+                None
+        '''
+        if not self._passes:
+            return
+        _events_list = list(self._events)
+        del self._events[:]
+        self.deliver_events([(_event, _args) for _position, _event, _args in
+                             _events_list])
+
+    def deliver_events(self, events):
+        '''
+        Calls the methods of the registered analyses for a list of events.
+            Arguments:
+                <events>        :   list of tuples (<event>, <arguments>)
+
+            Output:
+                None
+        '''
+        _handlers = {_event: [getattr(_analysis, _event)
+                              for _analysis in self._passes
+                              if hasattr(_analysis, _event)]
+                     for _event in self._subscribed}
+        for _event, _args in events:
+            for _handler in _handlers.get(_event, ()):
+                _handler(*_args)
+
+    def open_scope(self):
+        '''
+        Records an open_scope event. Returns true so that it can be chained
+        with the parse functions.
+        '''
+        if 'open_scope' in self._subscribed:
+            self.emit('open_scope', self.position_get())
+        return True
+
+    def close_scope(self):
+        '''
+        Records a close_scope event. Returns true.
+        '''
+        if 'close_scope' in self._subscribed:
+            self.emit('close_scope', self.position_get())
         return True
-    except:
+
+    def reference(self, write=False):
+        '''
+        Records a variable event for the name at the head position. Returns
+        true.
+        '''
+        if 'variable' in self._subscribed:
+            self.emit('variable', self.position_get(), self.get_token(), write)
+        return True
+
+    def assign_reference(self, before):
+        '''
+        Marks the variable event of an assignment target made of a single name
+        as a write. The name is the only token after position <before> and its
+        event was the last one recorded.
+        '''
+        _position = self.position_get()
+        if (self._events and self._events[-1][1] == 'variable' and
+                self._events[-1][0] == _position and
+                self.next_position(before) == _position):
+            self._events[-1] = (_position, 'variable',
+                                (_position, self.get_token(), True))
+
+    def declare_names(self, first):
+        '''
+        Records local events for a list of names separated by commas starting
+        at position <first>, such as the names of a local statement or the
+        parameters of a function.
+        '''
+        if 'local' not in self._subscribed:
+            return
+        _position = first
+        while True:
+            _token = self.token_list[_position[0]][_position[1]]
+            if not re.fullmatch(name, _token) or re.fullmatch(keyword, _token):
+                return
+            self.emit('local', _position, _token)
+            _position = self.next_position(_position)
+            if self.token_list[_position[0]][_position[1]] != ',':
+                return
+            _position = self.next_position(_position)
+
+    def reference_funcname(self, keyword_position):
+        '''
+        Records the variable event of the first name of a function statement,
+        a write if the function name is a single name. The funcname ends at the
+        head position.
+            Arguments:
+                <keyword_position>  :   position of the 'function' keyword
+
+            Output:
+                Returns true if the function is a method (its name contains a
+                colon).
+        '''
+        _first = self.next_position(keyword_position)
+        _head = self.position_get()
+        if 'variable' in self._subscribed:
+            self.emit('variable', _first,
+                      self.token_list[_first[0]][_first[1]], _first == _head)
+        _position = _first
+        while _position < _head:
+            _position = self.next_position(_position)
+            if self.token_list[_position[0]][_position[1]] == ':':
+                return True
         return False
 
-##############################################################################
-# Error functions
+    def notify_passes(self, method):
+        '''
+        Calls <method> ('start' or 'finish') of the analyses which have it.
+        '''
+        for _analysis in self._passes:
+            if hasattr(_analysis, method):
+                getattr(_analysis, method)()
+
+
+    ##########################################################################
+    # Work budget
+
+    def set_budget(self, token_visits=None, backtracking_steps=None,
+                   nesting_depth=None, seconds=None):
+        '''
+        Sets the work budget of the following parses. Every limit is optional.
+            Arguments:
+                token_visits:       Maximum number of times the head moves to a
+                                    token.
+                backtracking_steps: Maximum number of times the head moves
+                back. nesting_depth: Maximum nesting of blocks and expressions.
+                seconds: Maximum duration of a parse.
+
+            Output:
+                None
+        '''
+        self.max_token_visits = token_visits
+        self.max_backtracking_steps = backtracking_steps
+        self.max_nesting_depth = nesting_depth
+        self.max_seconds = seconds
+
+    def get_budget(self):
+        '''
+        Returns the current work budget as a tuple of the arguments of
+        set_budget.
+        '''
+        return (self.max_token_visits, self.max_backtracking_steps,
+                self.max_nesting_depth, self.max_seconds)
+
+    def get_work(self):
+        '''
+        Returns the work done by the last parse as a tuple (<token visits>,
+        <backtracking steps>), counted as for the work budget.
+        '''
+        return self._visits, self._steps
+
+    def start_budget(self):
+        '''
+        Resets the counters of the work budget at the start of a parse.
+            Arguments:
+                None
+
+            Output:
+                None
+        '''
+        self._visits = 0
+        self._steps = 0
+        self._depth = 0
+        self.budget_exceeded = None
+        _inf = float('inf')
+        self._visit_limit = (_inf if self.max_token_visits is None else
+                             self.max_token_visits)
+        self._step_limit = _inf if self.max_backtracking_steps is None else \
+            self.max_backtracking_steps
+        self._depth_limit = (_inf if self.max_nesting_depth is None else
+                             self.max_nesting_depth)
+        self._deadline = None if self.max_seconds is None else \
+            time.monotonic() + self.max_seconds
+
+    def stop_budget(self, message):
+        '''
+        Records why the parse is stopped and stops it.
+            Arguments:
+                message:    Reason shown to the user.
+
+            Output:
+                Raises BudgetExceeded.
+        '''
+        self.budget_stop_message(message)
+        raise BudgetExceeded(message)
+
+    def budget_stop_message(self, message):
+        '''
+        Records why the parse was stopped at the current head position.
+            Arguments:
+                message:    Reason shown to the user.
+
+            Output:
+                None
+        '''
+        self.budget_exceeded = [self._cl, self._ct, message]
+
+
+    ##########################################################################
+    # Progress and cancellation
+
+    def set_progress(self, callback=None, interval=0.01, cancel=None):
+        '''
+        Sets the progress callback and the cancellation token of the following
+        parses. Both are optional and cost a single test per statement when
+        neither is set.
+            Arguments:
+                callback: Called with the fraction of the lines consumed, from
+                0
+                            to 1, each time it grows by at least <interval>,
+                            and with 1.0 when the parse completes. Not called
+                            by parse_stream, which does not know the length of
+                            its input.
+                interval:   0.01 by default. Fraction of the lines between two
+                            calls of <callback>.
+                cancel:     Object with an is_set() method, such as a
+                            threading.Event, checked at each statement
+                            boundary. Once it is set the parse stops as when
+                            the work budget is exceeded: budget_exceeded holds
+                            the position and CANCELLED, and the errors and
+                            functions found before are kept.
+
+            Output:
+                None
+        '''
+        self.progress_callback = callback
+        self.progress_interval = interval
+        self.cancel_token = cancel
+
+    def get_progress(self):
+        '''
+        Returns the current settings as a tuple of the arguments of
+        set_progress.
+        '''
+        return (self.progress_callback, self.progress_interval,
+                self.cancel_token)
+
+    def start_watch(self):
+        '''
+        Prepares the progress reports and the cancellation checks at the start
+        of a parse, after the input is lexed.
+            Arguments:
+                None
+
+            Output:
+                None
+        '''
+        self._watching = (self.progress_callback is not None or
+                          self.cancel_token is not None)
+        self._progress_total = None
+        if (self.progress_callback is not None and
+                isinstance(self.token_list, list)):
+            self._progress_total = max(1, len(self.token_list) - 1)
+            self._progress_step = max(1, int(self._progress_total *
+                                             self.progress_interval))
+            self._progress_line = self._progress_step
+
+    def watch(self):
+        '''
+        Reports the progress and checks the cancellation token. Called at the
+        statement boundaries when _watching is true.
+            Arguments:
+                None
+
+            Output:
+                Raises BudgetExceeded if the parse is cancelled.
+        '''
+        if (self._progress_total is not None and
+            self._cl >= self._progress_line and
+                self._cl < self._progress_total):
+            self._progress_line = self._cl + self._progress_step
+            self.progress_callback(self._cl / self._progress_total)
+        if self.cancel_token is not None and self.cancel_token.is_set():
+            self.stop_budget(CANCELLED)
+
+
+    ##########################################################################
+    # Heat map
+    # The heat map counts how many times the head lands on each token, through
+    # inc_position and position_set. A token visited many times is re-scanned
+    # by backtracking: the amplification of a line or file is its number of
+    # visits divided by its number of tokens, 1 for a single pass.
+
+    def set_heat_map(self, enabled=True):
+        '''
+        Enables or disables the heat map of the following parses. The heat map
+        of a parse is returned by get_heat_map. The streaming parse is not
+        counted.
+            Arguments:
+                enabled:    True by default.
+
+            Output:
+                None
+        '''
+        self.heat_map_enabled = enabled
+
+    def get_heat_map(self):
+        '''
+        Returns the visits of each token position of the last parse, indexed
+        like token_list, or None if the heat map was not enabled.
+        '''
+        return self._heat
+
+    def start_heat(self):
+        '''
+        Resets the visits of the heat map at the start of a parse, after the
+        input is lexed.
+            Arguments:
+                None
+
+            Output:
+                None
+        '''
+        self._heat = None
+        if self.heat_map_enabled and isinstance(self.token_list, list):
+            self._heat = [[0] * len(_tokens) for _tokens in self.token_list]
+
+    def heat_summary(self, heat=None, tokens=None):
+        '''
+        Computes the amplification of a file and of each of its lines. The
+        empty tokens of blank lines and the start and end symbols are not
+        counted.
+            Arguments:
+                <heat>      :   None by default. Visits returned by
+                                get_heat_map, those of the last parse if None
+                <tokens>    :   None by default. Token list of the file,
+                                token_list if None
+
+            Output:
+                Returns a dictionary with the visits, tokens and amplification
+                of the file, and the list 'lines' of dictionaries with the line
+                number, visits, tokens and amplification of each line with
+                tokens, and 'token_visits', the list of [<token>, <visits>] of
+                the line.
+        '''
+        if heat is None:
+            heat = self._heat
+        if tokens is None:
+            tokens = self.token_list
+        lines = []
+        for _line in range(1, len(tokens) - 1):
+            _visits = [[_token, _count] for _token, _count in
+                       zip(tokens[_line], heat[_line]) if _token != '']
+            if not _visits:
+                continue
+            _sum = sum(_count for _token, _count in _visits)
+            lines.append({'line': _line, 'visits': _sum,
+                          'tokens': len(_visits),
+                          'amplification': _sum / len(_visits),
+                          'token_visits': _visits})
+        visits = sum(_line['visits'] for _line in lines)
+        count = sum(_line['tokens'] for _line in lines)
+        return {'visits': visits, 'tokens': count,
+                'amplification': visits / count if count else 0.0,
+                'lines': lines}
+
+    def print_heat(self, filename, summary, lines=None, top=10):
+        '''
+        Prints the amplification of a file, its most amplified lines and its
+        source annotated with the amplification of each line.
+
+            Arguments:
+                filename:   File name used for the leader.
+                summary:    Dictionary returned by heat_summary.
+                lines:      Source lines, _line_list if None.
+                top:        Number of most amplified lines listed.
+
+            Output:
+                Prints to stdout.
+        '''
+        if lines is None:
+            lines = self._line_list
+        print("\n{0}: {1} visits of {2} tokens, amplification {3:.2f}".format(
+            filename, summary['visits'], summary['tokens'],
+            summary['amplification']))
+        _hottest = sorted(summary['lines'], key=lambda _line: (
+            -_line['amplification'], -_line['visits'], _line['line']))[:top]
+        if _hottest:
+            print("Most amplified lines:")
+        for _line in _hottest:
+            print("  line {0}: {1:.2f} ({2} visits of {3} tokens)".format(
+                _line['line'], _line['amplification'], _line['visits'],
+                _line['tokens']))
+        print()
+        _amplification = dict((_line['line'], _line['amplification'])
+                              for _line in summary['lines'])
+        for _number, _text in enumerate(lines, 1):
+            _factor = _amplification.get(_number)
+            print("{0:6d} {1:>8} | {2}".format(
+                _number, '' if _factor is None else "{0:.2f}".format(_factor),
+                _text.rstrip('\n')))
+
+
+    ##########################################################################
+    # Error functions
+
+    def skip_and_test(self, error_msg, function, *args, last_stat=False):
+        '''
+        Tries to execute function <function> with potential arguments <*args>.
+        If the function returns a negative value, <error_msg> is stored at
+        current head position and input tokens are skipped until a valid parse
+        of the function could be made or the statement ends. The constructs
+        closed on the line are skipped as a whole with skip_construct.
+        <last_stat> allows to ckeck if the function parsed until the end of the
+        statement. This is used in cases where a parse function might return
+        true without having parsed the entirety of the desired input stream
+        portion. For example in the case:
+            repeat
+                -- something
+            until x 34
+
+        Then we want parse_exp to parse until end of statement and not just
+        parse 'x' as a valid expression which will raise future errors as the
+        '34' is not recognized as an error in the expression but as an error in
+        the next statement. Hence <last_stat> = True forces the 34 to be
+        recognized as an error in the expression (e.g. missing '>').
+
+            Arguments:
+                error_msg: Error message to be displayed if a parse could not
+                                be performed.
+                function: Function used to try parsing the next portion of
+                                the input stream.
+                *args: Potential arguments to <function>. last_stat: False by
+                default, complete behaviour described in
+                                function description.
+
+            Output:
+                Returns True when the function has completed its intended
+                behaviour
+        '''
+        if not function(*args):
+            _save = self.position_get()
+            self.error(error_msg)
+
+            if args:
+                self.red_position()
+
+            if self.match(';'):
+                return True
+            if list(self.position_get())[0] != _save[0]:
+                self.position_set((_save[0],
+                                   len(self.token_list[_save[0]]) - 1))
+                return True
+        else:
+            if last_stat:
+                _temp = self.position_get()
+                self.next_statement()
+                if self.position_get() != _temp:
+                    self.error(error_msg, True, _temp)
+            return True
 
-def skip_and_test(error_msg, function, *args, last_stat=False):
-    '''
-    Tries to execute function <function> with potential arguments <*args>. If
-    the function returns a negative value, <error_msg> is stored at current
-    head position and input tokens are skipped until a valid parse of the
-    function could be made or the statement ends.
-    <last_stat> allows to ckeck if the function parsed until the end of the
-    statement. This is used in cases where a parse function might return true
-    without having parsed the entirety of the desired input stream portion.
-    For example in the case:
-        repeat
-            -- something
-        until x 34
-
-    Then we want parse_exp to parse until end of statement and not just parse
-    'x' as a valid expression which will raise future errors as the '34' is not
-    recognized as an error in the expression but as an error in the next
-    statement. Hence <last_stat> = True forces the 34 to be recognized as an
-    error in the expression (e.g. missing '>').
+        while not function(*args):
+            if args:
+                self.red_position()
 
-        Arguments:
-            error_msg:      Error message to be displayed if a parse could not
-                            be performed.
-            function:       Function used to try parsing the next portion of
-                            the input stream.
-            *args:          Potential arguments to <function>.
-            last_stat:      False by default, complete behaviour described in
-                            function description.
+            if self.skip_construct():
+                continue
 
-        Output:
-            Returns True when the function has completed its intended behaviour
-    '''
-    if not function(*args):
-        _save = position_get()
-        error(error_msg)
+            if self.match(';'):
+                break
 
-        if args:
-            red_position()
+            if self.get_token() == '___eof___':
+                break
 
-        if match(';'):
-            return True
-        if list(position_get())[0] != _save[0]:
-            position_set((_save[0], len(token_list[_save[0]]) - 1))
-            return True
-    else:
-        if last_stat:
-            _temp = position_get()
-            next_statement()
-            if position_get() != _temp:
-                error(error_msg, True, _temp)
+            if self.position_get()[0] != _save[0]:
+                self.position_set((_save[0],
+                                   len(self.token_list[_save[0]]) - 1))
+                break
         return True
 
-    while not function(*args):
-        if args:
-            red_position()
 
-        if match(';'):
-            break
+    def error(self, string, placement=False, position=(0, 0)):
+        '''
+        Stores an error message <string> at position <position> in the input
+        stream if <placement> is True. Otherwise <position> is assumed to be
+        the current head position when the function is called. Note that errors
+        are saved in error_list.
+
+            Arguments:
+                string: Error message to be stored. placement: False by
+                default. Used for custom placement of errors.
+                            This is mainly useful when storing the location of
+                            a potential error and continuing the parse. If a
+                            valid follow up is found, this allows to save the
+                            position of the error when having already consumed
+                            several tokens beyond the error.
+                position:   (0,0) by default. This is the position in the input
+                            stream where the error was detected. If <placement>
+                            is false, this will be overwritten with the current
+                            position of the head when the function was called.
+
+            Output:
+                None
+        '''
+        if not placement:
+            position = self.position_get()
+
+        _temp = list(position)
+        _temp.append(string)
+        self.error_list.append(_temp)
+
+    def print_errors(self, filename):
+        '''
+        Prints "Errors found." and the errors if some are found. Otherwise it
+        will print "No errors found.".
+
+            Arguments:
+                filename: File name of the input file. This is used for the
+                error
+                            leader.
+
+            Output:
+                Prints errors to stdout.
+        '''
+        if self.budget_exceeded is not None:
+            print("Parse stopped\n")
+            for error in self.error_list + [self.budget_exceeded]:
+                self.print_error(filename, error)
+        elif not self.error_list:
+            print("No errors found\n")
+        else:
+            print("Errors found\n")
+            for error in self.error_list:
+                self.print_error(filename, error)
+
+    def print_error(self, filename, error):
+        '''
+        Prints a single error and the line it was found on.
+
+            Arguments:
+                filename: File name of the input file. This is used for the
+                error
+                            leader.
+                error:      Error with format [<line>, <token>, <message>]. The
+                            tokens of the line can be given as a fourth
+                            element, otherwise they are read from token_list.
+
+            Output:
+                Prints the error to stdout.
+        '''
+        print("{0}, line {1}: {2}".format(filename, error[0], error[2]))
+        if len(error) > 3:
+            self.print_last_tokens(error[0], error[1], error[3])
+        else:
+            self.print_last_tokens(error[0], error[1])
+
+    def print_last_tokens(self, line, token, tokens=None):
+        '''
+        Parses the production:
+                Prints the line an error was found on and pinpoints the
+                location of the error with a ^ sign.
+
+            Arguments:
+                line:       Line the error was found on.
+                token:      Token that generated the error.
+                tokens:     None by default. Tokens of the line if they are no
+                            longer in token_list.
+
+            Output:
+                Prints to stdout.
+        '''
+        if tokens is None:
+            tokens = self.token_list[line]
+        _sum = 0
+        print('\t', end='')
+        for _token_number, _token in enumerate(tokens):
+            if _token_number < token:
+                _sum += len(_token) + 1
+            print(_token, end=' ')
+        print("{0}{1}{2}".format('\n\t', ' '*(_sum), "^"))
+
+
+    ##########################################################################
+    # Function reporting
+
+    def save_function(self):
+        '''
+        Saves a function declaration if it is a named function. All named
+        function declarations are saved to function_list using positions stored
+        during parsing to detect the beginning and the end of the function name
+        and parameters. The position of the 'function' keyword and whether the
+        function is local are saved to function_position_list with format
+        [<line_number>, <token_number>, <local>].
+
+            Arguments:
+                None
+
+            Output:
+                None
+        '''
+        # The declaration is read without moving the head, which would retract
+        # the events of the function body.
+        _temp_list = []
+        _position = tuple(self._function_temp_beg)
+        _local = self.token_list[_position[0]][_position[1]] == 'local'
+        _position = self.next_position(_position)
+        self.function_position_list.append(list(_position) + [_local])
+        self._last_function = _position
+        _keyword = _position
+        while True:
+            _position = self.next_position(_position)
+            _temp_list.append(self.token_list[_position[0]][_position[1]])
+            if _position == self._function_temp_end:
+                break
+        self.function_list.append(_temp_list)
+        if 'function' in self._subscribed:
+            self.emit('function', _keyword, _temp_list, _local)
 
-        if get_token() == '___eof___':
-            break
+    def print_functions(self):
+        '''
+        Prints functions stored in function_list to the command line.
 
-        if position_get()[0] != _save[0]:
-            position_set((_save[0], len(token_list[_save[0]]) - 1))
-            break
-    return True
+            Arguments:
+                None
 
+            Output:
+                Prints to stdout.
+        '''
+        print("Declared functions:")
+        for _line in self.function_list:
+            print("  ", end='')
+            for _token in _line:
+                print(_token, end='')
+            print()
 
-def error(string, placement=False, position=(0, 0)):
-    '''
-    Stores an error message <string> at position <position> in the input stream
-    if <placement> is True. Otherwise <position> is assumed to be the current
-    head position when the function is called. Note that errors are saved in
-    error_list.
 
-        Arguments:
-            string:     Error message to be stored.
-            placement:  False by default. Used for custom placement of errors.
-                        This is mainly useful when storing the location of a
-                        potential error and continuing the parse. If a valid
-                        follow up is found, this allows to save the position
-                        of the error when having already consumed several
-                        tokens beyond the error.
-            position:   (0,0) by default. This is the position in the input
-                        stream where the error was detected. If <placement>
-                        is false, this will be overwritten with the current
-                        position of the head when the function was called.
+##############################################################################
+# Default parser
+# The functions of this module named like the public methods of Parser run
+# them on _parser, the default parser, and its state is read as attributes
+# of this module, such as Luaparser.error_list. A worker process of a
+# parallel parse parses with its own default parser.
+_parser = Parser()
 
-        Output:
-            None
+def _default(name):
+    '''
+    Returns the function running the method <name> of the default parser.
     '''
-    global error_list
-    if not placement:
-        position = position_get()
+    method = getattr(Parser, name)
 
-    _temp = list(position)
-    _temp.append(string)
-    error_list.append(_temp)
+    @functools.wraps(method)
+    def function(*args, **kwargs):
+        return method(_parser, *args, **kwargs)
+    function.__qualname__ = name
+    return function
 
-def print_errors(filename):
+for _name in [_name for _name in vars(Parser) if not _name.startswith('_')]:
+    globals()[_name] = _default(_name)
+del _name
+
+def __getattr__(name):
+    '''
+    Returns the state <name> of the default parser, such as token_list or
+    budget_exceeded. Raises AttributeError if the parser has no such state.
     '''
-    Prints "Errors found." and the errors if some are found. Otherwise it will
-    print "No errors found.".
+    try:
+        return vars(_parser)[name]
+    except KeyError:
+        raise AttributeError("module {0!r} has no attribute {1!r}".format(
+            __name__, name)) from None
 
-        Arguments:
-            filename:   File name of the input file. This is used for the error
-                        leader.
+##############################################################################
 
-        Output:
-            Prints errors to stdout.
-    '''
-    if not error_list:
-        print("No errors found\n")
-    else:
-        print("Errors found\n")
-        for error in error_list:
-            print("{0}, line {1}: {2}".format(filename, error[0], error[2]))
-            print_last_tokens(error[0], error[1])
+# Command line interface
 
-def print_last_tokens(line, token):
+def main(argv):
     '''
-    Parses the production:
-            Prints the line an error was found on and pinpoints the location
-            of the error with a ^ sign.
+    Runs the parser from the command line.
 
         Arguments:
-            line:       Line the error was found on.
-            token:      Token that generated the error.
+            argv:       Command line arguments without the program name.
 
         Output:
             Prints to stdout.
     '''
-    _sum = 0
-    print('\t', end='')
-    for _token_number, _token in enumerate(token_list[line]):
-        if _token_number < token:
-            _sum += len(_token) + 1
-        print(_token, end=' ')
-    print("{0}{1}{2}".format('\n\t', ' '*(_sum), "^"))
-
-##############################################################################
-# Function reporting
+    arg_parser = argparse.ArgumentParser(
+        description="Checks lua source files for syntax errors.")
+    arg_parser.add_argument('filename', help="file to be parsed")
+    # Each mode runs a different parse, or none: they can not be combined.
+    modes = arg_parser.add_mutually_exclusive_group()
+    modes.add_argument('--stream', action='store_true',
+                       help="parse one statement at a time and report "
+                            "results as soon as they are found")
+    modes.add_argument('-j', '--jobs', type=int, metavar='N',
+                       help="split the file and parse it in N processes")
+    arg_parser.add_argument('--max-tokens', type=int, metavar='N',
+                            help="stop after N token visits")
+    arg_parser.add_argument('--max-steps', type=int, metavar='N',
+                            help="stop after N backtracking steps")
+    arg_parser.add_argument('--max-depth', type=int, metavar='N',
+                            help="stop beyond N nested blocks and "
+                                 "expressions")
+    arg_parser.add_argument('--timeout', type=float, metavar='SECONDS',
+                            help="stop after SECONDS seconds")
+    modes.add_argument('--memory', action='store_true',
+                       help="print the memory used by each phase")
+    modes.add_argument('--quick', action='store_true',
+                       help="only screen the file with a single pass over "
+                            "its tokens")
+    modes.add_argument('--outline', action='store_true',
+                       help="only list the declared functions with their "
+                            "line ranges, without parsing")
+    modes.add_argument('--heat', action='store_true',
+                       help="print the amplification of backtracking by "
+                            "line and the annotated source")
+    arg_parser.add_argument('--heat-map', metavar='FILE',
+                            help="write the visits of each token to FILE in "
+                                 "JSON")
+    arg_parser.add_argument('--progress', action='store_true',
+                            help="show the progress on stderr, Ctrl-C stops "
+                                 "the parse and prints what was found")
+    args = arg_parser.parse_args(argv)
+    # --heat-map is the mode of --heat and may be given with it. The
+    # progress is only reported by the parses run in this process.
+    for _option, _given in (('--stream', args.stream),
+                            ('-j/--jobs', args.jobs is not None),
+                            ('--memory', args.memory),
+                            ('--quick', args.quick),
+                            ('--outline', args.outline)):
+        if _given and args.heat_map:
+            arg_parser.error("argument --heat-map: not allowed with "
+                             "argument {0}".format(_option))
+        if _given and args.progress and _option not in ('--stream',
+                                                        '--memory'):
+            arg_parser.error("argument --progress: not allowed with "
+                             "argument {0}".format(_option))
+
+    set_budget(args.max_tokens, args.max_steps, args.max_depth, args.timeout)
+    if args.progress:
+        _cancel = threading.Event()
+        signal.signal(signal.SIGINT, lambda _signal, _frame: _cancel.set())
+        set_progress(print_progress, cancel=_cancel)
+    if args.quick:
+        read(args.filename)
+        verdict, notes = quick_check()
+        print_quick(args.filename, verdict, notes)
+        sys.exit({'pass': 0, 'fail': 1, 'full': 4}[verdict])
+    elif args.outline:
+        read(args.filename)
+        print_outline(outline())
+    elif args.stream:
+        print_stream(args.filename)
+    elif args.jobs:
+        parse_parallel(args.filename, args.jobs)
+    elif args.memory:
+        print_memory(profile_memory(args.filename))
+    elif args.heat or args.heat_map:
+        set_heat_map()
+        parse(args.filename, fast_path=False)
+        summary = heat_summary()
+        if args.heat_map:
+            write_heat_map(args.filename, summary, args.heat_map)
+        if args.heat:
+            print_heat(args.filename, summary)
+    else:
+        parse(args.filename)
+    if _parser.budget_exceeded is not None:
+        sys.exit(3)
 
-def save_function():
+def print_progress(fraction):
     '''
-    Saves a function declaration if it is a named function. All named function
-    declarations are saved to function_list using positions stored during
-    parsing to detect the beginning and the end of the function name and
-    parameters.
+    Shows the progress of a parse on stderr, used as progress callback.
 
         Arguments:
-            None
+            fraction:   Fraction of the lines consumed.
 
         Output:
-            None
+            Prints to stderr.
     '''
-    _save = position_get()
-    _temp_list = []
-    position_set(_function_temp_beg)
-    inc_position()
-    while True:
-        _temp_list.append(get_next_token())
-        if position_get() == _function_temp_end:
-            break
-    function_list.append(_temp_list)
-
-    position_set(_save)
+    sys.stderr.write("{0:3.0f}%{1}".format(fraction * 100,
+                                           '\n' if fraction >= 1.0 else '\r'))
+    sys.stderr.flush()
 
-def print_functions():
+def print_stream(filename):
     '''
-    Prints functions stored in function_list to the command line.
+    Prints the errors and declared functions of a file as parse_stream finds
+    them.
 
         Arguments:
-            None
+            filename:   File to be parsed.
 
         Output:
             Prints to stdout.
     '''
-    print("Declared functions:")
-    for _line in function_list:
-        print("  ", end='')
-        for _token in _line:
-            print(_token, end='')
-        print()
+    errors = 0
+    stopped = False
+    try:
+        for kind, item in parse_stream(filename):
+            if kind == 'error':
+                errors += 1
+                print_error(filename, item)
+            elif kind == 'budget':
+                stopped = True
+                print_error(filename, item)
+            else:
+                print("Declared function: {0}".format(''.join(item)))
+    except IOError:
+        print("File not found.")
+        sys.exit(1)
+    if stopped:
+        print("\nParse stopped, {0} errors found".format(errors))
+        sys.exit(3)
+    elif errors:
+        print("\n{0} errors found".format(errors))
+    else:
+        print("\nNo errors found")
 
 ##############################################################################
 
 # Allow the code to be run as a main script from the command line and take
 # an argument from the command line to parse.
 if __name__ == "__main__":
-    parse(sys.argv[1])
+    main(sys.argv[1:])
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+'''
+This script reports the global variables used by lua files: assignments to
+global variables, which are often locals missing their 'local' keyword, and
+reads of global variables which are neither assigned in the file nor part of
+the standard library.
+
+    Usage:
+        python3 Luascope.py [--all] [--globals <names>] [--timeout S]
+                            <path> ...
+
+            Analyses the lua files found under the paths. --all also reports
+            every read of a global variable. --globals adds a comma separated
+            list of names to the known globals. With --timeout the parse of a
+            file is stopped after S seconds.
+
+    The scopes are tracked during the parse by a ScopeAnalysis registered
+    with Luaparser.add_pass, so each file is parsed once and every name is
+    resolved in constant time.
+'''
+import sys
+import os
+import argparse
+
+import Luaparser
+
+
+# Global variables defined by the lua 5.1 interpreter
+builtins = frozenset((
+    '_G', '_VERSION', 'arg', 'assert', 'collectgarbage', 'coroutine', 'debug',
+    'dofile', 'error', 'gcinfo', 'getfenv', 'getmetatable', 'io', 'ipairs',
+    'load', 'loadfile', 'loadstring', 'math', 'module', 'newproxy', 'next',
+    'os', 'package', 'pairs', 'pcall', 'print', 'rawequal', 'rawget',
+    'rawset', 'require', 'select', 'setfenv', 'setmetatable', 'string',
+    'table', 'tonumber', 'tostring', 'type', 'unpack', 'xpcall'))
+
+
+class ScopeAnalysis:
+    '''
+    Analysis pass resolving the variables of a file to locals or globals.
+    The number of visible declarations of each name is kept up to date as
+    scopes are opened and closed, so a name is local if its count is not
+    zero.
+
+    After the parse, global_reads and global_writes hold the uses of global
+    variables as tuples (<position>, <name>) in the order of the input.
+    '''
+
+    def start(self):
+        self.global_reads = []
+        self.global_writes = []
+        self._visible = {}
+        self._scopes = [[]]
+
+    def open_scope(self, position):
+        self._scopes.append([])
+
+    def close_scope(self, position):
+        # The scope of the file is never closed, even when error recovery
+        # skips the opening of a block.
+        if len(self._scopes) == 1:
+            return
+        for _name in self._scopes.pop():
+            if self._visible[_name] == 1:
+                del self._visible[_name]
+            else:
+                self._visible[_name] -= 1
+
+    def local(self, position, name):
+        self._scopes[-1].append(name)
+        self._visible[name] = self._visible.get(name, 0) + 1
+
+    def variable(self, position, name, write):
+        if name in self._visible:
+            return
+        if write:
+            self.global_writes.append((position, name))
+        else:
+            self.global_reads.append((position, name))
+
+    def undefined(self, known=builtins):
+        '''
+        Returns the reads of global variables which are neither in <known>
+        nor assigned in the file, as tuples (<position>, <name>).
+        '''
+        _assigned = set(_name for _position, _name in self.global_writes)
+        return [(_position, _name) for _position, _name in self.global_reads
+                if _name not in _assigned and _name not in known]
+
+
+def analyze(filename):
+    '''
+    Parses a file with a ScopeAnalysis registered. The tokens and errors of
+    the parse are left in Luaparser until the next parse.
+        Arguments:
+            <filename>  :   file to be analysed
+
+        Output:
+            Returns the ScopeAnalysis. Raises IOError if the file can not be
+            read and ValueError if it can not be lexed.
+    '''
+    analysis = ScopeAnalysis()
+    Luaparser.reset()
+    with open(filename, 'rt') as input_file:
+        Luaparser._line_list.extend(input_file)
+    Luaparser.lex()
+    Luaparser.add_pass(analysis)
+    try:
+        Luaparser.parse_input()
+    finally:
+        Luaparser.remove_pass(analysis)
+    return analysis
+
+def find_files(paths):
+    '''
+    Lists the lua files under a list of files and directories.
+    '''
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for directory, _dirs, files in os.walk(path):
+            _dirs.sort()
+            for name in sorted(files):
+                if name.endswith('.lua'):
+                    yield os.path.join(directory, name)
+
+def report(filename, analysis, known=builtins, all_reads=False):
+    '''
+    Prints the global variables of a file analysed by analyze.
+
+        Arguments:
+            filename:   File name used for the error leader.
+            analysis:   ScopeAnalysis of the file.
+            known:      Names of the globals defined outside of the file.
+            all_reads:  False by default. If True, every read of a global
+                        variable is printed.
+
+        Output:
+            Prints to stdout. Returns the number of reported uses.
+    '''
+    uses = [(_p, "Assignment to global variable '{0}'.".format(_n))
+            for _p, _n in analysis.global_writes]
+    if all_reads:
+        uses += [(_p, "Read of global variable '{0}'.".format(_n))
+                 for _p, _n in analysis.global_reads]
+    else:
+        uses += [(_p, "Undefined global variable '{0}'.".format(_n))
+                 for _p, _n in analysis.undefined(known)]
+    for _position, _message in sorted(uses):
+        Luaparser.print_error(filename, [_position[0], _position[1],
+                                         _message])
+    if Luaparser.error_list or Luaparser.budget_exceeded is not None:
+        print("{0}: {1} syntax errors{2}, the report may be incomplete".format(
+            filename, len(Luaparser.error_list),
+            '' if Luaparser.budget_exceeded is None else
+            ' and parse stopped'))
+    return len(uses)
+
+##############################################################################
+
+def main(argv):
+    '''
+    Runs the analysis from the command line.
+
+        Arguments:
+            argv:       Command line arguments without the program name.
+
+        Output:
+            Prints to stdout. Exits with status 1 if a global variable was
+            reported.
+    '''
+    arg_parser = argparse.ArgumentParser(
+        description="Reports the global variables used by lua files.")
+    arg_parser.add_argument('paths', nargs='+', metavar='path')
+    arg_parser.add_argument('--all', action='store_true',
+                            help="report every read of a global variable")
+    arg_parser.add_argument('--globals', default='', metavar='NAMES',
+                            help="comma separated names of known globals")
+    arg_parser.add_argument('--timeout', type=float, metavar='SECONDS',
+                            help="stop the parse of a file after SECONDS "
+                                 "seconds")
+    args = arg_parser.parse_args(argv)
+
+    known = builtins | frozenset(_name for _name in args.globals.split(',')
+                                 if _name)
+    Luaparser.set_budget(seconds=args.timeout)
+    reported = 0
+    for filename in find_files(args.paths):
+        try:
+            analysis = analyze(filename)
+        except IOError:
+            print("{0}: File not found.".format(filename))
+            continue
+        except ValueError:
+            print("{0}: File could not be lexed.".format(filename))
+            continue
+        reported += report(filename, analysis, known, args.all)
+    if reported:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+'''
+This script checks that the parser scales linearly on pathological inputs.
+Each shape of input (deeply nested parentheses, long index chains, many
+elseifs, long broken lines...) is generated at growing sizes and parsed. The
+growth of the work counters and of the parse time between the smallest and
+the largest size is measured as an exponent: 1 is linear, 2 quadratic.
+
+    Usage:
+        python3 Luastress.py [--bound B] [--time-bound T] [--scale K]
+                             [--list] [shape ...]
+
+            Runs the given shapes, or all of them. A shape fails if the
+            exponent of the token visits or of the backtracking steps is
+            above B (1.2 by default), if the exponent of the time is above T
+            (1.5 by default, only checked when the largest parse takes more
+            than 50 ms), or if a parse is stopped by its work budget. --scale
+            multiplies the sizes by K. The exit status is 1 if a shape
+            fails.
+'''
+import sys
+import math
+import time
+import argparse
+
+import Luaparser
+
+
+# Shapes of input, with a generator of the source for a size and the sizes
+# tried. Nested shapes use small sizes so that they stay below the recursion
+# limit of the interpreter.
+shapes = {
+    'nested_parentheses': (lambda n: 'x = ' + '(' * n + '1' + ')' * n + '\n',
+                           (5, 10, 20, 40)),
+    'nested_tables': (lambda n: 'x = ' + '{' * n + '}' * n + '\n',
+                      (10, 20, 40, 80)),
+    'nested_blocks': (lambda n: 'do\n' * n + 'end\n' * n, (10, 20, 40, 80)),
+    'nested_functions': (lambda n: 'f = function()\n' * n + 'end\n' * n,
+                         (10, 20, 40, 80)),
+    'field_chain': (lambda n: 'x = a' + '.b' * n + '\n', (25, 50, 100, 200)),
+    'index_chain': (lambda n: 'x = a' + '[1]' * n + '\n', (25, 50, 100, 200)),
+    'call_chain': (lambda n: 'f' + '(1)' * n + '\n', (25, 50, 100, 200)),
+    'method_chain': (lambda n: 'o' + ':m()' * n + '\n', (25, 50, 100, 200)),
+    'assigned_chain': (lambda n: 'a' + '.b' * n + ' = 1\n',
+                       (25, 50, 100, 200)),
+    'binary_operators': (lambda n: 'x = 1' + ' + 1' * n + '\n',
+                         (25, 50, 100, 200)),
+    'elseifs': (lambda n: 'if a then\n' + 'elseif b then\n' * n + 'end\n',
+                (250, 500, 1000, 2000)),
+    'missing_elseifs': (lambda n: 'if a then\n' + 'b then\n' * n + 'end\n',
+                        (250, 500, 1000, 2000)),
+    'broken_line': (lambda n: 'x = 1 ' + '1 ' * n + '\n',
+                    (250, 500, 1000, 2000)),
+    'broken_list': (lambda n: 'local x = ' + ', ' * n + '\n',
+                    (250, 500, 1000, 2000)),
+    'broken_statements': (lambda n: 'x = = 1\n' * n, (250, 500, 1000, 2000)),
+    'table_fields': (lambda n: 't = {' + 'a = 1, ' * n + '}\n',
+                     (250, 500, 1000, 2000)),
+    'statements': (lambda n: 'x = f(1)\n' * n, (250, 500, 1000, 2000)),
+}
+
+# Visits allowed per token before a parse is stopped, so that exponential
+# shapes fail quickly instead of running for minutes.
+VISITS_PER_TOKEN = 500
+TIMEOUT = 10.0
+MIN_SECONDS = 0.05
+
+
+def measure(source):
+    '''
+    Parses a source text and measures the work done.
+        Arguments:
+            <source>    :   lua source code
+
+        Output:
+            Returns a tuple (<seconds>, <token visits>, <backtracking steps>,
+            <reason the parse was stopped or None>).
+    '''
+    Luaparser.reset()
+    Luaparser._line_list.extend(source.splitlines(True))
+    Luaparser.lex()
+    _tokens = sum(len(_line) for _line in Luaparser.token_list)
+    _budget = Luaparser.get_budget()
+    Luaparser.set_budget(VISITS_PER_TOKEN * _tokens + 10000, None, None,
+                         TIMEOUT)
+    try:
+        _start = time.perf_counter()
+        Luaparser.parse_input()
+        seconds = time.perf_counter() - _start
+    finally:
+        Luaparser.set_budget(*_budget)
+    visits, steps = Luaparser.get_work()
+    stopped = Luaparser.budget_exceeded
+    Luaparser.reset()
+    return seconds, visits, steps, stopped and stopped[2]
+
+def exponent(sizes, values):
+    '''
+    Returns the growth exponent of <values> between the first and the last
+    of <sizes>: 1 if they grow linearly, 2 if they grow quadratically.
+    '''
+    if values[0] <= 0 or values[-1] <= 0:
+        return 0.0
+    return math.log(values[-1] / values[0]) / math.log(sizes[-1] / sizes[0])
+
+def check_shape(name, scale=1, bound=1.2, time_bound=1.5, repeat=3):
+    '''
+    Measures a shape at all its sizes.
+        Arguments:
+            <name>          :   key of the shape in shapes
+            <scale>         :   1 by default. Factor applied to the sizes
+            <bound>         :   1.2 by default. Highest exponent allowed for
+                                the work counters
+            <time_bound>    :   1.5 by default. Highest exponent allowed for
+                                the parse time
+            <repeat>        :   3 by default. The best of <repeat> parse times
+                                is used for each size
+
+        Output:
+            Returns a dictionary with the keys 'sizes', 'seconds', 'visits',
+            'steps', 'exponents' (of visits, steps and seconds), 'stopped'
+            (first reason a parse was stopped, or None) and 'failures' (list
+            of messages, empty if the shape passed).
+    '''
+    generate, sizes = shapes[name]
+    sizes = [max(1, int(_size * scale)) for _size in sizes]
+    seconds = []
+    visits = []
+    steps = []
+    stopped = None
+    for _size in sizes:
+        _source = generate(_size)
+        _best = None
+        for _run in range(repeat):
+            _seconds, _visits, _steps, _stopped = measure(_source)
+            _best = _seconds if _best is None else min(_best, _seconds)
+            if _stopped:
+                break
+        seconds.append(_best)
+        visits.append(_visits)
+        steps.append(_steps)
+        if _stopped:
+            stopped = "size {0}: {1}".format(_size, _stopped)
+            break
+
+    failures = []
+    exponents = None
+    if stopped:
+        failures.append("Parse stopped at " + stopped)
+    else:
+        exponents = (exponent(sizes, visits), exponent(sizes, steps),
+                     exponent(sizes, seconds))
+        if exponents[0] > bound:
+            failures.append("Token visits grow with exponent {0:.2f}.".format(
+                exponents[0]))
+        if exponents[1] > bound:
+            failures.append("Backtracking steps grow with exponent "
+                            "{0:.2f}.".format(exponents[1]))
+        if seconds[-1] > MIN_SECONDS and exponents[2] > time_bound:
+            failures.append("Parse time grows with exponent {0:.2f}.".format(
+                exponents[2]))
+    return {'sizes': sizes[:len(visits)], 'seconds': seconds,
+            'visits': visits, 'steps': steps, 'exponents': exponents,
+            'stopped': stopped, 'failures': failures}
+
+def print_shape(name, result):
+    '''
+    Prints the measures of a shape returned by check_shape.
+
+        Arguments:
+            name:       Name of the shape.
+            result:     Dictionary returned by check_shape.
+
+        Output:
+            Prints to stdout.
+    '''
+    print("{0}: {1}".format(name, "FAIL" if result['failures'] else "ok"))
+    for _size, _seconds, _visits, _steps in zip(
+            result['sizes'], result['seconds'], result['visits'],
+            result['steps']):
+        print("  size {0:>6}  {1:>10} visits  {2:>10} steps  {3:8.4f} s"
+              .format(_size, _visits, _steps, _seconds))
+    if result['exponents']:
+        print("  exponents: visits {0:.2f}, steps {1:.2f}, time {2:.2f}"
+              .format(*result['exponents']))
+    for _failure in result['failures']:
+        print("  " + _failure)
+
+##############################################################################
+
+def main(argv):
+    '''
+    Runs the stress suite from the command line.
+
+        Arguments:
+            argv:       Command line arguments without the program name.
+
+        Output:
+            Prints to stdout. Exits with status 1 if a shape fails.
+    '''
+    arg_parser = argparse.ArgumentParser(
+        description="Checks that the parser scales linearly on "
+                    "pathological inputs.")
+    arg_parser.add_argument('shapes', nargs='*', metavar='shape',
+                            help="shapes to run (default: all)")
+    arg_parser.add_argument('--bound', type=float, default=1.2,
+                            help="highest exponent of the work counters "
+                                 "(default: 1.2)")
+    arg_parser.add_argument('--time-bound', type=float, default=1.5,
+                            help="highest exponent of the parse time "
+                                 "(default: 1.5)")
+    arg_parser.add_argument('--scale', type=float, default=1,
+                            help="factor applied to the sizes")
+    arg_parser.add_argument('--list', action='store_true',
+                            help="list the shapes and exit")
+    args = arg_parser.parse_args(argv)
+
+    if args.list:
+        for name in shapes:
+            print(name)
+        return
+    unknown = [_name for _name in args.shapes if _name not in shapes]
+    if unknown:
+        arg_parser.error("unknown shapes: " + ', '.join(unknown))
+
+    failed = []
+    for name in args.shapes or shapes:
+        result = check_shape(name, args.scale, args.bound, args.time_bound)
+        print_shape(name, result)
+        if result['failures']:
+            failed.append(name)
+    if failed:
+        print("\n{0} of {1} shapes failed: {2}".format(
+            len(failed), len(args.shapes or shapes), ', '.join(failed)))
+        sys.exit(1)
+    print("\nAll shapes scale linearly")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
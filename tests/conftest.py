@@ -0,0 +1,97 @@
+'''
+Fixtures shared by the tests. The scripts are modules at the top of the
+repository and the functions of Luaparser keep their state in its default
+parser, which is reset around every test.
+'''
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+import Luaparser
+
+
+PROGRAM = '''local function f(a, b)
+  return a + b
+end
+function m.g(x)
+  local t = {x, [1] = "y", z = f(x, 2)}
+  return t
+end
+function o:h(...)
+  if x then
+    y = 1
+  end
+end
+'''
+
+def _reset_parser():
+    for _analysis in list(Luaparser._passes):
+        Luaparser.remove_pass(_analysis)
+    Luaparser.reset()
+    Luaparser.set_budget()
+    Luaparser.set_progress()
+    Luaparser.set_heat_map(False)
+
+@pytest.fixture(autouse=True)
+def parser_state():
+    '''
+    Starts every test with a parser without state, budget, progress
+    callback, heat map or analysis, and leaves it so.
+    '''
+    _reset_parser()
+    yield
+    _reset_parser()
+
+@pytest.fixture
+def parse_lines():
+    '''
+    Returns a function parsing a source given as a string with the
+    backtracking parser, which returns a tuple (<errors>, <functions>,
+    <completed>): the errors as [<line>, <token>, <message>], the declared
+    functions joined into strings and the result of parse_input.
+    '''
+    def _parse(source):
+        Luaparser.reset()
+        Luaparser._line_list.extend(source.splitlines(True))
+        Luaparser.lex()
+        completed = Luaparser.parse_input()
+        return ([_error[:3] for _error in Luaparser.error_list],
+                [''.join(_function) for _function in Luaparser.function_list],
+                completed)
+    return _parse
+
+@pytest.fixture
+def lua_file(tmp_path):
+    '''
+    Returns a function writing a source to a file of the temporary
+    directory and returning its path.
+    '''
+    def _write(source, name='input.lua'):
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(source)
+        return str(path)
+    return _write
+
+@pytest.fixture
+def program():
+    '''
+    Returns a valid program of 12 lines declaring the functions f(a,b),
+    m.g(x) and o:h(...).
+    '''
+    return PROGRAM
+
+@pytest.fixture
+def long_program():
+    '''
+    Returns a function making a valid program of <functions> declarations of
+    three lines.
+    '''
+    def _make(functions=200):
+        return ''.join('function f{0}(a)\n  return a * {0}\nend\n'.format(
+            _i) for _i in range(functions))
+    return _make
@@ -0,0 +1,68 @@
+'''
+Tests of the check of the lua files of zip and tar archives.
+'''
+import io
+import tarfile
+import zipfile
+
+import pytest
+
+import Luaarchive
+
+
+FILES = (('lib/good.lua', b'function f() end\n'),
+         ('lib/bad.lua', b'x = = 1\n'),
+         ('README.txt', b'x = = 1\n'),
+         ('broken.lua', b'x = "\n'))
+
+
+def _zip(path):
+    with zipfile.ZipFile(path, 'w') as archive:
+        for _name, _content in FILES:
+            archive.writestr(_name, _content)
+    return str(path)
+
+def _tar(path, mode='w:gz'):
+    with tarfile.open(path, mode) as archive:
+        for _name, _content in FILES:
+            _info = tarfile.TarInfo(_name)
+            _info.size = len(_content)
+            archive.addfile(_info, io.BytesIO(_content))
+    return str(path)
+
+def test_members(tmp_path):
+    assert list(Luaarchive.members(_zip(tmp_path / 'a.zip'))) == \
+        [_file for _file in FILES if _file[0].endswith('.lua')]
+    assert list(Luaarchive.members(_tar(tmp_path / 'a.tar.xz', 'w:xz'))) == \
+        [_file for _file in FILES if _file[0].endswith('.lua')]
+
+@pytest.mark.parametrize('size', [1, Luaarchive.BATCH_BYTES])
+def test_check(tmp_path, size):
+    paths = [_zip(tmp_path / 'a.zip'), _tar(tmp_path / 'b.tgz')]
+    results = list(Luaarchive.check(paths, 1, size))
+    assert [_name for _name, _result in results] == [
+        '{0}!{1}'.format(_path, _name) for _path in paths
+        for _name in ('lib/good.lua', 'lib/bad.lua', 'broken.lua')]
+    assert [None if _result is None else len(_result.errors)
+            for _name, _result in results] == [0, 1, None] * 2
+
+def test_main(tmp_path, capsys):
+    path = _zip(tmp_path / 'a.zip')
+    with pytest.raises(SystemExit) as exit_info:
+        Luaarchive.main(['-j', '1', path])
+    assert exit_info.value.code == 1
+    assert capsys.readouterr().out.splitlines() == [
+        '{0}!lib/bad.lua:1: Invalid expression list.'.format(path),
+        '{0}!broken.lua: File could not be lexed.'.format(path),
+        '3 files checked, 2 with errors']
+
+def test_not_an_archive(tmp_path, capsys):
+    path = tmp_path / 'a.lua'
+    path.write_bytes(b'x = 1\n')
+    with pytest.raises(Luaarchive.ArchiveError) as error:
+        list(Luaarchive.members(str(path)))
+    assert str(error.value) == "{0}: not a readable zip or tar " \
+        "archive".format(path)
+    with pytest.raises(SystemExit) as exit_info:
+        Luaarchive.main([str(path)])
+    assert exit_info.value.code == 2
@@ -0,0 +1,52 @@
+'''
+Tests of the index of matching brackets and blocks made while lexing.
+'''
+import pytest
+
+import Luaparser
+
+
+def _unbalanced(source):
+    Luaparser._line_list.extend(source.splitlines(True))
+    Luaparser.lex()
+    return [_entry[2] for _entry in Luaparser.unbalanced_list]
+
+@pytest.mark.parametrize('source', [
+    'x = 1 -- end of setup\n',
+    'if x then -- function (\n  y = 1\nend\n',
+    '--[[ end\n) ]] x = 1\n',
+    '--[==[ ]] end\nend ]==] x = {}\n',
+    's = "a -- end"\nt = {}\n',
+    "s = 'do'\n",
+    's = [[ end\n]] x = 1\n',
+])
+def test_index_skips_comments_and_strings(source):
+    assert _unbalanced(source) == []
+
+def test_index_matches_blocks():
+    Luaparser._line_list.extend(['if x then -- end\n', '  f(y)\n', 'end\n'])
+    Luaparser.lex()
+    assert Luaparser.matching_position((1, 0)) == (3, 0)
+    assert Luaparser.matching_position((2, 1)) == (2, 3)
+    assert Luaparser.unbalanced_list == []
+
+def test_index_reports_unclosed():
+    assert _unbalanced('function f(\n') == [
+        "Unclosed 'function' opened at line 1.", "Unclosed '(' opened at "
+        "line 1."]
+
+def test_parse_does_not_repeat_unclosed(parse_lines):
+    # The parser reports the unclosed constructs itself.
+    errors, functions, completed = parse_lines('function f(a)\n  x = (1\n')
+    assert errors == [[3, 0, 'Closing parenthesis expected.'],
+                      [3, 0, "Invalid statement. Keyword 'end' expected."]]
+    assert len(Luaparser.unbalanced_list) == 2
+
+def test_recovery_skips_constructs(parse_lines):
+    # The ';' of the table is not the end of the statement: the recovery
+    # after the missing parenthesis skips the table, and its second part is
+    # not reported as another error.
+    errors, functions, completed = parse_lines('x = (a b {c; d} e)\n'
+                                               'function f() end\n')
+    assert errors == [[1, 4, 'Closing parenthesis expected.']]
+    assert functions == ['f()']
@@ -0,0 +1,27 @@
+'''
+Tests of the work budgets of the parser.
+'''
+import Luaparser
+
+
+def test_budget_stops_the_parse(parse_lines, long_program):
+    Luaparser.set_budget(token_visits=500)
+    errors, functions, completed = parse_lines(long_program())
+    assert not completed
+    assert 'token visits' in Luaparser.budget_exceeded[2]
+    assert 0 < len(functions) < 200
+    assert Luaparser.get_work()[0] <= 501
+
+def test_budget_large_enough(parse_lines, long_program):
+    Luaparser.set_budget(token_visits=10 ** 6, backtracking_steps=10 ** 6,
+                         nesting_depth=100)
+    errors, functions, completed = parse_lines(long_program())
+    assert completed and errors == [] and len(functions) == 200
+    assert Luaparser.budget_exceeded is None
+
+def test_nesting_depth(parse_lines):
+    Luaparser.set_budget(nesting_depth=20)
+    errors, functions, completed = parse_lines('x = ' + '(' * 50 + '1' +
+                                               ')' * 50 + '\n')
+    assert not completed
+    assert 'nested blocks' in Luaparser.budget_exceeded[2]
@@ -0,0 +1,115 @@
+'''
+Tests of the binary cache format, the cache paths and the batches parsed in
+processes.
+'''
+import pytest
+
+import Luacache
+import Luaparser
+
+
+SOURCE = b'''local function f(a, b)
+  return a + b
+end
+function m.g(x) return "\xc3\xa9t\xc3\xa9" end
+x = = 1
+'''
+
+
+def _parse(content):
+    result = Luacache.parse_content(content)
+    return result.errors, [list(_f) for _f in result.functions], \
+        result.function_positions, result.stopped
+
+@pytest.mark.parametrize('tokens', [True, False])
+def test_round_trip(tokens):
+    Luaparser._line_list.extend(SOURCE.decode().splitlines(True))
+    Luaparser.lex()
+    Luaparser.parse_input()
+    result = Luacache.capture()
+    loaded = Luacache.loads(Luacache.dumps(result, tokens))
+    assert loaded.errors == result.errors
+    assert [list(_f) for _f in loaded.functions] == result.functions
+    assert loaded.function_positions == result.function_positions
+    assert loaded.stopped == result.stopped
+    if tokens:
+        assert [loaded.tokens[_line] for _line in range(len(loaded.tokens))] \
+            == Luaparser.token_list
+        assert loaded.tokens.count() == sum(
+            len(_tokens) for _tokens in Luaparser.token_list)
+    else:
+        assert loaded.tokens is None
+
+def test_round_trip_budget_stop():
+    Luaparser.set_budget(token_visits=20)
+    result = Luacache.parse_content(SOURCE * 10)
+    assert result.stopped is not None
+    assert Luacache.loads(Luacache.dumps(result)).stopped[:3] == \
+        result.stopped[:3]
+
+@pytest.mark.parametrize('data', [b'', b'LUAC', b'not a cache file at all'])
+def test_loads_rejects(data):
+    with pytest.raises(ValueError):
+        Luacache.loads(data)
+
+def test_loads_rejects_truncated():
+    data = Luacache.dumps(Luacache.parse_content(SOURCE))
+    with pytest.raises(ValueError):
+        Luacache.loads(data[:len(data) // 2])
+
+def test_cache_path(monkeypatch):
+    path = Luacache.cache_path('cache', SOURCE)
+    assert path == Luacache.cache_path('cache', SOURCE)
+    assert path != Luacache.cache_path('cache', SOURCE + b'\n')
+    Luaparser.set_budget(token_visits=1000)
+    assert path != Luacache.cache_path('cache', SOURCE)
+    Luaparser.set_budget()
+    # A change of the parser source invalidates the cached results.
+    monkeypatch.setattr(Luacache, '_parser_digest', '0' * 40)
+    assert path != Luacache.cache_path('cache', SOURCE)
+
+def test_parser_digest(monkeypatch):
+    digest = Luacache.parser_digest()
+    assert len(digest) == 40
+    # Without the source, as in a frozen build, the code is hashed.
+    def _no_source(module):
+        raise OSError("could not get source code")
+    monkeypatch.setattr(Luacache, '_parser_digest', None)
+    monkeypatch.setattr(Luacache.inspect, 'getsource', _no_source)
+    assert len(Luacache.parser_digest()) == 40
+    assert Luacache.parser_digest() != digest
+
+def test_parse_cached(tmp_path):
+    path = tmp_path / 'input.lua'
+    path.write_bytes(SOURCE)
+    cache = str(tmp_path / 'cache')
+    first = Luacache.parse_cached(str(path), cache)
+    second = Luacache.parse_cached(str(path), cache)
+    assert isinstance(second.tokens, Luacache.TokenTable)
+    assert second.errors == first.errors
+    assert [list(_f) for _f in second.functions] == first.functions
+
+def test_stopped_results_are_not_cached(tmp_path):
+    path = tmp_path / 'input.lua'
+    path.write_bytes(b'function f() end\n' * 100)
+    cache = tmp_path / 'cache'
+    Luaparser.set_budget(token_visits=50)
+    assert Luacache.parse_cached(str(path), str(cache)).stopped is not None
+    assert not cache.exists() or list(cache.iterdir()) == []
+    Luaparser.set_budget()
+    assert Luacache.parse_cached(str(path), str(cache)).stopped is None
+    assert len(list(cache.iterdir())) == 1
+
+@pytest.mark.parametrize('shared', [True, False])
+def test_parse_batch(shared):
+    contents = [SOURCE, b'x = "\n', b'return {1, 2, "a"}\n',
+                b'function f() end\n' * 100]
+    results = Luacache.parse_batch(contents, 2, shared)
+    assert results[1] is None
+    for _content, _data in zip(contents, results):
+        if _data is None:
+            continue
+        _result = Luacache.loads(_data)
+        assert (_result.errors, [list(_f) for _f in _result.functions],
+                _result.function_positions, _result.stopped) == \
+            _parse(_content)
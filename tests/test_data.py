@@ -0,0 +1,20 @@
+'''
+Tests of the fast path for files holding only data.
+'''
+import pytest
+
+import Luaparser
+
+
+@pytest.mark.parametrize('source', [
+    'return {1, 2, {a = "b", [3] = true}}\n',
+    'x = nil\ny = {"a", false}\nreturn "x"\n',
+])
+def test_data_accepted(source):
+    assert Luaparser.check_data(source)
+
+@pytest.mark.parametrize('source', [
+    'x = f(1)\n', 'return {1, 2\n', 'x = {a.b}\n', 'x = 1 y = 2\n',
+])
+def test_data_given_up(source):
+    assert not Luaparser.check_data(source)
@@ -0,0 +1,77 @@
+'''
+Tests comparing the engines with the backtracking parser on generated and
+mutated programs, see Luadiff, and tests of the shrinking of inputs.
+'''
+import random
+
+import pytest
+
+import Luadiff
+import Luaparser
+
+
+# Budget of the generated inputs: some mutated ones make the parser
+# backtrack a lot.
+BUDGET = (200000, 200000, None, None)
+
+
+def _check(lines):
+    Luaparser.set_budget(*BUDGET)
+    differences, seconds = Luadiff.check_input(lines, sorted(Luadiff.engines))
+    return differences or []
+
+@pytest.mark.parametrize('seed', range(20))
+def test_generated(seed):
+    assert _check(Luadiff.generate(random.Random(seed))) == []
+
+# The reference still reads separated tokens such as '. .' or '< =' as one
+# operator, which the table driven parser rejects. The mutations of these
+# seeds do not make such tokens.
+@pytest.mark.parametrize('seed', range(20))
+def test_mutated(seed):
+    rng = random.Random(seed)
+    lines = Luadiff.mutate(rng, Luadiff.generate(rng))
+    if lines is not None:
+        assert _check(lines) == []
+
+def test_generated_comments_are_not_made():
+    # A unary minus followed by a negative operand is written '- -x', as
+    # '--x' would be a comment.
+    for _seed in range(200):
+        for _line in Luadiff.generate(random.Random(_seed)):
+            assert '--' not in _line
+
+def test_compare_contracts():
+    reference = {'errors': [[1, 0, 'Invalid statement.']], 'functions': [],
+                 'stopped': None}
+    valid = {'errors': [], 'functions': ['f()'], 'stopped': None}
+    assert Luadiff.compare(reference, reference, 'exact') == []
+    assert Luadiff.compare(reference, valid, 'exact')
+    assert Luadiff.compare(reference, {'valid': False}, 'verdict') == []
+    assert Luadiff.compare(reference, {'valid': True}, 'verdict')
+    assert Luadiff.compare(valid, {'valid': None}, 'verdict') == []
+    assert Luadiff.compare(valid, {'functions': ['f()']}, 'functions') == []
+
+def test_ddmin():
+    items = list(range(50))
+    tests = [1000]
+    assert Luadiff.ddmin(items, lambda _items: {7, 31} <= set(_items),
+                         tests) == [7, 31]
+    assert tests[0] > 0
+
+def test_shrink(monkeypatch):
+    # An engine finding an error in every input holding a 'while' differs
+    # from the reference on the valid ones; the shrunk input keeps the
+    # difference.
+    def run_rejects_while(lines):
+        result = Luadiff.run_backtracking(lines)
+        if result is not None and 'while' in ''.join(lines):
+            result['errors'].append([1, 0, 'while'])
+        return result
+    monkeypatch.setitem(Luadiff.engines, 'rejects_while',
+                        (run_rejects_while, 'valid'))
+    lines = ['x = 1\n', 'local t = {a = 1, b = f(2)}\n',
+             'while x < 3 do\n', '  x = x + 1\n', 'end\n', 'return t\n']
+    assert Luadiff.check_input(lines, ['rejects_while'])[0]
+    shrunk = Luadiff.shrink(lines, 'rejects_while', 'validity')
+    assert ''.join(shrunk).split() == ['while', 'x', 'do', 'end']
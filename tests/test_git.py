@@ -0,0 +1,94 @@
+'''
+Tests of the check of the lua files changed in a git repository.
+'''
+import os
+import shutil
+import subprocess
+
+import pytest
+
+import Luagit
+
+
+pytestmark = pytest.mark.skipif(shutil.which('git') is None,
+                                reason="git is not installed")
+
+
+def _git(repository, *args):
+    subprocess.run(['git', '-C', repository] + list(args), check=True,
+                   capture_output=True,
+                   env=dict(os.environ, GIT_AUTHOR_NAME='test',
+                            GIT_AUTHOR_EMAIL='test@example.com',
+                            GIT_COMMITTER_NAME='test',
+                            GIT_COMMITTER_EMAIL='test@example.com'))
+
+@pytest.fixture
+def repository(tmp_path):
+    '''
+    Returns a repository on the branch 'feature', whose upstream is the
+    branch 'base', with two committed lua files, one of them with errors, a
+    staged one and an untracked one.
+    '''
+    path = str(tmp_path / 'repository')
+    os.mkdir(path)
+    _git(path, 'init', '-q', '-b', 'base')
+    with open(os.path.join(path, 'old.lua'), 'w') as output_file:
+        output_file.write('x = 1\n')
+    _git(path, 'add', 'old.lua')
+    _git(path, 'commit', '-q', '-m', 'base')
+    _git(path, 'checkout', '-q', '-b', 'feature')
+    _git(path, 'branch', '-q', '--set-upstream-to=base')
+    for _name, _content in (('good.lua', 'function f() end\n'),
+                            ('bad.lua', 'x = = 1\n'),
+                            ('notes.txt', 'x = = 1\n')):
+        with open(os.path.join(path, _name), 'w') as output_file:
+            output_file.write(_content)
+    _git(path, 'add', '.')
+    _git(path, 'commit', '-q', '-m', 'feature')
+    with open(os.path.join(path, 'staged.lua'), 'w') as output_file:
+        output_file.write('local y = 2\n')
+    _git(path, 'add', 'staged.lua')
+    with open(os.path.join(path, 'untracked.lua'), 'w') as output_file:
+        output_file.write('return {1, 2}\n')
+    return path
+
+def test_changed_files(repository):
+    assert [_f[0] for _f in Luagit.changed_files(repository)] == \
+        ['bad.lua', 'good.lua']
+    assert [_f[0] for _f in Luagit.changed_files(repository, 'HEAD~1',
+                                                 True)] == \
+        ['bad.lua', 'good.lua', 'staged.lua']
+    files = Luagit.changed_files(repository, untracked=True)
+    assert [_f[0] for _f in files] == ['bad.lua', 'good.lua', 'untracked.lua']
+    assert [_f[2] for _f in files] == [False, False, True]
+
+def test_main(repository, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        Luagit.main(['-C', repository, '-j', '1', '--untracked'])
+    assert exit_info.value.code == 1
+    output = capsys.readouterr().out
+    assert 'bad.lua' in output and 'good.lua' not in output
+    assert output.endswith("3 files checked, 0 from the cache, 1 with "
+                           "errors\n")
+
+    # The cache is in the git directory, where git status does not see it.
+    cache = os.path.join(repository, '.git', 'luacache')
+    assert os.path.realpath(Luagit.cache_directory(repository)) == \
+        os.path.realpath(cache)
+    assert len(os.listdir(cache)) == 3
+    status = subprocess.run(['git', '-C', repository, 'status',
+                             '--porcelain'], capture_output=True, text=True,
+                            check=True).stdout
+    assert 'luacache' not in status
+
+    with pytest.raises(SystemExit):
+        Luagit.main(['-C', repository, '-j', '1', '--untracked'])
+    assert capsys.readouterr().out.endswith(
+        "3 files checked, 3 from the cache, 1 with errors\n")
+
+def test_no_upstream(repository, capsys):
+    _git(repository, 'checkout', '-q', 'base')
+    with pytest.raises(SystemExit) as exit_info:
+        Luagit.main(['-C', repository])
+    assert exit_info.value.code == 2
+    assert "origin/main" in capsys.readouterr().out
@@ -0,0 +1,16 @@
+'''
+Tests of the heat map of the token visits.
+'''
+import Luaparser
+
+
+def test_heat_map(parse_lines, program):
+    Luaparser.set_heat_map()
+    parse_lines(program)
+    summary = Luaparser.heat_summary()
+    assert summary['tokens'] == sum(
+        1 for _tokens in Luaparser.token_list[1:-1] for _token in _tokens
+        if _token)
+    assert summary['visits'] >= summary['tokens']
+    assert summary['amplification'] >= 1
+    assert [_line['line'] for _line in summary['lines']] == list(range(1, 13))
@@ -0,0 +1,58 @@
+'''
+Tests of the SQLite index of the declared functions.
+'''
+import os
+
+import pytest
+
+import Luaindex
+
+
+def test_index_and_find(tmp_path):
+    (tmp_path / 'src').mkdir()
+    (tmp_path / 'src' / 'a.lua').write_text(
+        'function m.f(x, y) end\nlocal function g() end\n')
+    (tmp_path / 'src' / 'b.lua').write_text('function m.f2() end\n')
+    connection = Luaindex.connect(str(tmp_path / 'index.db'))
+    root = str(tmp_path / 'src')
+    assert Luaindex.index(connection, [root], 1) == (2, 0, 0)
+    assert Luaindex.index(connection, [root], 1) == (0, 2, 0)
+    path = os.path.join(root, 'a.lua')
+    assert Luaindex.find(connection, 'm.f') == [('m.f', 'x, y', path, 1,
+                                                  False)]
+    assert Luaindex.find(connection, 'g') == [('g', '', path, 2, True)]
+    assert [_row[0] for _row in Luaindex.find(connection, 'm.', True)] == \
+        ['m.f', 'm.f2']
+    os.remove(os.path.join(root, 'b.lua'))
+    assert Luaindex.index(connection, [root], 1) == (0, 1, 1)
+    assert Luaindex.find(connection, 'm.f2') == []
+    connection.close()
+
+def test_index_errors_and_missing_files(tmp_path):
+    (tmp_path / 'a.lua').write_text('function f() end\nx = = 1\n')
+    (tmp_path / 'b.lua').write_text('x = "\n')
+    (tmp_path / 'c.lua').write_text('return {1, 2}\n')
+    connection = Luaindex.connect(str(tmp_path / 'index.db'))
+    paths = [str(tmp_path / _name) for _name in ('a.lua', 'b.lua', 'c.lua',
+                                                 'missing.lua')]
+    assert Luaindex.index(connection, paths, 1) == (3, 0, 0)
+    assert dict(connection.execute('SELECT path, errors FROM files')) == {
+        paths[0]: 1, paths[1]: None, paths[2]: 0}
+    connection.close()
+
+@pytest.mark.parametrize('before', [True, False])
+def test_database_option(tmp_path, capsys, monkeypatch, before):
+    # --db is accepted before and after the command.
+    monkeypatch.chdir(tmp_path)
+    path = tmp_path / 'a.lua'
+    path.write_text('function f() end\n')
+    database = str(tmp_path / 'other.db')
+    option = ['--db', database]
+    Luaindex.main(option + ['index', '-j', '1', str(path)] if before else
+                  ['index', '-j', '1', str(path)] + option)
+    assert capsys.readouterr().out == "1 files parsed, 0 unchanged, " \
+        "0 removed\n"
+    Luaindex.main(['find', 'f'] + option)
+    assert capsys.readouterr().out == "{0}:1: f()\n".format(path)
+    assert os.path.exists(database)
+    assert not os.path.exists('luaindex.db')
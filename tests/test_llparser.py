@@ -0,0 +1,58 @@
+'''
+Tests of the table driven parser generated from lua51.grammar.
+'''
+import os
+
+import pytest
+
+import Luagrammar
+import Luallparser
+import Luaparser
+
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _parse(source):
+    lines = source.splitlines(True)
+    Luaparser._line_list.extend(lines)
+    Luaparser.lex()
+    errors, functions = Luallparser.parse_tokens(Luaparser.token_list, lines)
+    return errors, [''.join(_function) for _function in functions]
+
+def test_generated_parser_is_up_to_date(tmp_path):
+    output = str(tmp_path / 'Luallparser.py')
+    Luagrammar.generate(os.path.join(HERE, 'lua51.grammar'), output)
+    with open(output) as generated, \
+            open(os.path.join(HERE, 'Luallparser.py')) as committed:
+        assert generated.read() == committed.read()
+
+def test_valid_program():
+    assert _parse('local function f(a, ...)\n  return a .. "x", ...\nend\n'
+                  'function m.n:o(b) if b <= 1 then return end end\n'
+                  'x = a == b and c ~= d or e >= f\n') == (
+        [], ['f(a,...)', 'm.n:o(b)'])
+
+@pytest.mark.parametrize('source', [
+    'local x = = 3\n',
+    'x = a < = b\n',
+    'x = a . . b\n',
+    'x = a ~ = b\n',
+    'f(51 51)\n',
+    'local\n',
+])
+def test_invalid_program(source):
+    errors, functions = _parse(source)
+    assert len(errors) == 1
+
+def test_classify_merges_touching_tokens():
+    lines = ['x = a..b .. c . . d\n']
+    Luaparser._line_list.extend(lines)
+    Luaparser.lex()
+    kinds, texts, positions = Luallparser.classify(Luaparser.token_list,
+                                                   lines)
+    assert texts == ['x', '=', 'a', '..', 'b', '..', 'c', '.', '.', 'd',
+                     '___eof___']
+    # Without the source lines, the columns are not known.
+    kinds, texts, positions = Luallparser.classify(Luaparser.token_list)
+    assert texts.count('..') == 3
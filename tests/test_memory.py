@@ -0,0 +1,47 @@
+'''
+Tests of the per phase memory profile of a parse.
+'''
+import contextlib
+import io
+import os
+import subprocess
+import sys
+
+import pytest
+
+import Luaparser
+
+
+SOURCE = 'local x = 1\nfunction f(a) return a + x end\n'
+
+
+@pytest.mark.parametrize('fast_path, phases', [
+    (False, ['read', 'lex', 'parse', 'report']),
+    (True, ['read', 'check', 'lex', 'parse', 'report']),
+])
+def test_profile_memory_phases(lua_file, fast_path, phases):
+    path = lua_file(SOURCE)
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        profile = Luaparser.profile_memory(path, fast_path)
+    assert 'f(a)' in output.getvalue()
+    assert [_phase['phase'] for _phase in profile['phases']] == phases
+    assert (profile['source_bytes'], profile['lines'], profile['tokens'],
+            profile['errors'], profile['functions']) == (43, 2, 16, 0, 1)
+    assert profile['peak'] == max(_phase['peak']
+                                  for _phase in profile['phases'])
+
+def test_profile_memory_lex_phase(lua_file):
+    # The first pre-scan with NumPy allocates about a megabyte which must
+    # not be charged to the lex phase. A new interpreter is needed for the
+    # first pre-scan.
+    path = lua_file(SOURCE)
+    script = ('import contextlib, io, Luaparser\n'
+              'with contextlib.redirect_stdout(io.StringIO()):\n'
+              '    profile = Luaparser.profile_memory({0!r})\n'
+              'print([_phase["retained"] for _phase in profile["phases"]\n'
+              '       if _phase["phase"] == "lex"][0])\n').format(path)
+    output = subprocess.run(
+        [sys.executable, '-c', script], capture_output=True, text=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        check=True).stdout
+    assert int(output) < 64 * 1024
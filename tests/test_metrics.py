@@ -0,0 +1,63 @@
+'''
+Tests of the metrics of the checked files in the Prometheus text format.
+'''
+import Luametrics
+import Luaparser
+
+
+def _values(text):
+    return dict(_line.rsplit(' ', 1) for _line in text.splitlines()
+                if not _line.startswith('#'))
+
+def test_check_files(tmp_path):
+    (tmp_path / 'code.lua').write_text('function f(a) return a end\n'
+                                       'x = = 1\ny = = 2\n')
+    (tmp_path / 'data.lua').write_text('return {1, 2, {a = "b"}}\n')
+    (tmp_path / 'broken.lua').write_text('x = "\n')
+    metrics = Luametrics.Metrics()
+    cache = str(tmp_path / 'cache')
+    Luametrics.check_files([str(tmp_path)], metrics, cache)
+    values = _values(metrics.exposition())
+    assert values['lua_files_parsed_total'] == '2'
+    assert values['lua_files_failed_total'] == '1'
+    assert values['lua_files_with_errors_total'] == '1'
+    # The data file is not lexed: only the 16 tokens of the code file and
+    # its start and end symbols are counted.
+    assert values['lua_fast_path_files_total'] == '1'
+    assert values['lua_tokens_total'] == '18'
+    assert values['lua_errors_total{message="Invalid expression list."}'] \
+        == '2'
+    assert values['lua_cache_misses_total'] == '2'
+    assert values['lua_cache_hit_ratio'] == '0.0'
+
+    Luametrics.check_files([str(tmp_path)], metrics, cache)
+    values = _values(metrics.exposition())
+    assert values['lua_cache_hits_total'] == '2'
+    assert values['lua_tokens_total'] == '36'
+    assert values['lua_fast_path_files_total'] == '2'
+    assert values['lua_cache_hit_ratio'] == '1.0'
+
+def test_stopped_parses_are_not_cached(tmp_path):
+    (tmp_path / 'code.lua').write_text('function f() end\n' * 100)
+    metrics = Luametrics.Metrics()
+    cache = str(tmp_path / 'cache')
+    Luaparser.set_budget(token_visits=50)
+    for _run in range(2):
+        Luametrics.check_files([str(tmp_path)], metrics, cache)
+    values = _values(metrics.exposition())
+    assert values['lua_cache_misses_total'] == '2'
+    assert values.get('lua_cache_hits_total', '0') == '0'
+
+def test_every_metric_has_help():
+    metrics = Luametrics.Metrics()
+    Luametrics.check_files([], metrics, None)
+    lines = metrics.exposition().splitlines()
+    types = [_line.split()[2] for _line in lines
+             if _line.startswith('# TYPE')]
+    helps = [_line.split()[2] for _line in lines
+             if _line.startswith('# HELP')]
+    assert types == helps
+    assert 'lua_last_run_timestamp_seconds' in types
+
+def test_escape():
+    assert Luametrics.escape('a "b"\\\n') == 'a \\"b\\"\\\\\\n'
@@ -0,0 +1,82 @@
+'''
+Tests of the minifier: the output must have the tokens and the meaning of
+its source.
+'''
+import random
+
+import pytest
+
+import Luadiff
+import Luaminify
+
+
+SOURCE = '''-- Counter module
+local counter = {}
+local function increment(value, step) -- step is optional
+  local result = value + (step or 1)
+  return result
+end
+function counter.next(value)
+  local s = [[ a
+long string ]]
+  return increment(value), s, - -value
+end
+--[[ a long
+comment ]]
+return counter
+'''
+
+
+def _minify(lines, rename):
+    renames = references = None
+    if rename:
+        renames, references = Luaminify.plan_renames(
+            [_t for _t in Luaminify.tokenize(lines) if _t[1] != 'comment'])
+    output = ''.join(Luaminify.minify(lines, renames))
+    return output, renames, references
+
+def _parses(lines):
+    return Luaminify.plan_renames(
+        [_t for _t in Luaminify.tokenize(lines) if _t[1] != 'comment']) \
+        is not None
+
+@pytest.mark.parametrize('rename', [False, True])
+def test_round_trip(rename):
+    lines = SOURCE.splitlines(True)
+    output, renames, references = _minify(lines, rename)
+    assert len(output) < len(SOURCE)
+    assert '--' not in output.replace('- -', '')
+    assert Luaminify.verify(lines, output.splitlines(True), renames,
+                            references) == []
+
+def test_renames_locals_only():
+    lines = SOURCE.splitlines(True)
+    output, renames, references = _minify(lines, True)
+    assert 'increment' not in output
+    assert 'counter.next' not in output and '.next' in output
+
+@pytest.mark.parametrize('seed', range(10))
+def test_round_trip_generated(seed):
+    lines = Luadiff.generate(random.Random(seed))
+    for rename in (False, True):
+        output, renames, references = _minify(lines, rename and
+                                              _parses(lines))
+        assert Luaminify.verify(lines, output.splitlines(True), renames,
+                                references) == []
+
+def test_verify_reports_changes():
+    lines = SOURCE.splitlines(True)
+    output, renames, references = _minify(lines, False)
+    assert Luaminify.verify(lines, output.replace('+', '-').splitlines(True))
+
+def test_main_prints_only_verified_output(lua_file, capsys, monkeypatch):
+    path = lua_file(SOURCE)
+    Luaminify.main([path, '--rename'])
+    output = capsys.readouterr().out
+    assert _minify(SOURCE.splitlines(True), True)[0] == output
+    monkeypatch.setattr(Luaminify, 'verify', lambda *_args: ['Changed.'])
+    with pytest.raises(SystemExit):
+        Luaminify.main([path])
+    captured = capsys.readouterr()
+    assert captured.out == ''
+    assert 'Changed.' in captured.err
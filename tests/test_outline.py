@@ -0,0 +1,18 @@
+'''
+Tests of the outline listing the declared functions without parsing.
+'''
+import Luaparser
+
+
+def test_outline_equals_functions(parse_lines, program):
+    errors, functions, completed = parse_lines(program)
+    assert sorted(''.join(_entry[0]) for _entry in Luaparser.outline(
+        program.splitlines(True))) == sorted(functions)
+
+def test_outline_nesting():
+    entries = Luaparser.outline(['function a.b(x)\n',
+                                 '  local function c() end\n',
+                                 '  return function() end\n',
+                                 'end\n'])
+    assert [(''.join(_e[0]),) + tuple(_e[1:]) for _e in entries] == [
+        ('a.b(x)', 1, 4, False, None), ('c()', 2, 2, True, 0)]
@@ -0,0 +1,38 @@
+'''
+Tests of the parallel parse of a file split at top level statements.
+'''
+import Luaparser
+
+
+def test_parse_lines_parallel(parse_lines, program, long_program):
+    source = long_program(20) + 'x = = 1\n' + program
+    errors, functions, completed = parse_lines(source)
+    Luaparser.reset()
+    result = Luaparser.parse_lines_parallel(source.splitlines(True), 2)
+    assert [_error[:3] for _error in result[0]] == errors
+    assert [''.join(_f) for _f in result[1]] == functions
+    assert result[2] is None
+
+def test_find_boundaries_skip_comments(monkeypatch):
+    monkeypatch.setattr(Luaparser, '_PART_MIN_LINES', 1)
+    lines = ['x = 1 -- end\n', 'y = 2\n', '--[[ a\n', 'z = 3 ]] w = 4\n',
+             's = "end ("\n', 'if a then\n', 'b = 1\n', 'end\n', 'c = 1\n']
+    # An 'end' in a comment or a string does not close a block, and no part
+    # starts inside a long comment.
+    assert Luaparser.find_boundaries(lines, len(lines)) == [0, 1, 4, 5, 8]
+
+def test_parallel_budget_is_shared(parse_lines):
+    source = 'x = f(1)\n' * 8000
+    parse_lines(source)
+    visits, steps = Luaparser.get_work()[:2]
+    lines = source.splitlines(True)
+    assert len(Luaparser.find_boundaries(lines, 8)) > 2
+    Luaparser.set_budget(visits * 2, steps * 2, None, 60.0)
+    assert Luaparser.parse_lines_parallel(lines, 2)[2] is None
+    # Each part gets its share of the budget, so the parallel parse stops
+    # where the sequential one does.
+    Luaparser.set_budget(visits // 2)
+    stopped = Luaparser.parse_lines_parallel(lines, 2)[2]
+    assert 'token visits' in stopped[2]
+    assert Luaparser._share_budget((1000, 10, 5, 2.0), 3, 10) == \
+        (300, 3, 5, 2.0)
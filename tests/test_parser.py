@@ -0,0 +1,55 @@
+'''
+Tests of the errors and functions reported by the backtracking parser.
+'''
+import pytest
+
+import Luaparser
+
+
+def test_valid_program(parse_lines, program):
+    assert parse_lines(program) == ([], ['f(a,b)', 'm.g(x)', 'o:h(...)'],
+                                    True)
+
+@pytest.mark.parametrize('source', [
+    'a.b[c]:d(e)"s"{f}\n', 'f():g().h = 1\n', 'x = (a).b:c(1)[2]\n',
+    'x = a.b.c\n',
+])
+def test_suffix_chains(parse_lines, source):
+    assert parse_lines(source) == ([], [], True)
+
+@pytest.mark.parametrize('source, error', [
+    ('x = = 1\n', [1, 1, 'Invalid expression list.']),
+    ('f() = 1\n', [1, 3, 'Invalid statement.']),
+    ('a:b = 1\n', [1, 0, 'Invalid statement.']),
+    ('a.b:c() = 1\n', [1, 7, 'Invalid statement.']),
+    ('(f)\n', [1, 0, 'Invalid statement.']),
+    ('a.b\n', [1, 0, 'Invalid statement.']),
+])
+def test_errors(parse_lines, source, error):
+    errors, functions, completed = parse_lines(source)
+    assert errors == [error]
+    assert completed
+
+def test_functions_of_backtracked_parses_retracted(parse_lines):
+    # The declaration on line 2 is parsed once inside the open call, then
+    # again when the parser backtracks out of it: it is listed once.
+    errors, functions, completed = parse_lines('( function ( )\n'
+                                               'function x (\n')
+    assert len(functions) == 1
+    assert Luaparser.function_position_list == [[2, 0, False]]
+    errors, functions, completed = parse_lines('f(function() end\n'
+                                               'function g(a) end\n'
+                                               'local function h() end\n')
+    assert functions == ['g(a)', 'h()']
+    assert Luaparser.function_position_list == [[2, 0, False],
+                                                [3, 1, True]]
+
+@pytest.mark.parametrize('options', [
+    ['--stream', '-j', '2'], ['--quick', '--outline'], ['--memory', '--heat'],
+    ['-j', '2', '--heat-map', 'heat.json'], ['--quick', '--progress'],
+])
+def test_modes_are_exclusive(lua_file, capsys, options):
+    with pytest.raises(SystemExit) as exit_info:
+        Luaparser.main(options + [lua_file('x = 1\n')])
+    assert exit_info.value.code == 2
+    assert 'not allowed with argument' in capsys.readouterr().err
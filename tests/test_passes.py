@@ -0,0 +1,54 @@
+'''
+Tests of the analysis passes fed by the events of the parse.
+'''
+import Luaparser
+
+
+class Recorder(object):
+    '''
+    Analysis recording the events it handles.
+    '''
+    def __init__(self):
+        self.events = []
+
+    def start(self):
+        self.events.append('start')
+
+    def statement(self, position, keyword):
+        self.events.append(('statement', position, keyword))
+
+    def function(self, position, tokens, local):
+        self.events.append(('function', position, ''.join(tokens), local))
+
+    def variable(self, position, name, write):
+        self.events.append(('variable', position, name, write))
+
+    def finish(self):
+        self.events.append('finish')
+
+
+def test_events_in_order():
+    # 'x.y.z = w' is first tried as a function call: the events of the
+    # failed attempt are retracted.
+    analysis = Recorder()
+    Luaparser.add_pass(analysis)
+    Luaparser._line_list.extend(['x.y.z = w\n',
+                                 'local function f(a) return a end\n'])
+    Luaparser.lex()
+    assert Luaparser.parse_input()
+    assert analysis.events == [
+        'start',
+        ('variable', (1, 0), 'x', False), ('variable', (1, 6), 'w', False),
+        ('statement', (1, 0), 'x'),
+        ('variable', (2, 7), 'a', False), ('statement', (2, 6), 'return'),
+        ('function', (2, 1), 'f(a)', True), ('statement', (2, 0), 'local'),
+        'finish']
+
+def test_removed_pass_gets_no_events():
+    analysis = Recorder()
+    Luaparser.add_pass(analysis)
+    Luaparser.remove_pass(analysis)
+    Luaparser._line_list.append('f(x)\n')
+    Luaparser.lex()
+    Luaparser.parse_input()
+    assert analysis.events == []
@@ -0,0 +1,22 @@
+'''
+Tests of the pre-scan lexing the lines without quotes.
+'''
+import pytest
+
+import Luaparser
+
+
+SCAN_LINES = ['local s = "a b", \'c\'\n', 'x = a.b:c(1, 2) + 0x1F\n', '\n',
+              '  t[#t+1] = {"x y"; z = 3.5e2}\n', 'if a ~= b then end\n']
+
+
+@pytest.mark.parametrize('vectorized', [False, True])
+def test_prescan_equals_lex_line(vectorized):
+    lines = SCAN_LINES * 50
+    assert Luaparser.prescan(lines, vectorized) == [
+        Luaparser.lex_line(_line) for _line in lines]
+
+def test_prescan_numpy_path():
+    pytest.importorskip('numpy')
+    lines = SCAN_LINES * 50
+    assert Luaparser.prescan(lines, True) == Luaparser.prescan(lines, False)
@@ -0,0 +1,21 @@
+'''
+Tests of the progress callback and the cancellation of a parse.
+'''
+import threading
+
+import Luaparser
+
+
+def test_progress(parse_lines, long_program):
+    fractions = []
+    Luaparser.set_progress(fractions.append, 0.1)
+    parse_lines(long_program())
+    assert fractions == sorted(fractions) and fractions[-1] == 1.0
+
+def test_cancel(parse_lines, long_program):
+    cancel = threading.Event()
+    cancel.set()
+    Luaparser.set_progress(cancel=cancel)
+    errors, functions, completed = parse_lines(long_program())
+    assert not completed and len(functions) < 200
+    assert Luaparser.budget_exceeded[2] == Luaparser.CANCELLED
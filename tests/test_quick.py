@@ -0,0 +1,67 @@
+'''
+Tests of the quick screen run before the parser.
+'''
+import pytest
+
+import Luaparser
+
+
+def _quick(source):
+    Luaparser._line_list.extend(source.splitlines(True))
+    verdict, notes = Luaparser.quick_check()
+    return verdict, [_note[2] for _note in notes], \
+        [_error[2] for _error in Luaparser.error_list]
+
+@pytest.mark.parametrize('source', [
+    'local function f(a)\n  return a + 1\nend\n',
+    'for i = 1, 10 do\n  if i > 5 then break end\nend\n',
+    't = {a = {1, 2}, ["b"] = "c"}\n',
+    's = "-- not a comment"\n',
+])
+def test_pass(source):
+    assert _quick(source) == ('pass', [], [])
+
+@pytest.mark.parametrize('source', [
+    'x = 1 -- comment (\n',
+    'if x then -- end\nend\n',
+    '--[[ long\n end ]] x = 1\n',
+    'return 1 -- x = 2\n',
+    'return 1\n--[[ x = 2 ]]\n',
+    'return -- comment\n  1\n',
+    'x = 1 -- 1.5\n',
+])
+def test_comments_are_skipped(source):
+    assert _quick(source) == ('pass', [], [])
+
+@pytest.mark.parametrize('source, error', [
+    ('function f()\n', "Unclosed 'function' opened at line 1."),
+    ('x = (1\n', "Unclosed '(' opened at line 1."),
+    ('x = 1)\n', "Unexpected ')'"),
+    ('s = "abc\n', "Unterminated string."),
+    ('x = [[ abc\n', "Unterminated long string."),
+    ('return 1\nx = 2\n', "Statement after 'return'"),
+    ('return 1 --[[ a ]] x = 2\n', "Statement after 'return'"),
+    ('--[[ a\n', "Unterminated long comment."),
+])
+def test_fail(source, error):
+    verdict, notes, errors = _quick(source)
+    assert verdict == 'fail'
+    assert error in errors[0]
+
+@pytest.mark.parametrize('source, note', [
+    ('x = [[ a\nb ]]\n', 'Long string.'),
+    ('x = 1.5\n', 'Decimal number.'),
+])
+def test_full(source, note):
+    assert _quick(source) == ('full', [note], [])
+
+def test_long_string_position():
+    Luaparser._line_list.append('--[==[ ]] ]==] --[[ ( ]] y = [[ s ]]\n')
+    assert Luaparser.quick_check() == ('full', [[1, 21, 'Long string.']])
+
+def test_parse_after_screen():
+    Luaparser._line_list.extend(['function f(a)\n', '  return a\n', 'end\n'])
+    assert Luaparser.quick_check()[0] == 'pass'
+    assert Luaparser.parse_input()
+    assert Luaparser.error_list == []
+    assert [''.join(_f) for _f in Luaparser.function_list] == ['f(a)']
@@ -0,0 +1,31 @@
+'''
+Tests of the scope analysis reporting global variables.
+'''
+import pytest
+
+import Luaparser
+import Luascope
+
+
+def _scope(source):
+    analysis = Luascope.ScopeAnalysis()
+    Luaparser.add_pass(analysis)
+    Luaparser._line_list.extend(source.splitlines(True))
+    Luaparser.lex()
+    Luaparser.parse_input()
+    return ([_name for _position, _name in analysis.global_reads],
+            [_name for _position, _name in analysis.global_writes])
+
+@pytest.mark.parametrize('source, reads, writes', [
+    # The parser tries these statements as function calls before it
+    # backtracks to an assignment: the events of the failed attempt are
+    # retracted, so every name is reported once.
+    ('x.y.z = w\n', ['x', 'w'], []),
+    ('a, b.c = f(d)(e), g\n', ['b', 'f', 'd', 'e', 'g'], ['a']),
+    ('local t = {}\nt[k], u = v, t\n', ['k', 'v'], ['u']),
+    ('f(a).b = c\nf(a)\n', ['f', 'a', 'c', 'f', 'a'], []),
+    ('local function h(p) return p + q end\n', ['q'], []),
+    ('for i = 1, n do local v = i end\nreturn v, i\n', ['n', 'v', 'i'], []),
+])
+def test_globals(source, reads, writes):
+    assert _scope(source) == (reads, writes)
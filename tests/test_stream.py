@@ -0,0 +1,21 @@
+'''
+Tests of the streaming parse, which lexes the tokens lazily.
+'''
+import Luaparser
+
+
+def test_stream_equals_parse(parse_lines, lua_file, program, long_program):
+    source = program + 'x = = 1\n' + long_program(5)
+    errors, functions, completed = parse_lines(source)
+    Luaparser.reset()
+    items = list(Luaparser.parse_stream(lua_file(source)))
+    assert [_item[:3] for _kind, _item in items if _kind == 'error'] == errors
+    assert [''.join(_item) for _kind, _item in items
+            if _kind == 'function'] == functions
+
+def test_stream_closed_early_resets(lua_file, long_program):
+    items = Luaparser.parse_stream(lua_file(long_program(20)))
+    assert next(items)[0] == 'function'
+    items.close()
+    assert Luaparser.token_list == [] and Luaparser.function_list == []
+    assert not isinstance(Luaparser.token_list, Luaparser._TokenStream)
@@ -0,0 +1,21 @@
+'''
+Tests of the growth of the work of the parser with the size of its input,
+see Luastress. The parse time is not checked, as it is not stable enough on
+a shared machine; the work counters are.
+'''
+import pytest
+
+import Luastress
+
+
+@pytest.mark.parametrize('name', sorted(Luastress.shapes))
+def test_shape_is_linear(name):
+    result = Luastress.check_shape(name, time_bound=float('inf'), repeat=1)
+    assert result['failures'] == []
+    assert result['stopped'] is None
+
+def test_exponent():
+    assert Luastress.exponent([10, 20, 40], [5, 10, 20]) == \
+        pytest.approx(1.0)
+    assert Luastress.exponent([10, 20, 40], [100, 400, 1600]) == \
+        pytest.approx(2.0)
@@ -0,0 +1,69 @@
+'''
+Tests of the parses run in threads with parse_isolated and parse_many.
+'''
+import os
+import subprocess
+import sys
+import zipfile
+
+import pytest
+
+import Luaparser
+
+
+def test_parse_isolated_and_many(parse_lines, program, long_program):
+    sources = [program.splitlines(True), ['x = = 1\n'],
+               long_program(10).splitlines(True)]
+    expected = []
+    for _lines in sources:
+        errors, functions, completed = parse_lines(''.join(_lines))
+        expected.append((errors, functions))
+    Luaparser.reset()
+    for threads in (1, 3):
+        results = Luaparser.parse_many(sources, threads)
+        assert [([_error[:3] for _error in _result[0]],
+                 [''.join(_f) for _f in _result[1]])
+                for _result in results] == expected
+    with pytest.raises(ValueError):
+        Luaparser.parse_isolated(['x = "\n'])
+
+def test_parsers_are_independent(program):
+    first = Luaparser.Parser()
+    second = Luaparser.Parser()
+    first._line_list.append('x = = 1\n')
+    first.lex()
+    second._line_list.extend(program.splitlines(True))
+    second.lex()
+    second.set_budget(token_visits=5)
+    assert first.parse_input()
+    assert not second.parse_input()
+    assert [_error[:3] for _error in first.error_list] == [
+        [1, 1, 'Invalid expression list.']]
+    assert first.budget_exceeded is None
+    assert second.budget_exceeded[2] == \
+        'Parse stopped. More than 5 token visits.'
+    assert Luaparser.error_list == []
+    assert Luaparser.get_budget() == (None, None, None, None)
+
+def test_parse_isolated_stops_on_budget(program):
+    # The thread parsers raise and catch the BudgetExceeded of this module.
+    Luaparser.set_budget(token_visits=5)
+    errors, functions, stopped = Luaparser.parse_isolated(
+        program.splitlines(True))
+    assert stopped[2] == 'Parse stopped. More than 5 token visits.'
+    assert isinstance(Luaparser._acquire_parser(), Luaparser.Parser)
+
+def test_parse_many_from_zipapp(tmp_path):
+    # The thread parsers are instances of Parser and need nothing from the
+    # loader, so they also work when the module is imported from a zip file.
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    archive = tmp_path / 'app.pyz'
+    with zipfile.ZipFile(archive, 'w') as output_file:
+        output_file.write(os.path.join(root, 'Luaparser.py'), 'Luaparser.py')
+        output_file.writestr('__main__.py', (
+            'import Luaparser\n'
+            'print(Luaparser.parse_many([["x = = 1\\n"], ["f()\\n"]], 2))\n'))
+    output = subprocess.run([sys.executable, str(archive)],
+                            capture_output=True, text=True, check=True).stdout
+    assert output == "[([[1, 1, 'Invalid expression list.', ['x', '=', " \
+        "'=', '1']]], [], None), ([], [], None)]\n"